@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Times the python stages of propinquity on synthetic inputs.
+
+Generates an OTT directory, NexSON studies, collections and the outputs of the
+later synthesis steps (see synthetic.py), then reports the time, throughput
+and peak python heap of:
+    ott_index - building the OTT index (write_ott_index)
+    prune - NexsonTreeWrapper (and the other tree engines) prune_tree_for_supertree
+    clean - clean_phylo_input
+    collections - concatenate_collections
+    subprob_summary - generate_subprob_size_summary
+    docgen - the DocGen readers
+    assess - run_assessments
+With --save, the results are written as JSON; with --baseline, the run exits
+with status 1 if a stage is more than --max-slowdown times slower than in
+the baseline.
+"""
+import argparse
+import copy
+import gc
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from propinquity import (clean_phylo_input,
+                         concatenate_collections,
+                         DocGen,
+                         EmptyTreeError,
+                         Extensible,
+                         generate_subprob_size_summary,
+                         open_ott_index,
+                         read_as_json,
+                         run_assessments,
+                         TREE_ENGINES,
+                         write_ott_index)
+from synthetic import (synthetic_collections,
+                       write_synthetic_ott_dir,
+                       write_synthetic_studies,
+                       write_synthetic_synth_outputs)
+
+STAGES = ('ott_index', 'prune', 'clean', 'collections', 'subprob_summary', 'docgen', 'assess')
+CLEANING_FLAGS = 'barren,extinct,incertae_sedis,major_rank_conflict'
+
+
+class QuietLog(object):
+    """Stands in for the PropinquityConfig logging methods (and settings) used by the stages."""
+    tree_engine = 'nexson'
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+
+    def debug(self, msg):
+        pass
+
+    info = warn = warning = error = debug
+
+
+class Fixture(object):
+    def __init__(self, args):
+        self.args = args
+        self.dir = args.workdir or tempfile.mkdtemp(prefix='propinquity-bench-')
+        self.ott_dir = os.path.join(self.dir, 'ott')
+        self.log = QuietLog(self.dir)
+        sys.stderr.write('writing synthetic inputs to {}\n'.format(self.dir))
+        self.root_id, self.leaves = write_synthetic_ott_dir(self.ott_dir, args.num_taxa, seed=args.seed)
+        self.tags = write_synthetic_studies(self.dir, self.leaves, args.num_studies, args.tree_size,
+                                            seed=args.seed)
+        self.sub_ids = write_synthetic_synth_outputs(self.dir, self.tags, args.num_subproblems,
+                                                     seed=args.seed)
+        self.collections = synthetic_collections(args.num_collections, args.num_studies, seed=args.seed)
+        self._blobs = None
+
+    @property
+    def blobs(self):
+        if self._blobs is None:
+            snap = os.path.join(self.dir, 'phylo_snapshot')
+            self._blobs = [(read_as_json(os.path.join(snap, 'tree_{}.json'.format(t))), t.split('@')[1])
+                           for t in self.tags]
+        return self._blobs
+
+    def close(self):
+        if not self.args.workdir and not self.args.keep:
+            shutil.rmtree(self.dir)
+
+
+def stage_ott_index(fix):
+    return lambda: write_ott_index(fix.ott_dir), fix.args.num_taxa, 'taxa'
+
+
+def _stage_prune(fix, engine):
+    ott = open_ott_index(fix.ott_dir)
+    fsi = ott.convert_flag_string_set_to_union(CLEANING_FLAGS.split(','))
+    tree_class = TREE_ENGINES[engine]
+    blobs = fix.blobs
+
+    def run():
+        wrappers = [tree_class(copy.deepcopy(b), tree_id, log_obj={}) for b, tree_id in blobs]
+        start = time.perf_counter()
+        for ntw in wrappers:
+            try:
+                ntw.prune_tree_for_supertree(ott=ott, to_prune_fsi_set=fsi, root_ott_id=fix.root_id)
+            except EmptyTreeError:
+                pass
+        return time.perf_counter() - start
+    return run, len(blobs) * fix.args.tree_size, 'leaves'
+
+
+def stage_clean(fix):
+    out_dir = os.path.join(fix.dir, 'cleaned_phylo')
+    trees = ['phylo_snapshot/tree_{}.json'.format(t) for t in fix.tags]
+
+    def run():
+        if os.path.isdir(out_dir):
+            shutil.rmtree(out_dir)
+        os.makedirs(out_dir)
+        clean_phylo_input(ott_dir=fix.ott_dir,
+                          study_tree_pairs=os.path.join(fix.dir, 'phylo_input', 'study_tree_pairs.txt'),
+                          tree_filepaths=trees,
+                          output_dir=out_dir,
+                          cleaning_flags=CLEANING_FLAGS,
+                          pruned_from_ott_json_fp=None,
+                          root_ott_id=fix.root_id,
+                          script_managed_dir=fix.dir,
+                          nonempty_out_fp=os.path.join(fix.dir, 'nonempty_trees.txt'),
+                          num_workers=fix.args.num_workers,
+                          CFG=fix.log)
+    return run, len(trees), 'trees'
+
+
+def stage_collections(fix):
+    colls = fix.collections
+    return lambda: concatenate_collections(colls), len(colls) * fix.args.num_studies, 'decisions'
+
+
+def stage_subprob_summary(fix):
+    out_fp = os.path.join(fix.dir, 'subproblems', 'subproblem_size_summary.json')
+
+    def run():
+        if os.path.exists(out_fp):
+            os.unlink(out_fp)
+        generate_subprob_size_summary(os.path.join(fix.dir, 'subproblems', 'index.json'),
+                                      os.path.join(fix.dir, 'labelled_supertree',
+                                                   'num_tips_for_ott_internals_in_labelled_tree.json'),
+                                      os.path.join(fix.dir, 'subproblems', 'deg-dist'),
+                                      out_fp)
+    return run, len(fix.sub_ids), 'subproblems'
+
+
+def stage_docgen(fix):
+    def run():
+        dg = DocGen.__new__(DocGen)
+        dg.top_output_dir = fix.dir
+        dg._int_ott_dir = fix.ott_dir
+        dg._ott = None
+        dg.config = Extensible()
+        dg.config.root_ott_id = fix.root_id
+        dg.phylo_input = dg.read_phylo_input()
+        dg.subproblem_solutions = dg.read_subproblem_solutions()
+        dg.subproblems = dg.read_subproblems()
+        dg.assessments = dg.read_assessments()
+    return run, len(fix.sub_ids), 'subproblems'
+
+
+def stage_assess(fix):
+    def run():
+        prev = os.getcwd()
+        os.chdir(fix.dir)
+        try:
+            run_assessments(fix.log)
+        finally:
+            os.chdir(prev)
+    annot_fp = os.path.join(fix.dir, 'annotated_supertree', 'annotations.json')
+    return run, len(read_as_json(annot_fp)['nodes']), 'nodes'
+
+
+def _time_once(run):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        inner = run()
+        elapsed = time.perf_counter() - start
+    finally:
+        gc.enable()
+    # stages that set up untimed work return the time of their timed part
+    return inner if isinstance(inner, float) else elapsed
+
+
+def _peak_heap_mb(run):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1] / float(1 << 20)
+    finally:
+        tracemalloc.stop()
+
+
+def measure(name, run, units, unit_name, args):
+    best = min(_time_once(run) for _ in range(args.reps))
+    rec = {'stage': name,
+           'seconds': round(best, 6),
+           'units': units,
+           'unit': unit_name,
+           'per_second': round(units / best, 1) if best > 0 else None}
+    if not args.no_memory:
+        rec['peak_heap_mb'] = round(_peak_heap_mb(run), 2)
+    rec['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+    return rec
+
+
+def main(args):
+    wanted = [i.strip() for i in args.stages.split(',') if i.strip()] if args.stages else list(STAGES)
+    for s in wanted:
+        if s not in STAGES:
+            sys.exit('Unknown stage "{}". Expecting one of: {}'.format(s, ', '.join(STAGES)))
+    fix = Fixture(args)
+    results = []
+    try:
+        if 'docgen' in wanted:
+            # read_assessments needs the summary.json that run_assessments writes
+            stage_assess(fix)[0]()
+        for s in STAGES:
+            if s not in wanted:
+                continue
+            if s == 'prune':
+                todo = [('prune_' + e, _stage_prune(fix, e)) for e in sorted(TREE_ENGINES)]
+            else:
+                todo = [(s, globals()['stage_' + s](fix))]
+            for name, (run, units, unit_name) in todo:
+                rec = measure(name, run, units, unit_name, args)
+                results.append(rec)
+                m = '{stage:16} {seconds:10.4f} s {per_second:>12} {unit}/s'.format(**rec)
+                if 'peak_heap_mb' in rec:
+                    m += ' {:9.1f} MB heap'.format(rec['peak_heap_mb'])
+                sys.stdout.write(m + ' {:9.1f} MB max RSS\n'.format(rec['max_rss_mb']))
+    finally:
+        fix.close()
+    if args.save:
+        with open(args.save, 'w') as outp:
+            json.dump({'args': vars(args), 'results': results}, outp, indent=1, sort_keys=True)
+    ok = True
+    if args.baseline:
+        base = {i['stage']: i for i in read_as_json(args.baseline)['results']}
+        for rec in results:
+            b = base.get(rec['stage'])
+            if b and b['seconds'] > 0 and rec['seconds'] > args.max_slowdown * b['seconds']:
+                m = '{} took {} s, which is more than {} times the baseline of {} s\n'
+                sys.stderr.write(m.format(rec['stage'], rec['seconds'], args.max_slowdown, b['seconds']))
+                ok = False
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--num-taxa', type=int, default=200000, help='# of taxa in the synthetic OTT')
+    p.add_argument('--num-studies', type=int, default=200, help='# of synthetic studies (one tree each)')
+    p.add_argument('--tree-size', type=int, default=500, help='# of leaves per synthetic tree')
+    p.add_argument('--num-collections', type=int, default=5, help='# of synthetic collections')
+    p.add_argument('--num-subproblems', type=int, default=5000, help='# of synthetic subproblems')
+    p.add_argument('--num-workers', type=int, default=1, help='num_workers for clean_phylo_input')
+    p.add_argument('--stages', default='', help='comma-separated subset of: ' + ', '.join(STAGES))
+    p.add_argument('--reps', type=int, default=3, help='# of timings per stage (the fastest is reported)')
+    p.add_argument('--no-memory', action='store_true', help='skip the (slower) tracemalloc run of each stage')
+    p.add_argument('--seed', type=int, default=0, help='seed for the synthetic inputs')
+    p.add_argument('--workdir', default=None, help='directory for the inputs (default: a temporary one)')
+    p.add_argument('--keep', action='store_true', help='do not delete the temporary directory')
+    p.add_argument('--save', default=None, help='write the results as JSON to this file')
+    p.add_argument('--baseline', default=None, help='JSON written by an earlier --save run')
+    p.add_argument('--max-slowdown', type=float, default=1.5,
+                   help='largest acceptable ratio of a stage time to its baseline time')
+    sys.exit(main(p.parse_args()))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Times pruning to the ingroup when the outgroup is a large clade.
+
+Uses caterpillar and balanced outgroups of increasing size with both tree
+engines, and reports the fitted exponent of time vs. number of nodes.
+Exits with status 1 if any exponent exceeds --max-exponent.
+"""
+import argparse
+import copy
+import gc
+import math
+import sys
+import time
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from propinquity import TREE_ENGINES
+from synthetic import nexson_with_large_outgroup
+
+
+def time_prune_to_ingroup(tree_class, nexson, reps):
+    best = None
+    for _ in range(reps):
+        blob = copy.deepcopy(nexson)
+        ntw = tree_class(blob, 'tree1', log_obj={})
+        gc.disable()  # as timeit does, so that collections of the copies are not timed
+        try:
+            start = time.perf_counter()
+            ntw.prune_to_ingroup()
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def fitted_exponent(sizes, times):
+    xs = [math.log(i) for i in sizes]
+    ys = [math.log(i) for i in times]
+    mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+    num = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+    den = sum((x - mx) ** 2 for x in xs)
+    return num / den
+
+
+def main(args):
+    sizes = [args.smallest * (2 ** i) for i in range(args.num_sizes)]
+    ok = True
+    for shape in ('caterpillar', 'balanced'):
+        blobs = [nexson_with_large_outgroup(n, shape=shape) for n in sizes]
+        for engine_name, tree_class in sorted(TREE_ENGINES.items()):
+            times = [time_prune_to_ingroup(tree_class, b, args.reps) for b in blobs]
+            exponent = fitted_exponent(sizes, times)
+            for n, t in zip(sizes, times):
+                m = '{s:12} {e:8} {n:9d} outgroup leaves {t:9.4f} s {p:8.1f} ns/leaf\n'
+                sys.stdout.write(m.format(s=shape, e=engine_name, n=n, t=t, p=1e9 * t / n))
+            sys.stdout.write('{s:12} {e:8} fitted exponent = {x:.2f}\n'.format(s=shape, e=engine_name, x=exponent))
+            if exponent > args.max_exponent:
+                ok = False
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument('--smallest', type=int, default=20000, help='# of outgroup leaves in the smallest tree')
+    p.add_argument('--num-sizes', type=int, default=4, help='number of doublings of the outgroup size')
+    p.add_argument('--reps', type=int, default=3, help='# of timings per tree (the fastest is reported)')
+    p.add_argument('--max-exponent', type=float, default=1.5,
+                   help='largest acceptable fitted exponent (cache misses push linear code a bit above 1; a quadratic traversal gives ~2)')
+    sys.exit(main(p.parse_args()))
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""Generators of synthetic inputs for the propinquity benchmarks."""
+import json
+import os
+import random
+
+
+def _nexson_for_topology(children, root, study_id='ot_0', tree_id='tree1', ingroup=None,
+                         leaf_ott_ids=None):
+    """Returns a NexSON blob holding one tree.
+
+    `children` maps each internal node number to the list of its children's numbers.
+    Leaves get an OTU mapped to an OTT Id equal to the node number, or to
+    `leaf_ott_ids[node number]` if `leaf_ott_ids` is given (None for an unmapped OTU).
+    """
+    node_by_id, edge_by_source, otu_by_id = {}, {}, {}
+    to_visit = [root]
+    num_edges = 0
+    while to_visit:
+        nd = to_visit.pop()
+        nd_id = 'node{}'.format(nd)
+        node = {}
+        node_by_id[nd_id] = node
+        ch = children.get(nd)
+        if ch:
+            ebs = {}
+            edge_by_source[nd_id] = ebs
+            for c in ch:
+                num_edges += 1
+                e_id = 'edge{}'.format(num_edges)
+                ebs[e_id] = {'@source': nd_id, '@target': 'node{}'.format(c)}
+                to_visit.append(c)
+        else:
+            otu_id = 'otu{}'.format(nd)
+            ott_id = nd if leaf_ott_ids is None else leaf_ott_ids[nd]
+            if ott_id is None:
+                otu_by_id[otu_id] = {'^ot:originalLabel': 'Unmapped {}'.format(nd)}
+            else:
+                otu_by_id[otu_id] = {'^ot:ottId': ott_id,
+                                     '^ot:ottTaxonName': 'Taxon {}'.format(ott_id),
+                                     '^ot:originalLabel': 'Taxon {}'.format(ott_id)}
+            node['@otu'] = otu_id
+    tree = {'edgeBySourceId': edge_by_source,
+            'nodeById': node_by_id,
+            '^ot:rootNodeId': 'node{}'.format(root)}
+    if ingroup is not None:
+        tree['^ot:inGroupClade'] = 'node{}'.format(ingroup)
+    return {'nexml': {'^ot:studyId': study_id,
+                      '@nexml2json': '1.2.1',
+                      'otusById': {'otus1': {'otuById': otu_by_id}},
+                      'treesById': {'trees1': {'@otus': 'otus1',
+                                               'treeById': {tree_id: tree},
+                                               '^ot:treeElementOrder': [tree_id]}},
+                      '^ot:otusElementOrder': ['otus1'],
+                      '^ot:treesElementOrder': ['trees1']}}
+
+
+def caterpillar_children(num_leaves, first=0):
+    """Returns (children, root, next_unused_number) for a pectinate tree."""
+    children = {}
+    root = first
+    nxt = first + 1
+    curr = root
+    for i in range(num_leaves - 1):
+        leaf, internal = nxt, nxt + 1
+        nxt += 2
+        if i == num_leaves - 2:
+            children[curr] = [leaf, internal]
+        else:
+            children[curr] = [leaf, internal]
+            curr = internal
+    return children, root, nxt
+
+
+def balanced_children(num_leaves, first=0):
+    """Returns (children, root, next_unused_number) for a (nearly) balanced binary tree."""
+    children = {}
+    counter = [first]
+
+    def new_node():
+        n = counter[0]
+        counter[0] += 1
+        return n
+
+    root = new_node()
+    to_split = [(root, num_leaves)]
+    while to_split:
+        nd, n = to_split.pop()
+        if n < 2:
+            continue
+        left, right = new_node(), new_node()
+        children[nd] = [left, right]
+        to_split.append((left, n // 2))
+        to_split.append((right, n - n // 2))
+    return children, root, counter[0]
+
+
+def nexson_with_large_outgroup(num_outgroup_leaves, shape='caterpillar'):
+    """Returns a NexSON tree: (ingroup cherry, outgroup of `num_outgroup_leaves` leaves).
+
+    Pruning to the ingroup deletes the whole outgroup clade.
+    """
+    gen = caterpillar_children if shape == 'caterpillar' else balanced_children
+    children, out_root, nxt = gen(num_outgroup_leaves, first=1)
+    ingroup = nxt
+    children[ingroup] = [nxt + 1, nxt + 2]
+    children[0] = [ingroup, out_root]
+    return _nexson_for_topology(children, 0, ingroup=ingroup)
+
+
+################################################################################
+# OTT directories, studies, collections and synthesis outputs
+
+_RANKS = ('no rank', 'phylum', 'class', 'order', 'family', 'genus', 'species')
+_FLAGS = ('extinct', 'incertae_sedis', 'barren', 'major_rank_conflict')
+
+
+def _ott_row(*fields):
+    return '\t|\t'.join([str(i) for i in fields]) + '\t|\t\n'
+
+
+def write_synthetic_ott_dir(ott_dir, num_taxa, branching=8, flag_every=50,
+                            num_synonyms=None, num_forwards=None, root_id=1, seed=0):
+    """Writes taxonomy.tsv, synonyms.tsv, forwards.tsv and version.txt to `ott_dir`.
+
+    The taxonomy is a tree of `num_taxa` taxa in which each internal taxon has
+    `branching` children (filled breadth-first). Every `flag_every`-th taxon gets
+    one of the common OTT flags. The forwards map unused Ids to leaves.
+    Returns (root_id, list of the leaf Ids).
+    """
+    rng = random.Random(seed)
+    if not os.path.isdir(ott_dir):
+        os.makedirs(ott_dir)
+    if num_synonyms is None:
+        num_synonyms = num_taxa // 10
+    if num_forwards is None:
+        num_forwards = num_taxa // 100
+    ids = list(range(root_id, root_id + num_taxa))
+    parent, depth = {root_id: None}, {root_id: 0}
+    next_child = 1
+    for nd in ids:
+        for _ in range(branching):
+            if next_child >= num_taxa:
+                break
+            c = ids[next_child]
+            next_child += 1
+            parent[c] = nd
+            depth[c] = depth[nd] + 1
+    has_children = set(i for i in parent.values() if i is not None)
+    leaves = [i for i in ids if i not in has_children]
+    with open(os.path.join(ott_dir, 'taxonomy.tsv'), 'w', encoding='utf-8') as outp:
+        outp.write(_ott_row('uid', 'parent_uid', 'name', 'rank', 'sourceinfo', 'uniqname', 'flags'))
+        for n, nd in enumerate(ids):
+            par = parent[nd]
+            rank = _RANKS[min(depth[nd], len(_RANKS) - 1)]
+            flags = _FLAGS[n % len(_FLAGS)] if flag_every and n and (n % flag_every == 0) else ''
+            outp.write(_ott_row(nd, '' if par is None else par, 'Taxon {}'.format(nd), rank,
+                                'ncbi:{}'.format(nd), '', flags))
+    with open(os.path.join(ott_dir, 'synonyms.tsv'), 'w', encoding='utf-8') as outp:
+        outp.write(_ott_row('name', 'uid', 'type', 'uniqname', 'sourceinfo'))
+        for _ in range(num_synonyms):
+            nd = rng.choice(ids)
+            outp.write(_ott_row('Synonym of {}'.format(nd), nd, 'synonym', '', ''))
+    first_unused = root_id + num_taxa
+    with open(os.path.join(ott_dir, 'forwards.tsv'), 'w', encoding='utf-8') as outp:
+        outp.write('id\treplacement\n')
+        for n in range(num_forwards):
+            outp.write('{}\t{}\n'.format(first_unused + n, rng.choice(leaves)))
+    with open(os.path.join(ott_dir, 'version.txt'), 'w', encoding='utf-8') as outp:
+        outp.write('synthetic{}\n'.format(num_taxa))
+    return root_id, leaves
+
+
+def random_children(num_leaves, rng, first=0):
+    """Returns (children, root, leaf numbers) for a random binary tree (random joining)."""
+    pool = list(range(first, first + num_leaves))
+    leaves = list(pool)
+    children = {}
+    nxt = first + num_leaves
+    while len(pool) > 1:
+        pair = []
+        for _ in range(2):
+            i = rng.randrange(len(pool))
+            pool[i], pool[-1] = pool[-1], pool[i]
+            pair.append(pool.pop())
+        children[nxt] = pair
+        pool.append(nxt)
+        nxt += 1
+    return children, pool[0], leaves
+
+
+def synthetic_study(study_id, tree_id, ott_leaf_ids, num_leaves, rng, unmapped_fraction=0.05):
+    """Returns a NexSON study with one random tree of `num_leaves` leaves.
+
+    The leaves are mapped to a sample of `ott_leaf_ids`, apart from
+    `unmapped_fraction` of them, which have no OTT Id.
+    """
+    children, root, leaves = random_children(num_leaves, rng)
+    sample = rng.sample(ott_leaf_ids, min(num_leaves, len(ott_leaf_ids)))
+    leaf_ott_ids = {}
+    for n, leaf in enumerate(leaves):
+        if n >= len(sample) or rng.random() < unmapped_fraction:
+            leaf_ott_ids[leaf] = None
+        else:
+            leaf_ott_ids[leaf] = sample[n]
+    return _nexson_for_topology(children, root, study_id=study_id, tree_id=tree_id,
+                                ingroup=root, leaf_ott_ids=leaf_ott_ids)
+
+
+def write_synthetic_studies(out_dir, ott_leaf_ids, num_studies, num_leaves, seed=0):
+    """Writes `num_studies` studies as phylo_snapshot/tree_{study}@{tree}.json in `out_dir`.
+
+    Also writes phylo_input/study_tree_pairs.txt. Returns the list of the
+    study@tree tags.
+    """
+    rng = random.Random(seed)
+    snap_dir = os.path.join(out_dir, 'phylo_snapshot')
+    inp_dir = os.path.join(out_dir, 'phylo_input')
+    for d in (snap_dir, inp_dir):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+    tags = []
+    for n in range(num_studies):
+        study_id, tree_id = 'ot_{}'.format(n), 'tree{}'.format(n)
+        blob = synthetic_study(study_id, tree_id, ott_leaf_ids, num_leaves, rng)
+        tag = '{}@{}'.format(study_id, tree_id)
+        with open(os.path.join(snap_dir, 'tree_{}.json'.format(tag)), 'w', encoding='utf-8') as outp:
+            json.dump(blob, outp)
+        tags.append(tag)
+    with open(os.path.join(inp_dir, 'study_tree_pairs.txt'), 'w', encoding='utf-8') as outp:
+        outp.write('{}\n'.format('\n'.join(tags)))
+    return tags
+
+
+def synthetic_collections(num_collections, num_decisions, overlap=0.2, seed=0):
+    """Returns a list of tree collections; `overlap` of each one's decisions repeat earlier trees."""
+    rng = random.Random(seed)
+    colls, used = [], []
+    for c in range(num_collections):
+        decisions = []
+        for d in range(num_decisions):
+            if used and rng.random() < overlap:
+                study_id, tree_id = rng.choice(used)
+            else:
+                study_id, tree_id = 'ot_{}'.format(len(used)), 'tree1'
+                used.append((study_id, tree_id))
+            decisions.append({'studyID': study_id,
+                              'treeID': tree_id,
+                              'SHA': '',
+                              'decision': 'INCLUDED',
+                              'name': 'Study {}'.format(study_id)})
+        colls.append({'queries': [],
+                      'contributors': [{'login': 'user{}'.format(c % 5), 'name': 'User'}],
+                      'decisions': decisions})
+    return colls
+
+
+def _write_text(fp, content):
+    d = os.path.dirname(fp)
+    if d and not os.path.isdir(d):
+        os.makedirs(d)
+    with open(fp, 'w', encoding='utf-8') as outp:
+        outp.write(content)
+
+
+def _write_json(fp, blob):
+    _write_text(fp, json.dumps(blob))
+
+
+def _deg_dist_block(num_leaves):
+    return 'Out-degree\tCount\n0\t{}\n2\t{}\n'.format(num_leaves, max(0, num_leaves - 1))
+
+
+def write_synthetic_synth_outputs(out_dir, tags, num_subproblems, trees_per_subproblem=5,
+                                  leaves_per_subproblem=50, num_lost_taxa=100, seed=0):
+    """Writes the outputs of the later synthesis steps read by the summary, docs and assessments code.
+
+    That is the subproblems (ids, tree names, contesting trees, degree distributions and
+    index.json), the subproblem solution degree distributions, the labelled supertree
+    stats, the annotations and the inputs to run_assessments. The contents are only
+    consistent enough for those readers. Returns the list of subproblem IDs.
+    """
+    rng = random.Random(seed)
+    sub_ids = ['ott{}'.format(100000 + i) for i in range(num_subproblems)]
+    tree_fns = ['{}.tre'.format(i) for i in tags]
+    sub_dir = os.path.join(out_dir, 'subproblems')
+    dd_dir = os.path.join(sub_dir, 'deg-dist')
+    if not os.path.isdir(dd_dir):
+        os.makedirs(dd_dir)
+    sorted_by_num, num_tips, soln_dd, contesting = [], {}, [], {}
+    for sub_id in sub_ids:
+        k = rng.randint(1, trees_per_subproblem)
+        inputs = rng.sample(tree_fns, min(k, len(tree_fns))) + ['TAXONOMY']
+        nl = rng.randint(2, leaves_per_subproblem)
+        _write_text(os.path.join(sub_dir, sub_id + '-tree-names.txt'), '\n'.join(inputs) + '\n')
+        _write_text(os.path.join(dd_dir, 'deg-dist-{}.txt'.format(sub_id)),
+                    ''.join([_deg_dist_block(nl) for _ in inputs]))
+        sorted_by_num.append([sub_id + '.tre', inputs, nl])
+        num_tips[sub_id] = nl
+        soln_dd.append('{}.tre\n{}'.format(sub_id, _deg_dist_block(nl)))
+        if len(inputs) > 2:
+            info = [{'parent': 'node{} {}'.format(i, sub_id), 'children_from_taxon': ['Taxon_{}_node{}_ott1'.format(i, i)]}
+                    for i in range(2)]
+            contesting[sub_id] = {inputs[0]: info}
+    sorted_by_num.sort(key=lambda x: -len(x[1]))
+    _write_text(os.path.join(sub_dir, 'dumped_subproblem_ids.txt'),
+                ''.join(['{}.tre\n'.format(i) for i in sub_ids]))
+    _write_json(os.path.join(sub_dir, 'contesting_trees.json'), contesting)
+    _write_json(os.path.join(sub_dir, 'index.json'),
+                {'subproblems': {'sorted_by_num_phylo_inputs': sorted_by_num}})
+    _write_json(os.path.join(out_dir, 'labelled_supertree', 'num_tips_for_ott_internals_in_labelled_tree.json'),
+                num_tips)
+    _write_text(os.path.join(out_dir, 'subproblem_solutions', 'solution-degree-distributions.txt'),
+                ''.join(soln_dd))
+    # assessments inputs
+    total_leaves = sum(num_tips.values())
+    tax_dd = _deg_dist_block(total_leaves)
+    _write_text(os.path.join(out_dir, 'assessments', 'taxonomy_degree_distribution.txt'), tax_dd)
+    _write_text(os.path.join(out_dir, 'assessments', 'supertree_degree_distribution.txt'), tax_dd)
+    lost = [200000 + i for i in range(num_lost_taxa)]
+    _write_text(os.path.join(out_dir, 'assessments', 'lost_taxa.txt'),
+                ''.join(["depth=3 id={} uniqname='Taxon {}'\n".format(i, i) for i in lost]))
+    _write_json(os.path.join(out_dir, 'labelled_supertree', 'broken_taxa.json'),
+                {'non_monophyletic_taxa': {'ott{}'.format(i): {} for i in lost},
+                 'taxa_matching_multiple_ott_ids': {}})
+    _write_json(os.path.join(out_dir, 'cleaned_ott', 'cleaned_ott.json'), {'pruned': {}})
+    nodes = {}
+    for n in range(total_leaves):
+        if n % 3:
+            nodes['ott{}'.format(n + 1)] = {'terminal': {tags[n % len(tags)]: 'node{}'.format(n)}}
+        else:
+            nodes['mrcaott{}ott{}'.format(n, n + 1)] = {'supported_by': {tags[n % len(tags)]: 'node{}'.format(n)}}
+    _write_json(os.path.join(out_dir, 'annotated_supertree', 'annotations.json'), {'nodes': nodes})
+    return sub_ids
@@ -15,6 +15,7 @@ import subprocess
 from collections import defaultdict
 
 import peyotl.ott as ott
+from propinquity import open_ott_index
 import requests
 
 # From reference-taxonomy:org/opentreeoflife/taxa/Rank.java
@@ -207,6 +208,40 @@ def rank_unranked_nodes(taxonomy):
     return id2ranks
 
 
+class IndexedNames(object):
+    """dict-like lookup (`[]` and `get`) of taxon names backed by a propinquity OTTIndex."""
+
+    def __init__(self, taxonomy):
+        self.taxonomy = taxonomy
+
+    def __getitem__(self, ott_id):
+        name = self.taxonomy.get_name(ott_id)
+        if name is None:
+            raise KeyError(ott_id)
+        return name
+
+    def get(self, ott_id, default=None):
+        return self.taxonomy.get_name(ott_id, default)
+
+
+def rank_unranked_nodes_in_index(taxonomy):
+    """Like rank_unranked_nodes, but for a propinquity OTTIndex."""
+    status("  * Getting minimal ranks for unranked nodes ... ", newline=False)
+    id2ranks = {}
+    for ottID in taxonomy.ids_children_first():
+        id2ranks.setdefault(ottID, taxonomy.get_rank(ottID))
+        parent = taxonomy.get_parent(ottID)
+        if parent is None:
+            continue
+        prank = id2ranks.setdefault(parent, taxonomy.get_rank(parent))
+        if prank == "no rank" or (
+            rank_of_rank[prank] > rank_of_rank[id2ranks[ottID]]
+        ):
+            id2ranks[parent] = id2ranks[ottID]
+    status("done.")
+    return id2ranks
+
+
 ott_pattern = re.compile(r"ott")
 
 
@@ -308,13 +343,20 @@ def newly_broken_taxa_report(out, run1, run2):
     # load local copy of OTT
     status("\nAnalyzing broken taxa:")
     status("  * Loading OTT ... ", newline=False)
-    taxonomy = ott.OTT()
-    status("done. (Using version {})".format(taxonomy.version))
-    id2names = taxonomy.ott_id_to_names
-    for idk in id2names:
-        if isinstance(id2names[idk], tuple):
-            id2names[idk] = id2names[idk][0]
-    id2ranks = rank_unranked_nodes(taxonomy)
+    subott_dir = os.path.join(run2.output_dir, "subott_dir")
+    if os.path.exists(os.path.join(subott_dir, "taxonomy.tsv")):
+        taxonomy = open_ott_index(subott_dir)
+        status("done. (Using index of version {})".format(taxonomy.version))
+        id2names = IndexedNames(taxonomy)
+        id2ranks = rank_unranked_nodes_in_index(taxonomy)
+    else:
+        taxonomy = ott.OTT()
+        status("done. (Using version {})".format(taxonomy.version))
+        id2names = taxonomy.ott_id_to_names
+        for idk in id2names:
+            if isinstance(id2names[idk], tuple):
+                id2names[idk] = id2names[idk][0]
+        id2ranks = rank_unranked_nodes(taxonomy)
 
     # print details of names in 2 but not in 1 (the 'newly broken names')
     bt1 = set(run1.broken_taxa)
@@ -895,25 +895,33 @@ class RunStatistics(object):
             j2[taxon] = annotations
         return j2
 
-def _find_node_in_cleaned_phylo_json(blob, nd_id):
-    for key, val in blob.items():
-        if key == "revised_ingroup_node":
-            if nd_id == val:
-                return key
-            continue
-        node_list = val.get("nodes", [])
-        if nd_id in node_list:
-            return key
-    return 'INCLUDED'
+def _index_cleaned_phylo_json(blob):
+    """Returns node id -> reason and edge id -> reason dicts for a cleaned_phylo log.
 
-def _find_edge_in_cleaned_phylo_json(blob, edge_id):
+    The reason is the first key of the log that lists the node (or edge).
+    """
+    node_reason, edge_reason = {}, {}
     for key, val in blob.items():
         if key == "revised_ingroup_node":
+            node_reason.setdefault(val, key)
             continue
-        edge_list = val.get("edges", [])
-        if edge_id in edge_list:
-            return key
-    return 'INCLUDED'
+        for nd_id in val.get("nodes", []):
+            node_reason.setdefault(nd_id, key)
+        for edge_id in val.get("edges", []):
+            edge_reason.setdefault(edge_id, key)
+    return node_reason, edge_reason
+
+def _reason_diffs(reason1, reason2):
+    """Returns "reason1 -> reason2" -> ids for the ids with different reasons in the 2 indexes.
+
+    Ids that are not in an index are 'INCLUDED'.
+    """
+    diffs = {}
+    for el_id in reason1.keys() | reason2.keys():
+        r1, r2 = reason1.get(el_id, 'INCLUDED'), reason2.get(el_id, 'INCLUDED')
+        if r1 != r2:
+            diffs.setdefault(f"{r1} -> {r2}", []).append(el_id)
+    return diffs
 
 def get_tree_and_otus_from_nexson(nex, tree_id):
     """Returns the tree_blob, and otuById blob for the tree_id
@@ -1008,50 +1016,11 @@ class RunComparison(object):
         #          'higher-taxon-tip', 
         #          'revised_ingroup_node', 
         #          'became_trivial'}
-        node_diffs = {}
-        edge_diffs = {}
-        nds_done = set()
-        edges_done = set()
         print(path2)
-        for k, v in j2.items():
-            corresp = j1.get(k, {})
-            if k == "revised_ingroup_node":
-                v = {'nodes':[v]}
-                if corresp == {}:
-                    cnodes, cedges = [], []
-                else:
-                    cnodes, cedges = {'nodes':[corresp]}, []
-            else:
-                cnodes, cedges = corresp.get("nodes", []), corresp.get("edges", [])
-            nodes, edges = v.get("nodes", []), v.get("edges", [])
-            
-            for nd in nodes:
-                nds_done.add(nd)
-                if nd in cnodes:
-                    continue
-                prev_tag = _find_node_in_cleaned_phylo_json(j1, nd)
-                new_key = f"{prev_tag} -> {k}"
-                node_diffs.setdefault(new_key, []).append(nd)
-            for edge in edges:
-                if edge in cedges:
-                    continue
-                prev_tag = _find_edge_in_cleaned_phylo_json(j1, edge)
-                new_key = f"{prev_tag} -> {k}"
-                edge_diffs.setdefault(new_key, []).append(edge)
-        for k, v in j1.items():
-            if k == "revised_ingroup_node":
-                v = {'nodes':[v]}
-            nodes, edges = v.get("nodes", []), v.get("edges", [])
-            for nd in nodes:
-                if nd in nds_done:
-                    continue
-                new_key = f"{k} -> INCLUDED"
-                node_diffs.setdefault(new_key, []).append(nd)
-            for edge in edges:
-                if nd in edges_done:
-                    continue
-                new_key = f"{k} -> INCLUDED"
-                edge_diffs.setdefault(new_key, []).append(edge)
+        nodes1, edges1 = _index_cleaned_phylo_json(j1)
+        nodes2, edges2 = _index_cleaned_phylo_json(j2)
+        node_diffs = _reason_diffs(nodes1, nodes2)
+        edge_diffs = _reason_diffs(edges1, edges2)
         tks = set()
         tks.update(node_diffs.keys())
         tks.update(edge_diffs.keys())
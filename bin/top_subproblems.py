@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# Lists the largest subproblems of a synthesis run, using the
+#   subproblems/subproblem_size_summary.bin file written by the
+#   summarize_subpr_size rule.
+
+import argparse
+import os
+import sys
+
+from propinquity import SUBPROB_SIZE_STORE_FN, SubprobSizeStore
+
+
+def main(args):
+    fp = args.store
+    if os.path.isdir(fp):
+        fp = os.path.join(fp, 'subproblems', SUBPROB_SIZE_STORE_FN)
+    store = SubprobSizeStore(fp)
+    for sub_id, value in store.top(args.num, by=args.by):
+        row = store.row(sub_id)
+        sys.stdout.write('{}\t{}\t{}\t{}\t{}\n'.format(sub_id,
+                                                       value,
+                                                       store.num_leaves[row],
+                                                       store.num_splits[row],
+                                                       store.num_input_trees(row)))
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Lists the N largest subproblems as: id, value, '
+                                            '# leaves, # informative splits, # input trees')
+    p.add_argument('store', help='synthesis output directory or a {} file'.format(SUBPROB_SIZE_STORE_FN))
+    p.add_argument('-n', '--num', type=int, default=10, help='# of subproblems to list')
+    p.add_argument('--by', default='splits', choices=SubprobSizeStore.TOP_KEYS,
+                   help='the size to sort by')
+    main(p.parse_args())
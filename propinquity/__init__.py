@@ -1,14 +1,22 @@
 #!/usr/bin/env python3
 
-from collections import defaultdict
+from collections import defaultdict, deque
+import concurrent.futures
 from chameleon import PageTemplateLoader
+import multiprocessing
+import atexit
 import subprocess
-import itertools
+import tempfile
+import threading
 import datetime
 import filecmp
+import hashlib
+import heapq
 import pkgutil
+import bisect
 import codecs
 import shutil
+import mmap
 import time
 import json
 import copy
@@ -16,8 +24,16 @@ import csv
 import sys
 import os
 import re
-import io
 from pathlib import Path
+from array import array
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import resource
+except ImportError:
+    resource = None
 
 
 from peyutil import (is_str_type, is_int_type,
@@ -61,6 +77,28 @@ class PropinquityConfig(object):
       Run-specific IDs:
           root_ott_id
           synth_id
+      Tuning:
+          num_cleaning_workers - # of processes used to clean phylo inputs
+          phylo_cleaning_mode - "batch" (one rule) or "per_tree" (one rule per tree)
+          cache_dir - (optional) persistent cache shared by runs
+          tree_engine - "nexson" or "compact" tree representation for cleaning
+          num_pull_workers - # of shards pulled concurrently
+          skip_unchanged_pulls - only pull shards whose origin or HEAD moved
+          snapshot_mode - "checkout" or "cat_file" way of reading studies at a SHA
+          copy_mode - "copy" (reflink if possible) or "hardlink" (also hardlink into cache_dir)
+          solve_priority_min_seconds, solve_priority_min_bytes - thresholds for
+              solving a subproblem at a higher priority
+          solve_mem_mb_per_input_mb - mem_mb resource per MB of a subproblem
+          solve_batch_max_bytes - subproblems smaller than this are solved in
+              batches (0 turns batching off)
+          solve_batch_size - target (mean) # of subproblems in one batch
+          reversed_solve_mode - "all", "sample" or "skip" reversed subproblems solved
+          reversed_solve_fraction, reversed_solve_min_bytes - which subproblems
+              are solved in reversed order in "sample" mode
+          reversed_solve_priority - snakemake priority of the reversed solves
+          num_docgen_workers - # of threads rendering the html docs
+          docgen_pages - comma-separated html pages to (re)render (default: all)
+          num_assessment_workers - # of threads running the assessments
     
     Validation also sets environmental variables:
       OTC_CONFIG and OTCETERA_LOGFILE
@@ -100,6 +138,46 @@ class PropinquityConfig(object):
             self.synth_id = config["synth_id"]
         except KeyError as x:
             raise RuntimeError("Missing config variable {x}".format(x=str(x)))
+        self.num_cleaning_workers = int(config.get("num_cleaning_workers", 1))
+        self.phylo_cleaning_mode = config.get("phylo_cleaning_mode", "batch")
+        if self.phylo_cleaning_mode not in ("batch", "per_tree"):
+            m = 'phylo_cleaning_mode must be "batch" or "per_tree", not "{}"'
+            raise RuntimeError(m.format(self.phylo_cleaning_mode))
+        self.tree_engine = config.get("tree_engine", "nexson")
+        if self.tree_engine not in TREE_ENGINES:
+            m = 'tree_engine must be one of {}, not "{}"'
+            raise RuntimeError(m.format(', '.join(sorted(TREE_ENGINES.keys())), self.tree_engine))
+        self.cache_dir = config.get("cache_dir")
+        if self.cache_dir:
+            self.cache_dir = os.path.abspath(self.cache_dir)
+        self.num_pull_workers = int(config.get("num_pull_workers", 1))
+        self.skip_unchanged_pulls = bool(config.get("skip_unchanged_pulls", False))
+        self.snapshot_mode = config.get("snapshot_mode", "checkout")
+        if self.snapshot_mode not in ("checkout", "cat_file"):
+            m = 'snapshot_mode must be "checkout" or "cat_file", not "{}"'
+            raise RuntimeError(m.format(self.snapshot_mode))
+        self.solve_priority_min_seconds = float(config.get("solve_priority_min_seconds", 60))
+        self.solve_priority_min_bytes = int(config.get("solve_priority_min_bytes", 1000000))
+        self.solve_mem_mb_per_input_mb = float(config.get("solve_mem_mb_per_input_mb", 50))
+        self.solve_batch_max_bytes = int(config.get("solve_batch_max_bytes", 0))
+        self.solve_batch_size = int(config.get("solve_batch_size", 200))
+        if self.solve_batch_size < 1:
+            raise RuntimeError('solve_batch_size must be at least 1')
+        self.reversed_solve_mode = config.get("reversed_solve_mode", "all")
+        if self.reversed_solve_mode not in ("all", "sample", "skip"):
+            m = 'reversed_solve_mode must be "all", "sample" or "skip", not "{}"'
+            raise RuntimeError(m.format(self.reversed_solve_mode))
+        self.reversed_solve_fraction = float(config.get("reversed_solve_fraction", 1.0))
+        self.reversed_solve_min_bytes = int(config.get("reversed_solve_min_bytes", 0))
+        self.reversed_solve_priority = int(config.get("reversed_solve_priority", 0))
+        self.num_docgen_workers = int(config.get("num_docgen_workers", 1))
+        dp = config.get("docgen_pages")
+        self.docgen_pages = [i.strip() for i in dp.split(',') if i.strip()] if dp else None
+        self.num_assessment_workers = int(config.get("num_assessment_workers", 1))
+        self.copy_mode = config.get("copy_mode", "copy")
+        if self.copy_mode not in ("copy", "hardlink"):
+            m = 'copy_mode must be "copy" or "hardlink", not "{}"'
+            raise RuntimeError(m.format(self.copy_mode))
         if not os.path.isdir(os.path.join(self.phylesystem_dir, "shards", "phylesystem-1")):
             m = 'phylesystem_dir {p} is expeceted to have "shards/phylesystem-1" subdirectory.'
             raise RuntimeError(m.format(p=self.phylesystem_dir))
@@ -164,15 +242,141 @@ def canon_sep_string(v, sep=",", sort=True):
 ################################################################################
 # helper functions
 
+# Bytes and files copied, linked (reflink or hardlink) or not copied because
+#   the destination was already up to date, since the last log_copy_stats call.
+_COPY_STATS = {'bytes_copied': 0, 'bytes_linked': 0, 'bytes_avoided': 0,
+               'files_copied': 0, 'files_linked': 0, 'files_avoided': 0}
+_COPY_STATS_LOCK = threading.Lock()
+_FICLONE = 0x40049409  # linux/fs.h ioctl for a copy-on-write clone of a file
+
+def _count_copy(what, nbytes):
+    with _COPY_STATS_LOCK:
+        _COPY_STATS['bytes_' + what] += nbytes
+        _COPY_STATS['files_' + what] += 1
+
+def log_copy_stats(label, CFG=None):
+    """Logs (and resets) the copy counts, appending them to logs/copy_stats.jsonl."""
+    with _COPY_STATS_LOCK:
+        stats = dict(_COPY_STATS)
+        for k in _COPY_STATS:
+            _COPY_STATS[k] = 0
+    if CFG is None:
+        return stats
+    m = '{}: {} bytes copied, {} bytes linked, {} bytes not copied because they were unchanged'
+    CFG.info(m.format(label, stats['bytes_copied'], stats['bytes_linked'], stats['bytes_avoided']))
+    log_dir = os.path.join(CFG.out_dir, 'logs')
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    stats['label'] = label
+    with open(os.path.join(log_dir, 'copy_stats.jsonl'), 'a') as outp:
+        outp.write(json.dumps(stats, sort_keys=True) + '\n')
+    return stats
+
+def _digest_record_path(fp, cache_dir):
+    h = hashlib.sha1(os.path.abspath(fp).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, 'digests', h[:2], h)
+
+def cached_file_digest(fp, cache_dir=None):
+    """Returns file_digest(`fp`), reusing the digest recorded for `fp` in
+    `cache_dir` if the size and mtime recorded with it still match the file.
+    Without a `cache_dir`, the digest is always computed.
+    """
+    st = os.stat(fp)
+    if not cache_dir:
+        return file_digest(fp)
+    rec_fp = _digest_record_path(fp, cache_dir)
+    try:
+        with open(rec_fp, 'r') as inp:
+            size, mtime_ns, digest = inp.read().split()
+        if int(size) == st.st_size and int(mtime_ns) == st.st_mtime_ns:
+            return digest
+    except (OSError, ValueError):
+        pass
+    digest = file_digest(fp)
+    try:
+        par = os.path.dirname(rec_fp)
+        if not os.path.isdir(par):
+            os.makedirs(par, exist_ok=True)
+        tmp = '{}.{}.tmp'.format(rec_fp, os.getpid())
+        with open(tmp, 'w') as outp:
+            outp.write('{} {} {}\n'.format(st.st_size, st.st_mtime_ns, digest))
+        os.replace(tmp, rec_fp)
+    except OSError:
+        pass
+    return digest
+
+def _same_file_content(src, dest, CFG=None):
+    if os.path.samefile(src, dest):
+        return True
+    if os.path.getsize(src) != os.path.getsize(dest):
+        return False
+    cache_dir = getattr(CFG, 'cache_dir', None)
+    return cached_file_digest(src, cache_dir) == cached_file_digest(dest, cache_dir)
+
+def _link_or_copy(src, dest, allow_hardlink=False):
+    """Replaces `dest` by a reflink, hardlink or copy of `src`, in that order of preference.
+
+    Hardlinks are only made if `allow_hardlink` is True, which is only safe if
+        `dest` is not an output of a rule: snakemake touches its outputs, and
+        touching a hardlink changes the mtime of its source as well.
+        `dest` is never written in place, so an earlier hardlink at `dest`
+        does not alter its source.
+    Returns "reflink", "hardlink" or "copy".
+    """
+    tmp = dest + '.hide'
+    if os.path.lexists(tmp):
+        os.unlink(tmp)
+    how = None
+    if fcntl is not None and sys.platform.startswith('linux'):
+        try:
+            with open(src, 'rb') as inp, open(tmp, 'wb') as outp:
+                fcntl.ioctl(outp.fileno(), _FICLONE, inp.fileno())
+            shutil.copymode(src, tmp)
+            how = 'reflink'
+        except OSError:
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+    if how is None and allow_hardlink:
+        try:
+            os.link(src, tmp)
+            how = 'hardlink'
+        except OSError:
+            pass
+    if how is None:
+        shutil.copy(src, tmp)
+        how = 'copy'
+    os.replace(tmp, dest)
+    return how
+
+def store_in_cache(src, dest, CFG=None):
+    """Adds `src` to a cache store as `dest`: a hardlink if CFG.copy_mode is "hardlink"."""
+    how = _link_or_copy(src, dest, allow_hardlink=getattr(CFG, 'copy_mode', 'copy') == 'hardlink')
+    _count_copy('copied' if how == 'copy' else 'linked', os.path.getsize(dest))
+    return how
+
 def cp_if_needed(src, dest, name=None, CFG=None):
-    if (not os.path.exists(dest)) or (not filecmp.cmp(src, dest)):
-        shutil.copy(src, dest)
+    """Copies `src` to `dest` unless `dest` already has the same content.
+
+    Contents are compared by size and then by SHA-1s (which are cached in
+        CFG.cache_dir, if there is one). Copies are reflinks if the
+        filesystem supports them. `dest` is never a hardlink, because it is
+        usually the output of a rule.
+    Returns True if `dest` was (re)written.
+    """
+    nbytes = os.path.getsize(src)
+    if os.path.exists(dest) and _same_file_content(src, dest, CFG):
+        _count_copy('avoided', nbytes)
         if CFG is not None:
-            CFG.warn('cp "{}" "{}"'.format(src, dest))
-        return True
+            CFG.warn('copy of {n} not needed'.format(n=name))
+        return False
+    how = _link_or_copy(src, dest)
+    _count_copy('copied' if how == 'copy' else 'linked', nbytes)
     if CFG is not None:
-        CFG.warn('copy of {n} not needed'.format(n=name))
-    return False
+        if how == 'copy':
+            CFG.warn('cp "{}" "{}"'.format(src, dest))
+        else:
+            CFG.warn('{} "{}" "{}"'.format(how, src, dest))
+    return True
 
 def cp_if_missing(src, dest, name=None, CFG=None):
     if not os.path.exists(dest):
@@ -197,26 +401,94 @@ def write_as_json_if_needed(blob, fp, indent=0, CFG=None):
     write_as_json(blob, hide_fp, indent=indent)
     return mv_if_needed(hide_fp, fp, CFG=CFG)
 
+class WriteIfNeeded(object):
+    """Text file-like object that replaces `fp` only if the content written differs.
+
+    Writes go to "`fp`.hide" while a SHA-1 of the encoded text is accumulated.
+    On close, that digest is compared with the digest of the existing `fp`
+        (only computed if the sizes match). If they differ, "`fp`.hide" is
+        renamed to `fp`; otherwise it is removed, so `fp` keeps its mtime.
+    `changed` is None until the writer is closed, then True if `fp` was replaced.
+    Used as a context manager, an exception in the block discards the output.
+    """
+    def __init__(self, fp, name=None, CFG=None, encoding='utf-8'):
+        self.fp = fp
+        self.name = name
+        self.CFG = CFG
+        self.encoding = encoding
+        self.changed = None
+        par = os.path.split(fp)[0]
+        if par:
+            # concurrent jobs may be creating the same directory (e.g. in cache_dir)
+            os.makedirs(par, exist_ok=True)
+        self._tmp_fp = fp + '.hide'
+        self._out = open(self._tmp_fp, 'wb')
+        self._hash = hashlib.sha1()
+        self._size = 0
+
+    def write(self, s):
+        b = s.encode(self.encoding)
+        self._hash.update(b)
+        self._size += len(b)
+        self._out.write(b)
+        return len(s)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def tell(self):
+        """# of (encoded) bytes written so far."""
+        return self._size
+
+    def hexdigest(self):
+        """SHA-1 of the (encoded) bytes written so far."""
+        return self._hash.hexdigest()
+
+    def close(self):
+        if self.changed is not None:
+            return self.changed
+        self._out.close()
+        fp = self.fp
+        if (os.path.isfile(fp)
+                and os.path.getsize(fp) == self._size
+                and file_digest(fp) == self._hash.hexdigest()):
+            os.unlink(self._tmp_fp)
+            self.changed = False
+            if self.name is not None and self.CFG is not None:
+                self.CFG.warn("{n} has not changed".format(n=self.name))
+        else:
+            os.replace(self._tmp_fp, fp)
+            self.changed = True
+        return self.changed
+
+    def abort(self):
+        self._out.close()
+        if os.path.exists(self._tmp_fp):
+            os.unlink(self._tmp_fp)
+        self.changed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
 def write_if_needed(fp, content, name=None, CFG=None):
     """Writes `content` to `fp` if the content of that filepath is empty or different.
 
     Returns True if a write was done, False if the file already had that content.
     if `name` is not None, and the filepath has not changed, then
         a logger.warn "{name} has not changed" message will be emitted.
+    Use WriteIfNeeded directly to write large outputs incrementally.
     """
-    if os.path.exists(fp):
-        prev_content = open(fp, "r").read()
-        if prev_content == content:
-            if name is not None:
-                if CFG is not None:
-                    CFG.warn("{n} has not changed".format(n=name))
-            return False
-    par = os.path.split(fp)[0]
-    if par and not os.path.exists(par):
-        os.makedirs(par)
-    with open(fp, "w") as outp:
+    with WriteIfNeeded(fp, name=name, CFG=CFG) as outp:
         outp.write(content)
-    return True
+    return outp.changed
 
 _OTC_CONF_TEMPLATE = """
 [opentree]
@@ -260,26 +532,96 @@ def gen_config_content(cfg):
                                  s=cfg.synth_id)
 
 
-def pull_git_subdirs(par_dir, prefix):
+def _git_output(args, wd):
+    return subprocess.check_output(['git'] + args, cwd=wd).decode('utf-8').strip()
+
+def _remote_sha_of_current_branch(wd):
+    branch = _git_output(['symbolic-ref', '--short', 'HEAD'], wd)
+    out = _git_output(['ls-remote', 'origin', 'refs/heads/' + branch], wd)
+    return out.split()[0] if out else None
+
+def _pull_git_subdir(wd, last_pulled=None):
+    """Pulls `wd` unless `last_pulled` shows that neither HEAD nor origin moved.
+
+    Returns (HEAD SHA with a trailing newline, origin's SHA or None, seconds, pulled)
+    """
+    start = time.time()
+    remote_sha = None
+    if last_pulled is not None:
+        remote_sha = _remote_sha_of_current_branch(wd)
+        head = _git_output(['rev-parse', 'HEAD'], wd)
+        prev = last_pulled.get(os.path.abspath(wd))
+        if remote_sha and prev == {'head': head, 'remote': remote_sha}:
+            return head + '\n', remote_sha, time.time() - start, False
+    subprocess.run(["git", "pull", "origin", "--no-commit"],
+                   cwd=wd,
+                   check=True)
+    x = subprocess.check_output(['git','rev-parse', 'HEAD'],
+                                cwd=wd).decode('utf-8')
+    return x, remote_sha, time.time() - start, True
+
+def last_pulled_shas_fp(CFG, shards_dir, prefix):
+    """Returns the filepath of the "last pulled" SHAs of the `prefix` shards.
+
+    None if skip_unchanged_pulls is not set. The file is in cache_dir, if
+    that is set, otherwise in `shards_dir`.
+    """
+    if not CFG.skip_unchanged_pulls:
+        return None
+    d = CFG.cache_dir if CFG.cache_dir else shards_dir
+    return os.path.join(d, 'last_pulled_{}shas.json'.format(prefix))
+
+def pull_git_subdirs(par_dir, prefix, num_workers=1, last_pulled_fp=None, CFG=None):
     """Git pull on every dir matching `par_dir`/`prefix`-*
 
     returns the SHA of the HEAD of every matching dir
     (in order determined by string sort of subdir names).
+    Up to `num_workers` shards are pulled at once.
+    If `last_pulled_fp` is not None, it holds the HEAD and origin SHAs of
+        each shard after its last pull; shards for which `git ls-remote`
+        reports the same origin SHA and whose HEAD has not moved are not pulled.
     """
-    shas = []
     subl = list(os.listdir(par_dir))
     subl.sort()
-    for fn in subl:
-        if fn.startswith(prefix):
-            wd = os.path.join(par_dir, fn)
-            subprocess.run(["git", "pull", "origin", "--no-commit"],
-                           cwd=wd,
-                           check=True)
-            x = subprocess.check_output(['git','rev-parse', 'HEAD'],
-                                        cwd=wd).decode('utf-8')
-            shas.append(x)
+    wds = [os.path.join(par_dir, fn) for fn in subl if fn.startswith(prefix)]
+    last_pulled = None
+    if last_pulled_fp is not None:
+        last_pulled = read_as_json(last_pulled_fp) if os.path.exists(last_pulled_fp) else {}
+
+    def pull(wd):
+        return _pull_git_subdir(wd, last_pulled)
+
+    if num_workers > 1 and len(wds) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            results = list(executor.map(pull, wds))
+    else:
+        results = [pull(wd) for wd in wds]
+    shas = []
+    for wd, (sha, remote_sha, secs, pulled) in zip(wds, results):
+        if CFG is not None:
+            m = '{} {} in {:.1f} seconds'.format('pulled' if pulled else 'unchanged, skipped pull of', wd, secs)
+            CFG.info(m)
+        if last_pulled is not None and remote_sha:
+            last_pulled[os.path.abspath(wd)] = {'head': sha.strip(), 'remote': remote_sha}
+        shas.append(sha)
+    if last_pulled is not None:
+        par = os.path.split(last_pulled_fp)[0]
+        if par and not os.path.exists(par):
+            os.makedirs(par)
+        write_as_json_if_needed(last_pulled, last_pulled_fp, indent=1)
     return shas
 
+def file_digest(fp, blocksize=1 << 20):
+    """Returns the hex SHA-1 digest of the content of `fp`."""
+    h = hashlib.sha1()
+    with open(fp, "rb") as inp:
+        while True:
+            b = inp.read(blocksize)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
 def gen_tree_tags(study_tree_pair_fp):
     with open(study_tree_pair_fp, "r") as inp:
         for line in inp:
@@ -287,6 +629,19 @@ def gen_tree_tags(study_tree_pair_fp):
             if ls:
                 yield ls
 
+def read_blob_shas_by_tag(study_tree_pair_fp, blob_shas_fp):
+    """Returns a dict mapping each study@tree tag to the git object SHA of its study.
+
+    Relies on the lines of the files written by export_trees_list_and_shas
+    being in the same order.
+    """
+    tags = list(gen_tree_tags(study_tree_pair_fp))
+    shas = list(gen_tree_tags(blob_shas_fp))
+    if len(tags) != len(shas):
+        m = '"{}" and "{}" differ in the number of lines'
+        raise RuntimeError(m.format(study_tree_pair_fp, blob_shas_fp))
+    return dict(zip(tags, shas))
+
 def collection_to_included_trees(collection=None, fp=None):
     """Takes a collection object (or a filepath to collection object), 
 
@@ -407,13 +762,102 @@ def copy_ps_file_if_needed(git_action,
         return True, False, np
     return True, True, np
 
+class GitCatFile(object):
+    """A long-lived `git cat-file --batch` process for reading blobs of a repo.
+
+    Objects are read from the object database, so the working tree, the
+    checked out branch and the locks of the repo are not touched.
+    """
+    def __init__(self, repo_dir):
+        self.repo_dir = repo_dir
+        self._proc = subprocess.Popen(['git', 'cat-file', '--batch'],
+                                      cwd=repo_dir,
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE)
+
+    def read(self, rev, path):
+        """Returns (object SHA, content bytes) of `path` at `rev` or (None, None) if absent."""
+        self._proc.stdin.write('{}:{}\n'.format(rev, path).encode('utf-8'))
+        self._proc.stdin.flush()
+        header = self._proc.stdout.readline()
+        if not header:
+            raise RuntimeError('git cat-file in "{}" exited unexpectedly'.format(self.repo_dir))
+        if header.endswith(b' missing\n') or header.endswith(b' ambiguous\n'):
+            return None, None
+        obj_sha, obj_type, size = header.split()
+        content = self._proc.stdout.read(int(size))
+        self._proc.stdout.read(1)  # the LF after the object
+        return obj_sha.decode('utf-8'), content
+
+    def close(self):
+        if self._proc.poll() is None:
+            self._proc.stdin.close()
+            self._proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_ps_blob_if_needed(cat_file,
+                            rel_path,
+                            sha,
+                            coll_decision,
+                            out_dir,
+                            cd_to_new_map,
+                            CFG):
+    """Like copy_ps_file_if_needed, but reads the study from `cat_file` (a GitCatFile).
+
+    `rel_path` is the path of the study's file relative to the top of the shard.
+    """
+    study_id = coll_decision['studyID']
+    tree_id = coll_decision['treeID']
+    new_name = 'tree_{}@{}.json'.format(study_id, tree_id)
+    np = os.path.join(out_dir, new_name)
+    object_sha, content = cat_file.read(sha if sha else 'master', rel_path)
+    if content is None:
+        if CFG is not None:
+            m = 'Study file "{}" does not exist at "{}". Assuming that this study has been deleted'
+            CFG.warn(m.format(rel_path, sha if sha else 'master'))
+        if os.path.isfile(np):
+            os.remove(np)
+        return False, False, None
+    concrete_coll_decision = copy.deepcopy(coll_decision)
+    concrete_coll_decision['SHA'] = sha
+    concrete_coll_decision['object_SHA'] = object_sha
+    cd_to_new_map[id(coll_decision)] = concrete_coll_decision
+    if os.path.isfile(np) and os.path.getsize(np) == len(content):
+        with open(np, 'rb') as inp:
+            if inp.read() == content:
+                if CFG is not None:
+                    CFG.warn('copy of {n} not needed'.format(n=study_id))
+                return True, False, np
+    hide_fp = np + '.hide'
+    with open(hide_fp, 'wb') as outp:
+        outp.write(content)
+    os.replace(hide_fp, np)
+    if CFG is not None:
+        CFG.warn('wrote "{}" from {}:{}'.format(np, sha if sha else 'master', rel_path))
+    return True, True, np
+
 
 def export_studies_from_collection(ranked_coll_fp,
                                    phylesystem_par,
                                    script_managed_trees,
                                    out_par,
                                    concrete_coll_out_fp,
+                                   snapshot_mode='checkout',
                                    CFG=None):
+    """Writes the NexSON of every study in the collection to `out_par`.
+
+    With `snapshot_mode` "checkout" each study is copied from the shard's
+        working tree after checking out the collection decision's SHA (under
+        the lock of the shard). With "cat_file" the study is read from the
+        shard's object database by one `git cat-file --batch` process per
+        shard, with no checkouts and no locking.
+    """
     # Get the list of included trees
     try:
         included = collection_to_included_trees(fp=ranked_coll_fp)
@@ -445,33 +889,48 @@ def export_studies_from_collection(ranked_coll_fp,
 
     needs_reset_to_master = False
     file_names_copied = set()
-    for sha, from_this_sha_inc in included_by_sha.items():
-        for inc in from_this_sha_inc:
-            study_id = inc['studyID']
-            if CFG is not None:
-                CFG.info('study_id={s} from SHA={h}'.format(s=study_id, h=sha))
-            ga = ps.create_git_action(study_id)
-            with ga.lock():
-                if sha == '':
-                    needs_reset_to_master = False
-                    ga.checkout_master()
+    cat_file_by_repo = {}
+    try:
+        for sha, from_this_sha_inc in included_by_sha.items():
+            for inc in from_this_sha_inc:
+                study_id = inc['studyID']
+                if CFG is not None:
+                    CFG.info('study_id={s} from SHA={h}'.format(s=study_id, h=sha))
+                ga = ps.create_git_action(study_id)
+                if snapshot_mode == 'cat_file':
+                    cat_file = cat_file_by_repo.get(ga.repo)
+                    if cat_file is None:
+                        cat_file = GitCatFile(ga.repo)
+                        cat_file_by_repo[ga.repo] = cat_file
+                    rel_path = os.path.relpath(ga.path_for_doc(study_id), ga.repo)
+                    x = write_ps_blob_if_needed(cat_file, rel_path, sha, inc,
+                                                out_par, generic2concrete, CFG=CFG)
                 else:
-                    ga.checkout(sha)
-                    needs_reset_to_master = True
-                x = copy_ps_file_if_needed(ga, sha, inc,
-                                           out_par, generic2concrete, CFG=CFG)
+                    with ga.lock():
+                        if sha == '':
+                            needs_reset_to_master = False
+                            ga.checkout_master()
+                        else:
+                            ga.checkout(sha)
+                            needs_reset_to_master = True
+                        x = copy_ps_file_if_needed(ga, sha, inc,
+                                                   out_par, generic2concrete, CFG=CFG)
                 if x[0]:
                     file_name = os.path.split(x[-1])[-1]
                     file_names_copied.add(file_name)
                     num_moved += 1
                 else:
                     num_deleted += 1
+    finally:
+        for cat_file in cat_file_by_repo.values():
+            cat_file.close()
     if needs_reset_to_master:
         ga.checkout_master()
     if CFG:
         CFG.debug('{} total trees'.format(len(included) - num_deleted))
         CFG.debug('{} JSON files copied'.format(num_moved))
         CFG.debug('{} trees in collections, but with missing studies'.format(num_deleted))
+        log_copy_stats('phylo_snapshot', CFG=CFG)
 
     tree_file_name_pattern = re.compile(r'tree_[a-z_A-Z0-9]+@[a-z_A-Z0-9]+\.json') # {[a-z_A-Z0-9]+}.*{+}.json')
     for i in os.listdir(out_par):
@@ -542,6 +1001,563 @@ def suppress_by_flag(ott_dir,
     rp.check_returncode()
 
 
+################################################################################
+# Sectioned binary files
+#
+# The OTT index, the annotations index and the subproblem size summary share
+#   one layout (native byte order, every section 8-byte aligned):
+#   magic, uint32 length of the JSON header, JSON header (padded with spaces),
+#   then the sections. The header records the "byteorder" and, in its
+#   "sections" list, the [name, typecode, offset, nbytes] of each section
+#   (offsets are relative to the end of the header).
+
+def _write_sectioned_file(fp, magic, header, layout, sections, name=None, CFG=None):
+    """Writes `header` (a dict) and the `sections` (arrays, or bytes for
+    typecode "B") in the order of `layout` (a list of (name, typecode) pairs) to `fp`.
+
+    The file is written to a ".hide" path and only moved into place if it differs
+    from the existing file. Returns True if `fp` changed.
+    """
+    header = dict(header)
+    header['byteorder'] = sys.byteorder
+    header['sections'] = []
+    offset = 0
+    for sec_name, typecode in layout:
+        nbytes = len(sections[sec_name]) * array(typecode).itemsize
+        header['sections'].append([sec_name, typecode, offset, nbytes])
+        offset += nbytes + (-nbytes % 8)
+    hb = json.dumps(header, sort_keys=True).encode('utf-8')
+    hb += b' ' * (-(len(magic) + 4 + len(hb)) % 8)
+    par = os.path.split(fp)[0]
+    if par and not os.path.exists(par):
+        os.makedirs(par)
+    hide_fp = fp + '.hide'
+    with open(hide_fp, 'wb') as outp:
+        outp.write(magic)
+        outp.write(array('I', [len(hb)]).tobytes())
+        outp.write(hb)
+        for sec_name, typecode in layout:
+            sec = sections[sec_name]
+            b = bytes(sec) if typecode == 'B' else sec.tobytes()
+            outp.write(b)
+            outp.write(b'\0' * (-len(b) % 8))
+    return mv_if_needed(hide_fp, fp, name=name, CFG=CFG)
+
+def _parse_sectioned_file(mv, magic, fp, what):
+    """Returns (header, {name: section}) for the content `mv` (a memoryview) of
+    a file written by _write_sectioned_file. The sections are views into `mv`,
+    cast to their typecodes.
+
+    Raises ValueError if `fp` does not start with `magic` (`what` describes the
+    kind of file in the message) or was written with another byte order.
+    """
+    if bytes(mv[:len(magic)]) != magic:
+        raise ValueError('"{}" is not {}'.format(fp, what))
+    hstart = len(magic) + 4
+    hlen = mv[len(magic):hstart].cast('I')[0]
+    header = json.loads(bytes(mv[hstart:hstart + hlen]).decode('utf-8'))
+    if header['byteorder'] != sys.byteorder:
+        raise ValueError('"{}" was written on a machine with a different byte order'.format(fp))
+    base = hstart + hlen
+    sections = {}
+    for name, typecode, offset, nbytes in header['sections']:
+        sec = mv[base + offset:base + offset + nbytes]
+        sections[name] = sec if typecode == 'B' else sec.cast(typecode)
+    return header, sections
+
+
+################################################################################
+# Compact, memory-mapped OTT index
+#
+# `write_ott_index` parses the taxonomy.tsv and forwards.tsv of an OTT directory
+#   once and writes OTT_INDEX_FN into that directory. `open_ott_index` mmaps
+#   it, so every stage (and every process) that only needs names, ranks,
+#   parents, flags or forwards shares the same read-only pages instead of
+#   building its own peyotl OTT object.
+# The file is a sectioned binary file (see _write_sectioned_file) with these
+#   sections. Taxa are sorted by OTT Id:
+#     ids        int64[n]    OTT Ids (sorted)
+#     parent     int32[n]    position of the parent (-1 for the root)
+#     name_off   uint64[n+1] offsets of the UTF-8 names in `names`
+#     rank       uint16[n]   index into the header's "ranks" list
+#     flags      uint64[n]   bitset over the header's "flags" list
+#     inh_flags  uint64[n]   flags of the taxon or any of its ancestors
+#     pre        int32[n]    preorder number of the taxon
+#     last       int32[n]    largest preorder number in the taxon's subtree, so
+#                            a is an ancestor of b iff pre[a] < pre[b] <= last[a]
+#     fwd_from   int64[m]    forwarded (deprecated) OTT Ids (sorted)
+#     fwd_to     int64[m]    the Id each one is forwarded to (chains resolved)
+#     names      bytes
+# The header's "sources" records the size, mtime and SHA-1 of the taxonomy.tsv
+#   and forwards.tsv the index was built from (None for a missing file).
+
+OTT_INDEX_FN = 'ott_index.bin'
+_OTT_INDEX_SOURCE_FNS = ('taxonomy.tsv', 'forwards.tsv')
+_OTT_INDEX_MAGIC = b'PROPOTT1'
+_OTT_INDEX_SECTIONS = (('ids', 'q'), ('parent', 'i'), ('name_off', 'Q'),
+                       ('rank', 'H'), ('flags', 'Q'), ('inh_flags', 'Q'),
+                       ('pre', 'i'), ('last', 'i'),
+                       ('fwd_from', 'q'), ('fwd_to', 'q'),
+                       ('names', 'B'))
+
+
+def ott_index_path(ott_dir):
+    return os.path.join(ott_dir, OTT_INDEX_FN)
+
+def _ott_index_source_stats(ott_dir):
+    sources = {}
+    for fn in _OTT_INDEX_SOURCE_FNS:
+        fp = os.path.join(ott_dir, fn)
+        if os.path.exists(fp):
+            st = os.stat(fp)
+            sources[fn] = [st.st_size, st.st_mtime_ns, file_digest(fp)]
+        else:
+            sources[fn] = None
+    return sources
+
+
+def _split_ott_tsv_line(line):
+    ls = line.rstrip('\n').split('\t|\t')
+    if ls and ls[-1].endswith('\t|'):
+        ls[-1] = ls[-1][:-2]
+    return ls
+
+
+def _read_taxonomy_tsv_for_index(fp):
+    ids, parents, names, ranks, flags = [], [], [], [], []
+    with codecs.open(fp, 'r', encoding='utf-8') as inp:
+        header = _split_ott_tsv_line(next(inp))
+        uid_col, par_col = header.index('uid'), header.index('parent_uid')
+        name_col, rank_col = header.index('name'), header.index('rank')
+        flags_col = header.index('flags') if 'flags' in header else None
+        for line in inp:
+            ls = _split_ott_tsv_line(line)
+            if len(ls) < 4:
+                continue
+            ids.append(int(ls[uid_col]))
+            p = ls[par_col].strip()
+            parents.append(int(p) if p else None)
+            names.append(ls[name_col])
+            ranks.append(ls[rank_col])
+            fs = ls[flags_col] if flags_col is not None and flags_col < len(ls) else ''
+            flags.append([i for i in fs.split(',') if i])
+    return ids, parents, names, ranks, flags
+
+
+def _read_forwards_tsv_for_index(fp):
+    """Returns {old_id: new_id} with forwarding chains followed to their end."""
+    fwd = {}
+    if not os.path.exists(fp):
+        return fwd
+    with codecs.open(fp, 'r', encoding='utf-8') as inp:
+        for line in inp:
+            ls = [i.strip() for i in line.split('\t')]
+            ls = [i for i in ls if i and i != '|']
+            if len(ls) < 2:
+                continue
+            try:
+                fwd[int(ls[0])] = int(ls[1])
+            except ValueError:
+                pass  # header line
+    resolved = {}
+    for old_id, new_id in fwd.items():
+        seen = {old_id}
+        while new_id in fwd and new_id not in seen:
+            seen.add(new_id)
+            new_id = fwd[new_id]
+        resolved[old_id] = new_id
+    return resolved
+
+
+def _read_ott_version_for_index(ott_dir):
+    for fn in (_OTT_VERS_FN, 'version.txt'):
+        fp = os.path.join(ott_dir, fn)
+        if os.path.exists(fp):
+            with open(fp, 'r') as inp:
+                return inp.read().strip()
+    return None
+
+
+def _add_preorder_sections(sections):
+    """Adds the "pre", "last" and "inh_flags" arrays computed from "parent" and "flags"."""
+    parent, flags = sections['parent'], sections['flags']
+    n = len(parent)
+    first_child, next_sib = array('i', [-1]) * n, array('i', [-1]) * n
+    for pos in range(n - 1, -1, -1):
+        par = parent[pos]
+        if par >= 0:
+            next_sib[pos] = first_child[par]
+            first_child[par] = pos
+    pre, inh_flags, by_pre = array('i', [-1]) * n, array('Q', [0]) * n, array('i')
+    for root in range(n):
+        if parent[root] >= 0:
+            continue
+        stack = [root]
+        while stack:
+            pos = stack.pop()
+            pre[pos] = len(by_pre)
+            by_pre.append(pos)
+            par = parent[pos]
+            inh_flags[pos] = flags[pos] | (inh_flags[par] if par >= 0 else 0)
+            c = first_child[pos]
+            while c >= 0:
+                stack.append(c)
+                c = next_sib[c]
+    if len(by_pre) != n:
+        raise ValueError('The parent pointers of the taxonomy contain a cycle')
+    last = array('i', pre)
+    for pos in reversed(by_pre):
+        par = parent[pos]
+        if par >= 0 and last[pos] > last[par]:
+            last[par] = last[pos]
+    sections['pre'], sections['last'], sections['inh_flags'] = pre, last, inh_flags
+
+
+def write_ott_index(ott_dir, out_fp=None, CFG=None):
+    """Writes the compact OTT index for `ott_dir` (to `ott_dir`/OTT_INDEX_FN by default).
+
+    The file is written to a ".hide" path and only moved into place if it differs
+    from the existing index. Returns True if the index changed.
+    """
+    if out_fp is None:
+        out_fp = ott_index_path(ott_dir)
+    start = time.time()
+    sources = _ott_index_source_stats(ott_dir)
+    ids, parents, names, ranks, flags = _read_taxonomy_tsv_for_index(os.path.join(ott_dir, 'taxonomy.tsv'))
+    fwd = _read_forwards_tsv_for_index(os.path.join(ott_dir, 'forwards.tsv'))
+    order = sorted(range(len(ids)), key=ids.__getitem__)
+    pos_of_id = {}
+    for pos, row in enumerate(order):
+        pos_of_id[ids[row]] = pos
+    rank_names = sorted(set(ranks))
+    rank_code = {r: n for n, r in enumerate(rank_names)}
+    flag_names = sorted(set(f for fl in flags for f in fl))
+    if len(flag_names) > 64:
+        raise ValueError('{} has more than 64 distinct taxon flags'.format(ott_dir))
+    flag_bit = {f: 1 << n for n, f in enumerate(flag_names)}
+    sections = {'ids': array('q'), 'parent': array('i'), 'name_off': array('Q', [0]),
+                'rank': array('H'), 'flags': array('Q'),
+                'fwd_from': array('q'), 'fwd_to': array('q')}
+    names_blob = bytearray()
+    for row in order:
+        sections['ids'].append(ids[row])
+        par = parents[row]
+        sections['parent'].append(-1 if par is None else pos_of_id.get(par, -1))
+        names_blob.extend(names[row].encode('utf-8'))
+        sections['name_off'].append(len(names_blob))
+        sections['rank'].append(rank_code[ranks[row]])
+        bits = 0
+        for f in flags[row]:
+            bits |= flag_bit[f]
+        sections['flags'].append(bits)
+    _add_preorder_sections(sections)
+    for old_id in sorted(fwd.keys()):
+        sections['fwd_from'].append(old_id)
+        sections['fwd_to'].append(fwd[old_id])
+    sections['names'] = names_blob
+    header = {'num_taxa': len(ids),
+              'num_forwards': len(fwd),
+              'ranks': rank_names,
+              'flags': flag_names,
+              'version': _read_ott_version_for_index(ott_dir),
+              'sources': sources,
+              }
+    changed = _write_sectioned_file(out_fp, _OTT_INDEX_MAGIC, header, _OTT_INDEX_SECTIONS, sections,
+                                    name=OTT_INDEX_FN, CFG=CFG)
+    if CFG is not None:
+        CFG.debug('OTT index for {} ({} taxa, {} forwards) built in {:.1f} seconds'.format(
+            ott_dir, len(ids), len(fwd), time.time() - start))
+    return changed
+
+
+class OTTIndex(object):
+    """Read-only view of an index written by `write_ott_index`.
+
+    Lookups are binary searches over the mmapped, sorted Id array, so opening
+    the index costs one mmap call no matter how large the taxonomy is.
+    Methods taking an `ott_id` return None (or the `default`) for unknown Ids.
+    """
+    def __init__(self, fp):
+        self.fp = fp
+        with open(fp, 'rb') as inp:
+            self._mm = mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_READ)
+        mv = memoryview(self._mm)
+        try:
+            header, sections = _parse_sectioned_file(mv, _OTT_INDEX_MAGIC, fp, 'an OTT index')
+        except:
+            mv.release()
+            self._mm.close()
+            raise
+        self.version = header['version']
+        self.sources = header.get('sources')
+        self.rank_names = header['ranks']
+        self.flag_names = header['flags']
+        self._flag_bit = {f: 1 << n for n, f in enumerate(self.flag_names)}
+        self._mapping_memo = {}
+        self._views = [mv]
+        for name, v in sections.items():
+            self._views.append(v)
+            setattr(self, '_' + name, v)
+
+    def __getstate__(self):
+        # the mmap cannot be pickled, so (spawned) processes reopen the file
+        return {'fp': self.fp}
+
+    def __setstate__(self, state):
+        self.__init__(state['fp'])
+
+    def close(self):
+        for v in reversed(self._views):
+            v.release()
+        self._views = []
+        self._mm.close()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, ott_id):
+        return self._pos(ott_id) is not None
+
+    def _pos(self, ott_id):
+        i = bisect.bisect_left(self._ids, ott_id)
+        if i < len(self._ids) and self._ids[i] == ott_id:
+            return i
+        return None
+
+    def _name_at(self, pos):
+        return bytes(self._names[self._name_off[pos]:self._name_off[pos + 1]]).decode('utf-8')
+
+    def get_name(self, ott_id, default=None):
+        pos = self._pos(ott_id)
+        return default if pos is None else self._name_at(pos)
+
+    def get_rank(self, ott_id, default=None):
+        pos = self._pos(ott_id)
+        return default if pos is None else self.rank_names[self._rank[pos]]
+
+    def get_parent(self, ott_id):
+        pos = self._pos(ott_id)
+        if pos is None:
+            return None
+        par = self._parent[pos]
+        return None if par < 0 else self._ids[par]
+
+    def get_flags(self, ott_id):
+        pos = self._pos(ott_id)
+        if pos is None:
+            return None
+        bits = self._flags[pos]
+        return set(f for f in self.flag_names if bits & self._flag_bit[f])
+
+    def convert_flag_string_set_to_union(self, flags):
+        """Returns the bitset for the flag names in `flags` (unknown flags are ignored)."""
+        u = 0
+        for f in flags:
+            u |= self._flag_bit.get(f, 0)
+        return u
+
+    def has_flag_in(self, ott_id, flag_union):
+        pos = self._pos(ott_id)
+        return pos is not None and bool(self._flags[pos] & flag_union)
+
+    def forward(self, ott_id):
+        """Returns the Id that a forwarded (deprecated) `ott_id` now maps to, or None."""
+        i = bisect.bisect_left(self._fwd_from, ott_id)
+        if i < len(self._fwd_from) and self._fwd_from[i] == ott_id:
+            return self._fwd_to[i]
+        return None
+
+    def ids_children_first(self):
+        """Returns a list of all Ids with every taxon appearing before its parent."""
+        order = sorted(range(len(self._pre)), key=self._pre.__getitem__, reverse=True)
+        return [self._ids[pos] for pos in order]
+
+    def is_ancestor(self, anc_id, ott_id):
+        """True if `anc_id` is a proper ancestor of `ott_id`."""
+        a, d = self._pos(anc_id), self._pos(ott_id)
+        if a is None or d is None:
+            return False
+        return self._pre[a] < self._pre[d] <= self._last[a]
+
+    def map_ott_ids(self, ott_id_list, to_prune_flag_union, root_ott_id):
+        """Batched version of peyotl's OTT.map_ott_ids for the OTT Ids of a tree.
+
+        Returns (mapped, unrecog, forward2unrecog, pruned, above_root, old2new)
+        with the same meaning (and relative order) as peyotl's version.
+        Flagged ancestors and the root are checked with the precomputed
+        "inh_flags" and preorder interval arrays rather than by walking up the
+        taxonomy, and the classification of each Id is memoized so Ids that
+        recur across input trees are resolved once per process.
+        """
+        memo = self._mapping_memo.setdefault((to_prune_flag_union, root_ott_id), {})
+        if root_ott_id is None:
+            root_interval = None
+        else:
+            rp = self._pos(root_ott_id)
+            root_interval = (-1, -1) if rp is None else (self._pre[rp], self._last[rp])
+        mapped, unrecog, forward2unrecog, pruned, above_root, old2new = [], [], [], [], [], {}
+        for old_id in ott_id_list:
+            c = memo.get(old_id)
+            if c is None:
+                c = self._classify_ott_id(old_id, to_prune_flag_union, root_interval)
+                memo[old_id] = c
+            kind, new_id = c
+            if kind == 'mapped':
+                mapped.append(new_id)
+                if new_id != old_id:
+                    old2new[old_id] = new_id
+            elif kind == 'unrecognized':
+                unrecog.append(old_id)
+            elif kind == 'forward2unrecog':
+                forward2unrecog.append(old_id)
+            elif kind == 'pruned':
+                pruned.append(old_id)
+            else:
+                above_root.append(old_id)
+        return mapped, unrecog, forward2unrecog, pruned, above_root, old2new
+
+    def _classify_ott_id(self, old_id, to_prune_flag_union, root_interval):
+        pos = self._pos(old_id)
+        if pos is not None:
+            if root_interval is not None and not (root_interval[0] <= self._pre[pos] <= root_interval[1]):
+                return 'above_root', None
+            if self._inh_flags[pos] & to_prune_flag_union:
+                return 'pruned', None
+            return 'mapped', old_id
+        new_id = self.forward(old_id)
+        if new_id is None:
+            return 'unrecognized', None
+        new_pos = self._pos(new_id)
+        if new_pos is None:
+            return 'forward2unrecog', None
+        if self._inh_flags[new_pos] & to_prune_flag_union:
+            return 'pruned', None
+        return 'mapped', new_id
+
+    def ids_containing_other_ids(self, ott_ids):
+        """Returns the set of `ott_ids` that are ancestors of another Id in `ott_ids`."""
+        by_pre = sorted(set(self._pre[self._pos(i)] for i in ott_ids))
+        containing = set()
+        for ott_id in set(ott_ids):
+            pos = self._pos(ott_id)
+            # the first Id after this one in preorder is a descendant if any are
+            k = bisect.bisect_right(by_pre, self._pre[pos])
+            if k < len(by_pre) and by_pre[k] <= self._last[pos]:
+                containing.add(ott_id)
+        return containing
+
+    def write_induced_newick(self, out, ott_ids):
+        """Writes the tree induced by `ott_ids` (with "ott#" labels) to `out` as
+        one line of newick (ending in ";\n").
+
+        The nodes are the Ids themselves and the MRCAs of each pair of
+        them; Ids that are ancestors of other Ids appear as internal nodes
+        (with one child, if only one of their descendants is in the tree).
+        Other ancestors are omitted. Children are sorted by OTT Id.
+        """
+        pre, last, parent = self._pre, self._last, self._parent
+        positions = sorted(set(self._pos(i) for i in ott_ids), key=pre.__getitem__)
+        if not positions:
+            return
+        nodes = set(positions)
+        for a, b in zip(positions, positions[1:]):
+            anc = a
+            while not (pre[anc] <= pre[b] <= last[anc]):
+                anc = parent[anc]
+            nodes.add(anc)
+        children = defaultdict(list)
+        stack = []
+        for pos in sorted(nodes, key=pre.__getitem__):
+            while stack and not (pre[stack[-1]] < pre[pos] <= last[stack[-1]]):
+                stack.pop()
+            if stack:
+                children[stack[-1]].append(pos)
+            stack.append(pos)
+        ids = self._ids
+        for c in children.values():
+            c.sort(key=ids.__getitem__)
+        root = min(nodes, key=pre.__getitem__)
+        pieces, todo = [], [(root, False)]
+        while todo:
+            pos, closing = todo.pop()
+            if closing:
+                pieces.append(')ott{}'.format(ids[pos]))
+                continue
+            if pieces and pieces[-1][-1] != '(':
+                pieces.append(',')
+            c = children.get(pos)
+            if c:
+                pieces.append('(')
+                todo.append((pos, True))
+                todo.extend((i, False) for i in reversed(c))
+            else:
+                pieces.append('ott{}'.format(ids[pos]))
+        pieces.append(';\n')
+        out.write(''.join(pieces))
+
+
+_OTT_INDEX_BY_DIR = {}
+_PRIVATE_OTT_INDEX_DIRS = []
+
+def ott_index_matches_sources(idx, ott_dir):
+    """Returns True if the taxonomy.tsv and forwards.tsv of `ott_dir` are those `idx` was built from.
+
+    Files whose size and mtime match are not read. If only the mtime differs,
+        the SHA-1s are compared.
+    """
+    if idx.sources is None:
+        return False
+    for fn in _OTT_INDEX_SOURCE_FNS:
+        fp = os.path.join(ott_dir, fn)
+        rec = idx.sources.get(fn)
+        if rec is None or not os.path.exists(fp):
+            if rec is not None or os.path.exists(fp):
+                return False
+            continue
+        st = os.stat(fp)
+        if st.st_size != rec[0]:
+            return False
+        if st.st_mtime_ns != rec[1] and file_digest(fp) != rec[2]:
+            return False
+    return True
+
+def _remove_private_ott_indices():
+    for d in _PRIVATE_OTT_INDEX_DIRS:
+        shutil.rmtree(d, ignore_errors=True)
+
+def open_ott_index(ott_dir, CFG=None):
+    """Returns the OTTIndex for `ott_dir`, reusing one opened earlier in this process.
+
+    The OTT_INDEX_FN of `ott_dir` is only read: if it is missing or was not built
+        from the current taxonomy files, an index private to this process is built
+        in a temporary directory (removed at exit) instead.
+    """
+    k = os.path.abspath(ott_dir)
+    idx = _OTT_INDEX_BY_DIR.get(k)
+    if idx is not None:
+        return idx
+    fp = ott_index_path(k)
+    if os.path.exists(fp):
+        idx = OTTIndex(fp)
+        if not ott_index_matches_sources(idx, k):
+            if CFG is not None:
+                CFG.warn('OTT index "{}" was not built from the taxonomy files in "{}"'.format(fp, k))
+            idx.close()
+            idx = None
+    elif CFG is not None:
+        CFG.warn('OTT index "{}" does not exist'.format(fp))
+    if idx is None:
+        if not _PRIVATE_OTT_INDEX_DIRS:
+            atexit.register(_remove_private_ott_indices)
+        tmp_dir = tempfile.mkdtemp(prefix='propinquity-ott-index-')
+        _PRIVATE_OTT_INDEX_DIRS.append(tmp_dir)
+        private_fp = os.path.join(tmp_dir, OTT_INDEX_FN)
+        write_ott_index(k, private_fp, CFG=CFG)
+        idx = OTTIndex(private_fp)
+    _OTT_INDEX_BY_DIR[k] = idx
+    return idx
+
+
 class MissingTreeError(Exception):
     def __init__(self, tree_id):
         Exception.__init__(self, 'Tree "{}" was not found.'.format(tree_id))
@@ -550,55 +1566,26 @@ class EmptyTreeError(Exception):
     pass
 
 
-class NexsonTreeWrapper(object):
+class _PrunableNexsonTree(object):
+    """Pruning logic shared by the tree representations used to clean phylo inputs.
+
+    Subclasses store the topology and provide:
+        root_node_id (property), _do_prune_to_ingroup, _del_tip,
+        prune_if_deg_too_low, group_and_sort_leaves_by_ott_id, write_newick
+    Node and edge IDs are the NexSON IDs in every method that is not "_"-prefixed
+        so that the deletion logs do not depend on the representation.
+    """
     def __init__(self, nexson, tree_id, log_obj=None, logger_msg_obj=None):
         self.logger_msg_obj = logger_msg_obj
         self.tree, self.otus = find_tree_and_otus_in_nexson(nexson, tree_id)
         if self.tree is None:
             raise MissingTreeError(tree_id)
         self._log_obj = log_obj
-        self._edge_by_source = self.tree['edgeBySourceId']
-        self._node_by_id = self.tree['nodeById']
-        self._root_node_id = None
-        self.root_node_id = self.tree['^ot:rootNodeId']
-        assert self.root_node_id
         self._ingroup_node_id = self.tree.get('^ot:inGroupClade')
-        for k, v in self._node_by_id.items():
-            v['@id'] = k
-        self._edge_by_target = self._create_edge_by_target()
         self.nodes_deleted, self.edges_deleted = set(), set()
         self._by_ott_id = None
         self.is_empty = False
 
-
-    def get_root_node_id(self):
-        return self._root_node_id
-
-    def set_root_node_id(self, r):
-        try:
-            assert r
-            assert r in self._edge_by_source
-            assert r in self._node_by_id
-        except:
-            error('Illegal root node "{}"'.format(r))
-            raise
-        self._root_node_id = r
-
-    root_node_id = property(get_root_node_id, set_root_node_id)
-
-    def _create_edge_by_target(self):
-        """creates a edge_by_target dict with the same edge objects as the edge_by_source.
-        Also adds an '@id' field to each edge."""
-        ebt = {}
-        for edge_dict in self._edge_by_source.values():
-            for edge_id, edge in edge_dict.items():
-                target_id = edge['@target']
-                edge['@id'] = edge_id
-                assert target_id not in ebt
-                ebt[target_id] = edge
-        # _check_rev_dict(self._tree, ebt)
-        return ebt
-
     def _clear_del_log(self):
         self.nodes_deleted = set()
         self.edges_deleted = set()
@@ -610,15 +1597,6 @@ class NexsonTreeWrapper(object):
             o['edges'].extend(self.edges_deleted)
         self._clear_del_log()
 
-    def _do_prune_to_ingroup(self):
-        edge_to_del = self._edge_by_target.get(self._ingroup_node_id)
-        if edge_to_del is None:
-            return
-        try:
-            self.prune_edge_and_rootward(edge_to_del)
-        finally:
-            self._log_deletions('outgroup')
-
     def prune_to_ingroup(self):
         """Remove nodes and edges from tree if they are not the ingroup or a descendant of it."""
         # Prune to just the ingroup
@@ -629,55 +1607,221 @@ class NexsonTreeWrapper(object):
         elif self._ingroup_node_id != self.root_node_id:
             self._do_prune_to_ingroup()
             self.root_node_id = self._ingroup_node_id
-        else:
+        elif self.logger_msg_obj is not None:
             self.logger_msg_obj.debug('Ingroup node is root.')
         return self.root_node_id
 
-    def prune_edge_and_rootward(self, edge_to_del):
-        while edge_to_del is not None:
-            source_id, target_id = self._del_edge(edge_to_del)
-            ebsd = self._edge_by_source.get(source_id)
-            if ebsd:
-                to_prune = list(ebsd.values())  # will modify ebsd in loop below, so shallow copy
-                for edge in to_prune:
-                    self.prune_edge_and_tipward(edge)
-                assert source_id not in self._edge_by_source
-            edge_to_del = self._edge_by_target.get(source_id)
+    @property
+    def by_ott_id(self):
+        if self._by_ott_id is None:
+            self._by_ott_id = self.group_and_sort_leaves_by_ott_id()
+        return self._by_ott_id
 
-    def prune_edge_and_tipward(self, edge):
-        source_id, target_id = self._del_edge(edge)
-        self.prune_clade(target_id)
+    def prune_unmapped_leaves(self):
+        # Leaf nodes with no OTT ID at all...
+        if None in self.by_ott_id:
+            self.prune_tip_in_sortable_list(self.by_ott_id[None], 'unmapped_otu')
+            del self.by_ott_id[None]
 
-    def prune_clade(self, node_id):
-        """Prune `node_id` and the edges and nodes that are tipward of it.
-        Caller must delete the edge to node_id."""
-        to_del_nodes = [node_id]
-        while bool(to_del_nodes):
-            node_id = to_del_nodes.pop(0)
-            self._flag_node_as_del_and_del_in_by_target(node_id)
-            ebsd = self._edge_by_source.get(node_id)
-            if ebsd is not None:
-                child_edges = list(ebsd.values())
-                to_del_nodes.extend([i['@target'] for i in child_edges])
-                del self._edge_by_source[
-                    node_id]  # deletes all of the edges out of this node (still held in edge_by_target til children are encountered)
+    def prune_tip_in_sortable_list(self, sortable_list, reason):
+        try:
+            par_to_check = set()
+            for sortable_el in sortable_list:
+                node_id = sortable_el[1]
+                par_to_check.add(self._del_tip(node_id))
+                self.nodes_deleted.add(node_id)
+        finally:
+            self._log_deletions(reason)
+        self.prune_if_deg_too_low(par_to_check)
 
-    def _flag_node_as_del_and_del_in_by_target(self, node_id):
-        """Flags a node as deleted, and removes it from the _edge_by_target (and parent's edge_by_source), if it is still found there.
-        Does NOT remove the node's entries from self._edge_by_source."""
-        self.nodes_deleted.add(node_id)
-        etp = self._edge_by_target.get(node_id)
-        if etp is not None:
-            del self._edge_by_target[node_id]
+    prune_ott_problem_leaves = prune_tip_in_sortable_list
 
-    def _del_edge(self, edge_to_del):
-        edge_id = edge_to_del['@id']
-        target_id = edge_to_del['@target']
-        source_id = edge_to_del['@source']
-        del self._edge_by_target[target_id]
-        ebsd = self._edge_by_source[source_id]
-        del ebsd[edge_id]
-        if not ebsd:
+    def prune_ott_problem_leaves_by_id(self, ott_id, reason):
+        self.prune_ott_problem_leaves(self.by_ott_id[ott_id], reason)
+        del self.by_ott_id[ott_id]
+
+    def prune_tree_for_supertree(self,
+                                 ott,
+                                 to_prune_fsi_set,
+                                 root_ott_id,
+                                 taxonomy_treefile=None,
+                                 id_to_other_prune_reason=None):
+        """
+        `ott` is an OTTIndex and `to_prune_fsi_set` the union of the flags
+            (from `ott.convert_flag_string_set_to_union`) to be pruned.
+        """
+        if id_to_other_prune_reason is None:
+            id_to_other_prune_reason = {}
+        self.prune_to_ingroup()
+        self.prune_unmapped_leaves()
+        other_pruned = set()
+        if id_to_other_prune_reason:
+            id2p = set(id_to_other_prune_reason.keys()).intersection(set(self.by_ott_id.keys()))
+            for ott_id in id2p:
+                reason = id_to_other_prune_reason[ott_id]
+                self.prune_ott_problem_leaves_by_id(ott_id, reason)
+        # Check the stored OTT Ids against the current version of OTT
+        mapped, unrecog, forward2unrecog, pruned, above_root, old2new = ott.map_ott_ids(self.by_ott_id.keys(),
+                                                                                        to_prune_fsi_set, root_ott_id)
+        for ott_id in unrecog:
+            self.prune_ott_problem_leaves_by_id(ott_id, 'unrecognized_ott_id')
+        for ott_id in forward2unrecog:
+            self.prune_ott_problem_leaves_by_id(ott_id, 'forwarded_to_unrecognized_ott_id')
+        for ott_id in pruned:
+            self.prune_ott_problem_leaves_by_id(ott_id, 'flagged')
+        for ott_id in above_root:
+            self.prune_ott_problem_leaves_by_id(ott_id, 'above_root')
+        for old_id, new_id in old2new.items():
+            old_node_list = self.by_ott_id[old_id]
+            del self.by_ott_id[old_id]
+            if new_id in self.by_ott_id:
+                v = self.by_ott_id[new_id]
+                v.extend(old_node_list)
+                v.sort() # I think only the last step requires sorting (NEED to check that,
+                         # If so, we could move this sort to that point to avoid multiple sortings.
+            else:
+                self.by_ott_id[new_id] = old_node_list
+            for sortable_el in old_node_list:
+                otu = sortable_el[3]
+                assert otu['^ot:ottId'] == old_id
+                otu['^ot:ottId'] = new_id
+                assert '^ot:ottTaxonName' in otu
+                otu['^ot:ottTaxonName'] = ott.get_name(new_id)
+        lost_tips = set(unrecog)
+        lost_tips.update(forward2unrecog)
+        lost_tips.update(pruned)
+        lost_tips.update(other_pruned)
+        assert self.root_node_id
+        if not mapped:
+            if self.logger_msg_obj is not None:
+                self.logger_msg_obj.debug('No OTT Ids of the tree map to the taxonomy')
+            raise EmptyTreeError()
+        if taxonomy_treefile is not None:
+            with codecs.open(taxonomy_treefile, 'w', encoding='utf-8') as tto:
+                ott.write_induced_newick(tto, mapped)
+        # look for leaves mapped to ancestors of other leaves
+        containing = ott.ids_containing_other_ids(mapped)
+        taxon_contains_other_ott_ids = []
+        to_retain = []
+        for ott_id in self.by_ott_id:
+            if ott_id in lost_tips:
+                continue
+            n = old2new.get(ott_id)
+            if n is None:
+                n = ott_id
+            if n in containing:
+                # nd must be an internal node.
+                #   given that the descendants of this node are mapped in a more specific
+                #   way, we will prune this ott_id from the tree
+                taxon_contains_other_ott_ids.append(ott_id)
+            else:
+                to_retain.append(ott_id)
+
+        for ott_id in taxon_contains_other_ott_ids:
+            self.prune_ott_problem_leaves_by_id(ott_id, 'mapped_to_taxon_containing_other_mapped_tips')
+        # finally, we walk through any ott_id's mapped to multiple nodes
+        for ott_id in to_retain:
+            nm = self.by_ott_id[ott_id]
+            if len(nm) > 1:
+                el = nm.pop(0)
+                reason = 'replaced_by_exemplar_node' if (el[0] == -1) else 'replaced_by_arbitrary_node'
+                self.prune_ott_problem_leaves_by_id(ott_id, reason)
+        return self
+
+class NexsonTreeWrapper(_PrunableNexsonTree):
+    def __init__(self, nexson, tree_id, log_obj=None, logger_msg_obj=None):
+        _PrunableNexsonTree.__init__(self, nexson, tree_id,
+                                     log_obj=log_obj,
+                                     logger_msg_obj=logger_msg_obj)
+        self._edge_by_source = self.tree['edgeBySourceId']
+        self._node_by_id = self.tree['nodeById']
+        self._root_node_id = None
+        self.root_node_id = self.tree['^ot:rootNodeId']
+        assert self.root_node_id
+        for k, v in self._node_by_id.items():
+            v['@id'] = k
+        self._edge_by_target = self._create_edge_by_target()
+
+    def get_root_node_id(self):
+        return self._root_node_id
+
+    def set_root_node_id(self, r):
+        try:
+            assert r
+            assert r in self._edge_by_source
+            assert r in self._node_by_id
+        except:
+            error('Illegal root node "{}"'.format(r))
+            raise
+        self._root_node_id = r
+
+    root_node_id = property(get_root_node_id, set_root_node_id)
+
+    def _create_edge_by_target(self):
+        """creates a edge_by_target dict with the same edge objects as the edge_by_source.
+        Also adds an '@id' field to each edge."""
+        ebt = {}
+        for edge_dict in self._edge_by_source.values():
+            for edge_id, edge in edge_dict.items():
+                target_id = edge['@target']
+                edge['@id'] = edge_id
+                assert target_id not in ebt
+                ebt[target_id] = edge
+        # _check_rev_dict(self._tree, ebt)
+        return ebt
+
+    def _do_prune_to_ingroup(self):
+        edge_to_del = self._edge_by_target.get(self._ingroup_node_id)
+        if edge_to_del is None:
+            return
+        try:
+            self.prune_edge_and_rootward(edge_to_del)
+        finally:
+            self._log_deletions('outgroup')
+
+    def prune_edge_and_rootward(self, edge_to_del):
+        while edge_to_del is not None:
+            source_id, target_id = self._del_edge(edge_to_del)
+            ebsd = self._edge_by_source.get(source_id)
+            if ebsd:
+                to_prune = list(ebsd.values())  # will modify ebsd in loop below, so shallow copy
+                for edge in to_prune:
+                    self.prune_edge_and_tipward(edge)
+                assert source_id not in self._edge_by_source
+            edge_to_del = self._edge_by_target.get(source_id)
+
+    def prune_edge_and_tipward(self, edge):
+        source_id, target_id = self._del_edge(edge)
+        self.prune_clade(target_id)
+
+    def prune_clade(self, node_id):
+        """Prune `node_id` and the edges and nodes that are tipward of it.
+        Caller must delete the edge to node_id."""
+        to_del_nodes = deque([node_id])
+        while to_del_nodes:
+            node_id = to_del_nodes.popleft()
+            self._flag_node_as_del_and_del_in_by_target(node_id)
+            # deletes all of the edges out of this node (still held in edge_by_target til children are encountered)
+            ebsd = self._edge_by_source.pop(node_id, None)
+            if ebsd is not None:
+                to_del_nodes.extend([i['@target'] for i in ebsd.values()])
+
+    def _flag_node_as_del_and_del_in_by_target(self, node_id):
+        """Flags a node as deleted, and removes it from the _edge_by_target (and parent's edge_by_source), if it is still found there.
+        Does NOT remove the node's entries from self._edge_by_source."""
+        self.nodes_deleted.add(node_id)
+        etp = self._edge_by_target.get(node_id)
+        if etp is not None:
+            del self._edge_by_target[node_id]
+
+    def _del_edge(self, edge_to_del):
+        edge_id = edge_to_del['@id']
+        target_id = edge_to_del['@target']
+        source_id = edge_to_del['@source']
+        del self._edge_by_target[target_id]
+        ebsd = self._edge_by_source[source_id]
+        del ebsd[edge_id]
+        if not ebsd:
             del self._edge_by_source[source_id]
         self.edges_deleted.add(edge_id)
         return source_id, target_id
@@ -719,31 +1863,6 @@ class NexsonTreeWrapper(object):
             v.sort()
         return ott_id_to_sortable_list
 
-    @property
-    def by_ott_id(self):
-        if self._by_ott_id is None:
-            self._by_ott_id = self.group_and_sort_leaves_by_ott_id()
-        return self._by_ott_id
-
-    def prune_unmapped_leaves(self):
-        # Leaf nodes with no OTT ID at all...
-        if None in self.by_ott_id:
-            self.prune_tip_in_sortable_list(self.by_ott_id[None], 'unmapped_otu')
-            del self.by_ott_id[None]
-
-    def prune_tip_in_sortable_list(self, sortable_list, reason):
-        try:
-            par_to_check = set()
-            for sortable_el in sortable_list:
-                node_id = sortable_el[1]
-                par_to_check.add(self._del_tip(node_id))
-                self.nodes_deleted.add(node_id)
-        finally:
-            self._log_deletions(reason)
-        self.prune_if_deg_too_low(par_to_check)
-
-    prune_ott_problem_leaves = prune_tip_in_sortable_list
-
     def prune_if_deg_too_low(self, ind_nd_id_list):
         try:
             orphaned_root = None
@@ -803,99 +1922,316 @@ class NexsonTreeWrapper(object):
             new_root = edge['@target']
             self._del_tip(new_root)
 
-    def prune_ott_problem_leaves_by_id(self, ott_id, reason):
-        self.prune_ott_problem_leaves(self.by_ott_id[ott_id], reason)
-        del self.by_ott_id[ott_id]
-
-    def prune_tree_for_supertree(self,
-                                 ott,
-                                 to_prune_fsi_set,
-                                 root_ott_id,
-                                 taxonomy_treefile=None,
-                                 id_to_other_prune_reason=None):
-        """
-        `to_prune_fsi_set` is a set of flag indices to be pruned.
-        """
-        if id_to_other_prune_reason is None:
-            id_to_other_prune_reason = {}
-        self.prune_to_ingroup()
-        self.prune_unmapped_leaves()
-        other_pruned = set()
-        if id_to_other_prune_reason:
-            id2p = set(id_to_other_prune_reason.keys()).intersection(set(self.by_ott_id.keys()))
-            for ott_id in id2p:
-                reason = id_to_other_prune_reason[ott_id]
-                self.prune_ott_problem_leaves_by_id(ott_id, reason)
-        # Check the stored OTT Ids against the current version of OTT
-        mapped, unrecog, forward2unrecog, pruned, above_root, old2new = ott.map_ott_ids(self.by_ott_id.keys(),
-                                                                                        to_prune_fsi_set, root_ott_id)
-        for ott_id in unrecog:
-            self.prune_ott_problem_leaves_by_id(ott_id, 'unrecognized_ott_id')
-        for ott_id in forward2unrecog:
-            self.prune_ott_problem_leaves_by_id(ott_id, 'forwarded_to_unrecognized_ott_id')
-        for ott_id in pruned:
-            self.prune_ott_problem_leaves_by_id(ott_id, 'flagged')
-        for ott_id in above_root:
-            self.prune_ott_problem_leaves_by_id(ott_id, 'above_root')
-        for old_id, new_id in old2new.items():
-            old_node_list = self.by_ott_id[old_id]
-            del self.by_ott_id[old_id]
-            if new_id in self.by_ott_id:
-                v = self.by_ott_id[new_id]
-                v.extend(old_node_list)
-                v.sort() # I think only the last step requires sorting (NEED to check that,
-                         # If so, we could move this sort to that point to avoid multiple sortings.
-            else:
-                self.by_ott_id[new_id] = old_node_list
-            for sortable_el in old_node_list:
-                otu = sortable_el[3]
-                assert otu['^ot:ottId'] == old_id
-                otu['^ot:ottId'] = new_id
-                assert '^ot:ottTaxonName' in otu
-                otu['^ot:ottTaxonName'] = ott.get_name(new_id)
-        lost_tips = set(unrecog)
-        lost_tips.update(forward2unrecog)
-        lost_tips.update(pruned)
-        lost_tips.update(other_pruned)
-        # Get the induced tree...
+    def write_newick(self, outp):
+        nexson_frag_write_newick(outp,
+                                 self._edge_by_source,
+                                 self._node_by_id,
+                                 self.otus,
+                                 label_key=compose_newick_label,
+                                 leaf_labels=None,
+                                 root_id=self.root_node_id,
+                                 ingroup_id=None,
+                                 bracket_ingroup=False,
+                                 with_edge_lengths=False)
+
+class CompactNexsonTree(_PrunableNexsonTree):
+    """Array-backed alternative to NexsonTreeWrapper.
+
+    The topology is converted once into integer-indexed parent, first-child,
+    last-child, next-sibling and previous-sibling arrays. Children are kept
+    in the order of the NexSON edges, so the newicks match NexsonTreeWrapper's. The NexSON node and edge dicts
+    are not modified (no "@id" injection, no edge_by_target dict), and the
+    deletion logs are the same as NexsonTreeWrapper's.
+    Index -1 means "no such node".
+    """
+    def __init__(self, nexson, tree_id, log_obj=None, logger_msg_obj=None):
+        _PrunableNexsonTree.__init__(self, nexson, tree_id,
+                                     log_obj=log_obj,
+                                     logger_msg_obj=logger_msg_obj)
+        node_by_id = self.tree['nodeById']
+        self._node_ids = list(node_by_id.keys())
+        self._index = {nd_id: i for i, nd_id in enumerate(self._node_ids)}
+        n = len(self._node_ids)
+        self._parent = array('l', [-1]) * n
+        self._first_child = array('l', [-1]) * n
+        self._last_child = array('l', [-1]) * n
+        self._next_sib = array('l', [-1]) * n
+        self._prev_sib = array('l', [-1]) * n
+        self._num_children = array('l', [0]) * n
+        self._in_edge_id = [None] * n
+        # the targets in the order of NexsonTreeWrapper._edge_by_target
+        self._edge_target_order = array('l')
+        index = self._index
+        for source_id, edge_dict in self.tree['edgeBySourceId'].items():
+            si = index[source_id]
+            for edge_id, edge in edge_dict.items():
+                ti = index[edge['@target']]
+                assert self._parent[ti] == -1
+                self._in_edge_id[ti] = edge_id
+                self._edge_target_order.append(ti)
+                self._attach(si, ti)
+        self._root = -1
+        self.root_node_id = self.tree['^ot:rootNodeId']
         assert self.root_node_id
+
+    def get_root_node_id(self):
+        if self._root == -1:
+            return None
+        return self._node_ids[self._root]
+
+    def set_root_node_id(self, r):
+        i = self._index.get(r) if r else None
+        if i is None or self._num_children[i] == 0:
+            raise ValueError('Illegal root node "{}"'.format(r))
+        self._root = i
+
+    root_node_id = property(get_root_node_id, set_root_node_id)
+
+    def _attach(self, par, child):
+        """Makes `child` the last child of `par` (as adding an edge to a NexSON
+        edgeBySourceId dict would)."""
+        old_last = self._last_child[par]
+        self._prev_sib[child] = old_last
+        self._next_sib[child] = -1
+        if old_last == -1:
+            self._first_child[par] = child
+        else:
+            self._next_sib[old_last] = child
+        self._last_child[par] = child
+        self._parent[child] = par
+        self._num_children[par] += 1
+
+    def _detach(self, child):
+        par = self._parent[child]
+        prev_sib, next_sib = self._prev_sib[child], self._next_sib[child]
+        if prev_sib == -1:
+            self._first_child[par] = next_sib
+        else:
+            self._next_sib[prev_sib] = next_sib
+        if next_sib == -1:
+            self._last_child[par] = prev_sib
+        else:
+            self._prev_sib[next_sib] = prev_sib
+        self._num_children[par] -= 1
+        self._parent[child] = -1
+        self._next_sib[child] = -1
+        self._prev_sib[child] = -1
+        return par
+
+    def _children(self, par):
+        c = self._first_child[par]
+        while c != -1:
+            yield c
+            c = self._next_sib[c]
+
+    def _del_edge_into(self, child):
+        """Deletes (and logs) the edge from `child` to its parent. Returns the parent."""
+        self.edges_deleted.add(self._in_edge_id[child])
+        return self._detach(child)
+
+    def _del_tip_ind(self, nd):
+        self.nodes_deleted.add(self._node_ids[nd])
+        assert self._parent[nd] != -1
+        return self._del_edge_into(nd)
+
+    def _del_tip(self, node_id):
+        """Assumes that `node_id` has no children. Returns the ID of its former parent."""
+        return self._node_ids[self._del_tip_ind(self._index[node_id])]
+
+    def _do_prune_to_ingroup(self):
+        ingroup = self._index.get(self._ingroup_node_id)
+        if ingroup is None or self._parent[ingroup] == -1:
+            return
         try:
-            ott_tree = ott.induced_tree(mapped, create_monotypic_nodes=True)
-        except SpikeTreeError:
-            error('SpikeTreeError from mapped ott_id list = {}'.format(', '.join([str(i) for i in mapped])))
-            raise EmptyTreeError()
-        if taxonomy_treefile is not None:
-            with codecs.open(taxonomy_treefile, 'w', encoding='utf-8') as tto:
-                ott_tree.write_newick(tto)
-        # ... so that we can look for leaves mapped to ancestors of other leaves
-        taxon_contains_other_ott_ids = []
-        to_retain = []
-        for ott_id in self.by_ott_id:
-            if ott_id in lost_tips:
+            nd = ingroup
+            while self._parent[nd] != -1:
+                par = self._del_edge_into(nd)
+                for sib in list(self._children(par)):
+                    self._del_edge_into(sib)
+                    self._prune_clade_ind(sib)
+                nd = par
+        finally:
+            self._log_deletions('outgroup')
+
+    def prune_clade(self, node_id):
+        """Prune `node_id` and the edges and nodes that are tipward of it.
+        Caller must delete the edge to node_id."""
+        self._prune_clade_ind(self._index[node_id])
+
+    def _prune_clade_ind(self, nd):
+        # As in NexsonTreeWrapper, the edges within the clade are not logged
+        to_del = [nd]
+        while to_del:
+            nd = to_del.pop()
+            self.nodes_deleted.add(self._node_ids[nd])
+            c = self._first_child[nd]
+            while c != -1:
+                to_del.append(c)
+                self._parent[c] = -1
+                c = self._next_sib[c]
+            self._first_child[nd] = -1
+            self._last_child[nd] = -1
+            self._num_children[nd] = 0
+
+    def group_and_sort_leaves_by_ott_id(self):
+        """See NexsonTreeWrapper.group_and_sort_leaves_by_ott_id"""
+        node_by_id = self.tree['nodeById']
+        ott_id_to_sortable_list = defaultdict(list)
+        # same order of the ott_ids as NexsonTreeWrapper, which affects the pruning logs
+        for nd in self._edge_target_order:
+            if self._parent[nd] == -1 or self._num_children[nd] != 0:
                 continue
-            n = old2new.get(ott_id)
-            if n is None:
-                n = ott_id
-            nd = ott_tree.find_node(n)
-            assert nd is not None
-            if nd.children:
-                # nd must be an internal node.
-                #   given that the descendants of this node are mapped in a more specific
-                #   way, we will prune this ott_id from the tree
-                taxon_contains_other_ott_ids.append(ott_id)
-            else:
-                to_retain.append(ott_id)
+            node_id = self._node_ids[nd]
+            node_obj = node_by_id[node_id]
+            otu_obj = self.otus[node_obj['@otu']]
+            ott_id = otu_obj.get('^ot:ottId')
+            int_is_exemplar = -1 if node_obj.get('^ot:isTaxonExemplar', False) else 0
+            ott_id_to_sortable_list[ott_id].append((int_is_exemplar, node_id, node_obj, otu_obj))
+        for v in ott_id_to_sortable_list.values():
+            v.sort()
+        return ott_id_to_sortable_list
 
-        for ott_id in taxon_contains_other_ott_ids:
-            self.prune_ott_problem_leaves_by_id(ott_id, 'mapped_to_taxon_containing_other_mapped_tips')
-        # finally, we walk through any ott_id's mapped to multiple nodes
-        for ott_id in to_retain:
-            nm = self.by_ott_id[ott_id]
-            if len(nm) > 1:
-                el = nm.pop(0)
-                reason = 'replaced_by_exemplar_node' if (el[0] == -1) else 'replaced_by_arbitrary_node'
-                self.prune_ott_problem_leaves_by_id(ott_id, reason)
-        return self
+    def prune_if_deg_too_low(self, ind_nd_id_list):
+        try:
+            orphaned_root = None
+            # Sets of NexSON IDs (not of indices), so that they are visited in the
+            #   same order as in NexsonTreeWrapper. That order decides where the
+            #   children of suppressed nodes end up among their new siblings.
+            index, node_ids = self._index, self._node_ids
+            while bool(ind_nd_id_list):
+                next_ind_nd_id_list = set()
+                for nd_id in ind_nd_id_list:
+                    nd = index[nd_id]
+                    out_degree = self._num_children[nd]
+                    if out_degree < 2:
+                        par = self._parent[nd]
+                        if par != -1:
+                            next_ind_nd_id_list.add(node_ids[par])
+                            if out_degree == 1:
+                                self._suppress_deg_one_node(nd)
+                            else:
+                                self._del_tip_ind(nd)
+                            next_ind_nd_id_list.discard(nd_id)
+                        else:
+                            assert (orphaned_root is None) or (orphaned_root == nd)
+                            orphaned_root = nd
+                ind_nd_id_list = next_ind_nd_id_list
+            if orphaned_root is not None:
+                new_root = node_ids[self._prune_deg_one_root(orphaned_root)]
+                if self._log_obj is not None:
+                    self._log_obj['revised_ingroup_node'] = new_root
+                self.root_node_id, self._ingroup_node_id = new_root, new_root
+        finally:
+            self._log_deletions('became_trivial')
+
+    def suppress_deg_one_node(self, node_id):
+        """Deletes node_id (an out-degree=1 node) and the edge to its parent.
+        The edge to its child is moved to the parent."""
+        self._suppress_deg_one_node(self._index[node_id])
+
+    def _suppress_deg_one_node(self, nd):
+        child = self._first_child[nd]
+        par = self._parent[nd]
+        self._detach(child)
+        self._attach(par, child)
+        self._del_tip_ind(nd)
+
+    def _prune_deg_one_root(self, new_root):
+        while True:
+            nc = self._num_children[new_root]
+            if nc == 0:
+                self.is_empty = True
+                raise EmptyTreeError()
+            if nc > 1:
+                return new_root
+            new_root = self._first_child[new_root]
+            self._del_tip_ind(new_root)
+
+    def write_newick(self, outp):
+        # Only the surviving edges are materialized as NexSON-style dicts, so
+        #   that the labels and quoting match NexsonTreeWrapper's newick.
+        edge_by_source = {}
+        to_visit = [self._root]
+        while to_visit:
+            par = to_visit.pop()
+            if self._first_child[par] == -1:
+                continue
+            par_id = self._node_ids[par]
+            d = {}
+            edge_by_source[par_id] = d
+            for c in self._children(par):
+                d[self._in_edge_id[c]] = {'@source': par_id, '@target': self._node_ids[c]}
+                to_visit.append(c)
+        nexson_frag_write_newick(outp,
+                                 edge_by_source,
+                                 self.tree['nodeById'],
+                                 self.otus,
+                                 label_key=compose_newick_label,
+                                 leaf_labels=None,
+                                 root_id=self.root_node_id,
+                                 ingroup_id=None,
+                                 bracket_ingroup=False,
+                                 with_edge_lengths=False)
+
+# maps the tree_engine config setting to the class used to clean phylo inputs
+TREE_ENGINES = {'nexson': NexsonTreeWrapper,
+                'compact': CompactNexsonTree,
+                }
+
+def read_nexson_for_tree(fp, tree_id):
+    """Returns a NexSON blob with just the parts of the study in `fp` needed to clean `tree_id`.
+
+    If the optional ijson package is installed, the file is parsed as a stream
+    of events, and only the tree, the OTU groups, the "externalTrees" list and
+    the scalar properties of the "nexml" element are built into python objects.
+    So the other trees of the study are never built, but every OTU group is
+    (the groups that the tree does not use are dropped after the parse).
+    Without ijson, the whole file is read with read_as_json.
+    """
+    try:
+        from ijson import parse as ijson_parse
+        from ijson.common import ObjectBuilder
+    except ImportError:
+        return read_as_json(fp)
+    otus_pref, trees_pref = 'nexml.otusById.', 'nexml.treesById.'
+    tree_suffix = '.treeById.' + tree_id
+    nexml, otus_by_id, trees_by_id = {}, {}, {}
+    builder, build_prefix, dest = None, None, None
+    with open(fp, 'rb') as inp:
+        for prefix, event, value in ijson_parse(inp, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == build_prefix and event in ('end_map', 'end_array'):
+                    dest[0][dest[1]] = builder.value
+                    builder = None
+                continue
+            depth = prefix.count('.')
+            if event in ('start_map', 'start_array'):
+                if prefix == 'nexml.externalTrees':
+                    dest = (nexml, 'externalTrees')
+                elif depth == 3 and prefix.startswith(otus_pref) and prefix.endswith('.otuById'):
+                    og_id = prefix[len(otus_pref):-len('.otuById')]
+                    dest = (otus_by_id.setdefault(og_id, {}), 'otuById')
+                elif depth == 4 + tree_id.count('.') and prefix.startswith(trees_pref) \
+                     and prefix.endswith(tree_suffix):
+                    tg_id = prefix[len(trees_pref):-len(tree_suffix)]
+                    dest = (trees_by_id.setdefault(tg_id, {}).setdefault('treeById', {}), tree_id)
+                else:
+                    continue
+                builder, build_prefix = ObjectBuilder(), prefix
+                builder.event(event, value)
+            elif event in ('map_key', 'end_map', 'end_array'):
+                continue
+            elif depth == 1 and prefix.startswith('nexml.'):
+                nexml[prefix[len('nexml.'):]] = value
+            elif depth == 3 and prefix.startswith(trees_pref) and prefix.endswith('.@otus'):
+                tg_id = prefix[len(trees_pref):-len('.@otus')]
+                trees_by_id.setdefault(tg_id, {})['@otus'] = value
+    trees_by_id = {k: v for k, v in trees_by_id.items() if 'treeById' in v}
+    used_otus = set([v.get('@otus') for v in trees_by_id.values()])
+    nexml['otusById'] = {k: v for k, v in otus_by_id.items() if k in used_otus}
+    nexml['treesById'] = trees_by_id
+    return {'nexml': nexml}
 
 def find_tree_and_otus_in_nexson(nexson, tree_id):
     tl = extract_tree_nexson(nexson, tree_id)
@@ -940,6 +2276,21 @@ def generate_newicks_for_external_trees(external_trees,
     nonempty_out_fp.extend(to_add)
     return True
 
+def _normalize_cleaning_args(cleaning_flags, root_ott_id):
+    if (root_ott_id is not None) and (not is_int_type(root_ott_id)):
+        root_ott_id = int(root_ott_id)
+    if cleaning_flags is None:
+        cleaning_flags = OTT.TREEMACHINE_SUPPRESS_FLAGS
+    return cleaning_flags, root_ott_id
+
+def _study_tree_for_nexson_fp(inp):
+    """Returns the file name of `inp` without extension (e.g. "tree_ot_1@tree2")."""
+    inp_fn = os.path.split(inp)[-1]
+    return '.'.join(inp_fn.split('.')[:-1])
+
+def _tag_for_study_tree(study_tree):
+    return study_tree[len('tree_'):] if study_tree.startswith('tree_') else study_tree
+
 def clean_phylo_input(ott_dir,
                       study_tree_pairs,
                       tree_filepaths,
@@ -949,10 +2300,287 @@ def clean_phylo_input(ott_dir,
                       root_ott_id,
                       script_managed_dir,
                       nonempty_out_fp,
+                      num_workers=1,
+                      blob_shas_fp=None,
+                      cache_dir=None,
                       CFG=None):
-    """Returns True if any files are written or deleted."""
+    """Returns True if any files are written or deleted.
+
+    If `num_workers` > 1, the trees are cleaned by a pool of processes.
+    The output is the same as the serial path's.
+    If `cache_dir` is not None, trees that were cleaned with the same settings
+        before are restored from a CleanedPhyloCache in that directory, rather
+        than being cleaned again. `blob_shas_fp` is the list of git object SHAs
+        that parallels the `study_tree_pairs` file.
+    """
     par_inp = os.path.split(output_dir)[0]
     inp_files = [os.path.join(par_inp, i) for i in tree_filepaths]
+    cleaning_flags, root_ott_id = _normalize_cleaning_args(cleaning_flags, root_ott_id)
+    results = [None] * len(inp_files)
+    cache, cache_keys, sha_by_tag = None, {}, {}
+    if cache_dir:
+        cache = CleanedPhyloCache(cache_dir, ott_dir, cleaning_flags, root_ott_id,
+                                  pruned_from_ott_json_fp=pruned_from_ott_json_fp,
+                                  CFG=CFG)
+        if blob_shas_fp:
+            sha_by_tag = read_blob_shas_by_tag(study_tree_pairs, blob_shas_fp)
+    to_clean = []
+    for ind, inp in enumerate(inp_files):
+        if cache is not None:
+            study_tree = _study_tree_for_nexson_fp(inp)
+            key = cache.key(inp, sha_by_tag.get(_tag_for_study_tree(study_tree)))
+            restored = cache.restore(key, output_dir, study_tree)
+            if restored is not None:
+                results[ind] = restored
+                continue
+            cache_keys[ind] = key
+        to_clean.append(inp)
+    if to_clean:
+        to_prune_for_reasons = read_pruned_from_ott_json(pruned_from_ott_json_fp)
+        flags = [i.strip() for i in cleaning_flags.split(',') if i.strip()]
+        ott = open_ott_index(ott_dir, CFG=CFG)
+        to_prune_fsi_set = ott.convert_flag_string_set_to_union(flags)
+        if num_workers > 1 and len(to_clean) > 1:
+            cleaned = _clean_phylo_inputs_in_pool(num_workers,
+                                                  output_dir,
+                                                  to_clean,
+                                                  ott,
+                                                  to_prune_fsi_set,
+                                                  root_ott_id,
+                                                  to_prune_for_reasons,
+                                                  CFG)
+        else:
+            cleaned = [clean_one_phylo_input(output_dir,
+                                             inp,
+                                             ott,
+                                             to_prune_fsi_set,
+                                             root_ott_id,
+                                             to_prune_for_reasons,
+                                             CFG) for inp in to_clean]
+        cleaned = iter(cleaned)
+        for ind, inp in enumerate(inp_files):
+            if results[ind] is None:
+                results[ind] = next(cleaned)
+                if cache is not None:
+                    cache.store(cache_keys[ind], output_dir, _study_tree_for_nexson_fp(inp), results[ind])
+    if cache is not None:
+        cache.report()
+    external_trees = []
+    touched = False
+    all_newick_fps = []
+    for t_et_nfp in results:
+        touched_one, et_pair, newick_fp = t_et_nfp
+        if et_pair:
+            external_trees.append(et_pair)
+        if newick_fp:
+            all_newick_fps.append(newick_fp)
+        if touched_one:
+            touched = True
+    if generate_newicks_for_external_trees(external_trees,
+                                           ott_dir,
+                                           root_ott_id,
+                                           cleaning_flags,
+                                           output_dir,
+                                           script_managed_dir,
+                                           all_newick_fps,
+                                           CFG=CFG):
+        touched = True
+    with open(nonempty_out_fp, "w") as neop:
+        neop.write('{}\n'.format('\n'.join(all_newick_fps)))
+    return touched
+
+def clean_phylo_input_for_tag(ott_dir,
+                              nexson_fp,
+                              output_dir,
+                              cleaning_flags,
+                              pruned_from_ott_json_fp,
+                              root_ott_id,
+                              script_managed_dir,
+                              stamp_fp,
+                              blob_sha=None,
+                              cache_dir=None,
+                              CFG=None):
+    """Cleans the single tree in `nexson_fp` (used by the per-tree rules).
+
+    Writes the path to the cleaned newick (or an empty line if the tree was
+    pruned to nothing) to `stamp_fp`; the paths of newicks of external trees
+    start with _EXTERNAL_STAMP_PREFIX (see gather_cleaned_phylo_stamps).
+    The timestamp of `stamp_fp` is updated if the cleaned tree changed, even
+    if its path did not.
+    Returns True if the cleaned tree was written or deleted.
+    """
+    cleaning_flags, root_ott_id = _normalize_cleaning_args(cleaning_flags, root_ott_id)
+    study_tree = _study_tree_for_nexson_fp(nexson_fp)
+    result, cache = None, None
+    if cache_dir:
+        cache = CleanedPhyloCache(cache_dir, ott_dir, cleaning_flags, root_ott_id,
+                                  pruned_from_ott_json_fp=pruned_from_ott_json_fp,
+                                  CFG=CFG)
+        key = cache.key(nexson_fp, blob_sha)
+        result = cache.restore(key, output_dir, study_tree)
+    if result is None:
+        flags = [i.strip() for i in cleaning_flags.split(',') if i.strip()]
+        ott = open_ott_index(ott_dir, CFG=CFG)
+        result = clean_one_phylo_input(output_dir,
+                                       nexson_fp,
+                                       ott,
+                                       ott.convert_flag_string_set_to_union(flags),
+                                       root_ott_id,
+                                       read_pruned_from_ott_json(pruned_from_ott_json_fp),
+                                       CFG)
+        if cache is not None:
+            cache.store(key, output_dir, study_tree, result)
+    touched, et_pair, newick_fp = result
+    newick_fps = [newick_fp] if newick_fp else []
+    if et_pair:
+        external_fps = []
+        if generate_newicks_for_external_trees([et_pair],
+                                               ott_dir,
+                                               root_ott_id,
+                                               cleaning_flags,
+                                               output_dir,
+                                               script_managed_dir,
+                                               external_fps,
+                                               CFG=CFG):
+            touched = True
+        newick_fps.extend([_EXTERNAL_STAMP_PREFIX + i for i in external_fps])
+    content = '{}\n'.format('\n'.join(newick_fps))
+    wrote = write_if_needed(fp=stamp_fp, content=content, CFG=CFG)
+    force_or_touch_file(stamp_fp, touched and not wrote)
+    return touched
+
+_EXTERNAL_STAMP_PREFIX = 'external:'
+
+def gather_cleaned_phylo_stamps(stamp_fps):
+    """Returns the newick paths listed in the stamps of clean_phylo_input_for_tag.
+
+    The newicks of external trees are listed after all of the others, as
+    clean_phylo_input lists them, because the order is the ranking of the inputs.
+    """
+    newick_fps, external_fps = [], []
+    for stamp in stamp_fps:
+        with open(stamp, "r") as inp:
+            for line in inp:
+                ls = line.strip()
+                if not ls:
+                    continue
+                if ls.startswith(_EXTERNAL_STAMP_PREFIX):
+                    external_fps.append(ls[len(_EXTERNAL_STAMP_PREFIX):])
+                else:
+                    newick_fps.append(ls)
+    return newick_fps + external_fps
+
+_CLEANED_PHYLO_CACHE_SUFFIXES = ('.tre', '.json', '-taxonomy.tre')
+# bumped when the cleaning code changes its output for the same settings
+_CLEANED_PHYLO_CACHE_FORMAT = 'ott-index-2'
+
+class CleanedPhyloCache(object):
+    """Content-addressed store of the outputs of clean_one_phylo_input.
+
+    Entries are keyed by the git object SHA of the NexSON (or a digest of its
+    content), the propinquity version, the OTT version, the cleaning flags,
+    the root OTT Id, the tree_engine and the content of the json of OTT Ids
+    pruned for other reasons. Thus an entry is reused (even by another run) only if
+    cleaning the tree again would produce the same files.
+    """
+    def __init__(self,
+                 cache_dir,
+                 ott_dir,
+                 cleaning_flags,
+                 root_ott_id,
+                 pruned_from_ott_json_fp=None,
+                 CFG=None):
+        self.directory = os.path.join(cache_dir, 'cleaned_phylo')
+        self.CFG = CFG
+        with open(os.path.join(ott_dir, 'version.txt'), 'r', encoding='utf-8') as inp:
+            ott_version = inp.read().strip()
+        settings = [__version__,
+                    _CLEANED_PHYLO_CACHE_FORMAT,
+                    ott_version,
+                    canon_sep_string(cleaning_flags),
+                    str(root_ott_id),
+                    getattr(CFG, 'tree_engine', 'nexson')]
+        if pruned_from_ott_json_fp and os.path.exists(pruned_from_ott_json_fp):
+            settings.append(file_digest(pruned_from_ott_json_fp))
+        self._settings = '\n'.join(settings)
+        self.num_hits, self.num_misses = 0, 0
+
+    def key(self, nexson_fp, blob_sha=None):
+        if not blob_sha:
+            blob_sha = 'content:' + file_digest(nexson_fp)
+        h = hashlib.sha1(self._settings.encode('utf-8'))
+        h.update(blob_sha.encode('utf-8'))
+        return h.hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def restore(self, key, output_dir, study_tree):
+        """Copies the cached outputs for `key` into `output_dir`.
+
+        Returns the clean_one_phylo_input-style tuple, or None if `key` is not cached.
+        """
+        entry = self._entry_dir(key)
+        outcome_fp = os.path.join(entry, 'outcome.json')
+        if not os.path.isfile(outcome_fp):
+            self.num_misses += 1
+            return None
+        outcome = read_as_json(outcome_fp)
+        touched = False
+        for suffix in _CLEANED_PHYLO_CACHE_SUFFIXES:
+            src = os.path.join(entry, 'tree' + suffix)
+            dest = os.path.join(output_dir, study_tree + suffix)
+            if os.path.isfile(src):
+                changed = cp_if_needed(src, dest)
+            elif os.path.isfile(dest):
+                os.unlink(dest)
+                changed = True
+            else:
+                changed = False
+            if suffix == '.tre' and changed:
+                touched = True
+        self.num_hits += 1
+        ext_path = outcome.get('external_path')
+        et_pair = None if ext_path is None else (study_tree, ext_path)
+        newick_fp = None
+        if outcome.get('has_newick'):
+            newick_fp = os.path.join(output_dir, study_tree + '.tre')
+        return touched, et_pair, newick_fp
+
+    def store(self, key, output_dir, study_tree, result):
+        """Adds the outputs of clean_one_phylo_input (`result`) for `key` to the cache."""
+        entry = self._entry_dir(key)
+        if os.path.exists(entry):
+            return
+        touched, et_pair, newick_fp = result
+        tmp = '{}.{}.tmp'.format(entry, os.getpid())
+        os.makedirs(tmp)
+        try:
+            for suffix in _CLEANED_PHYLO_CACHE_SUFFIXES:
+                if suffix == '.tre' and not newick_fp:
+                    continue
+                src = os.path.join(output_dir, study_tree + suffix)
+                if os.path.isfile(src):
+                    store_in_cache(src, os.path.join(tmp, 'tree' + suffix), CFG=self.CFG)
+            outcome = {'has_newick': bool(newick_fp),
+                       'external_path': et_pair[1] if et_pair else None}
+            write_as_json(outcome, os.path.join(tmp, 'outcome.json'))
+            os.rename(tmp, entry)
+        except OSError:
+            # most likely another process stored this entry first
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp)
+
+    def report(self):
+        if self.CFG is not None:
+            m = 'cleaned_phylo cache: {} hits, {} misses'
+            self.CFG.info(m.format(self.num_hits, self.num_misses))
+
+def read_pruned_from_ott_json(pruned_from_ott_json_fp):
+    """Returns a dict mapping OTT Id to the reason it was pruned from OTT.
+
+    Any problem reading `pruned_from_ott_json_fp` results in an empty dict.
+    """
     to_prune_for_reasons = {}
     if pruned_from_ott_json_fp is not None:
         try:
@@ -963,44 +2591,66 @@ def clean_phylo_input(ott_dir,
             for reason, id_list in nonflagged_blob.items():
                 for ott_id in id_list:
                     to_prune_for_reasons[ott_id] = reason
-    if (root_ott_id is not None) and (not is_int_type(root_ott_id)):
-        root_ott_id = int(root_ott_id)
-    if cleaning_flags is None:
-        cleaning_flags = OTT.TREEMACHINE_SUPPRESS_FLAGS
-    flags = [i.strip() for i in cleaning_flags.split(',') if i.strip()]
-    ott = OTT(ott_dir=ott_dir)
-    to_prune_fsi_set = ott.convert_flag_string_set_to_union(flags)
-
-    external_trees = []
-    touched = False
-    all_newick_fps = []
-    for inp in inp_files:
-        t_et_nfp = clean_one_phylo_input(output_dir,
-                                         inp,
-                                         ott,
-                                         to_prune_fsi_set,
-                                         root_ott_id,
-                                         to_prune_for_reasons,
-                                         CFG)
-        touched_one, et_pair, newick_fp = t_et_nfp
-        if et_pair:
-            external_trees.append(et_pair)
-        if newick_fp:
-            all_newick_fps.append(newick_fp)
-        if touched_one:
-            touched = True
-    if generate_newicks_for_external_trees(external_trees,
-                                           ott,
-                                           root_ott_id,
-                                           cleaning_flags,
-                                           output_dir,
-                                           script_managed_dir,
-                                           all_newick_fps,
-                                           CFG=CFG):
-        touched = True
-    with open(nonempty_out_fp, "w") as neop:
-        neop.write('{}\n'.format('\n'.join(all_newick_fps)))
-    return touched
+    return to_prune_for_reasons
+
+# Arguments shared by every tree in a cleaning pool. Set in the parent before
+#   the pool is created, so that forked workers inherit them (including the
+#   mmapped OTTIndex and its memoized Id mappings).
+_CLEANING_POOL_ARGS = None
+
+def _init_cleaning_worker(pool_args):
+    global _CLEANING_POOL_ARGS
+    if _CLEANING_POOL_ARGS is None:
+        # not forked: the OTTIndex was pickled, so it is reopened once per worker
+        _CLEANING_POOL_ARGS = pool_args
+
+def _clean_one_phylo_input_in_worker(ind_inp):
+    ind, inp = ind_inp
+    output_dir, ott, to_prune_fsi_set, root_ott_id, to_prune_for_reasons, CFG = _CLEANING_POOL_ARGS
+    return ind, clean_one_phylo_input(output_dir,
+                                      inp,
+                                      ott,
+                                      to_prune_fsi_set,
+                                      root_ott_id,
+                                      to_prune_for_reasons,
+                                      CFG)
+
+def _clean_phylo_inputs_in_pool(num_workers,
+                                output_dir,
+                                inp_files,
+                                ott,
+                                to_prune_fsi_set,
+                                root_ott_id,
+                                to_prune_for_reasons,
+                                CFG):
+    """Cleans each of `inp_files` using a pool of `num_workers` processes.
+
+    Returns the list of clean_one_phylo_input results in the order of `inp_files`.
+    The largest files are dispatched first, so that a big tree does not
+        start last and leave the other workers idle at the end.
+    """
+    global _CLEANING_POOL_ARGS
+    pool_args = (output_dir, ott, to_prune_fsi_set, root_ott_id, to_prune_for_reasons, CFG)
+    by_size = [(-os.path.getsize(inp), ind, inp) for ind, inp in enumerate(inp_files)]
+    by_size.sort()
+    jobs = [(i[1], i[2]) for i in by_size]
+    if 'fork' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('fork')
+        _CLEANING_POOL_ARGS = pool_args
+    else:
+        ctx = multiprocessing.get_context()
+    if CFG is not None:
+        CFG.debug('Cleaning {} trees with {} worker processes'.format(len(jobs), num_workers))
+    results = [None] * len(inp_files)
+    try:
+        with ctx.Pool(processes=num_workers,
+                      initializer=_init_cleaning_worker,
+                      initargs=(None if _CLEANING_POOL_ARGS else pool_args,)) as pool:
+            for ind, res in pool.imap_unordered(_clean_one_phylo_input_in_worker, jobs):
+                results[ind] = res
+    finally:
+        _CLEANING_POOL_ARGS = None
+    return results
 
 def compose_newick_label(node_id, node, otu):
     try:
@@ -1011,7 +2661,7 @@ def compose_newick_label(node_id, node, otu):
 
 def clean_one_phylo_input(output_dir,
                           inp, # file path to NexSON from phylesystem
-                          ott, # OTT object
+                          ott, # OTTIndex
                           to_prune_fsi_set, #OTT flag union
                           root_ott_id, # ID of root
                           to_prune_for_reasons, # ID->reason dict
@@ -1024,7 +2674,7 @@ def clean_one_phylo_input(output_dir,
     inp_fn = os.path.split(inp)[-1]
     study_tree = '.'.join(inp_fn.split('.')[:-1])  # strip extension
     study_id, tree_id = propinquity_fn_to_study_tree(inp_fn)
-    nexson_blob = read_as_json(inp)
+    nexson_blob = read_nexson_for_tree(inp, tree_id)
     nexml_blob = nexson_blob["nexml"]
     if "externalTrees" in nexml_blob:
         et_pair = None
@@ -1035,11 +2685,12 @@ def clean_one_phylo_input(output_dir,
             et_pair = (study_tree, path)
         return False, et_pair, None
     newick_fp = os.path.join(output_dir, study_tree + '.tre')
+    tree_class = TREE_ENGINES[getattr(CFG, 'tree_engine', 'nexson')]
     try:
-        ntw = NexsonTreeWrapper(nexson_blob,
-                                tree_id,
-                                log_obj=log_obj,
-                                logger_msg_obj=CFG)
+        ntw = tree_class(nexson_blob,
+                         tree_id,
+                         log_obj=log_obj,
+                         logger_msg_obj=CFG)
     except MissingTreeError:
         if CFG is not None:
             CFG.warning('No tree "{}" in study "{}"'.format(tree_id, study_id))
@@ -1065,21 +2716,10 @@ def clean_one_phylo_input(output_dir,
         if must_unlink:
             os.unlink(newick_fp)
         return must_unlink, None, None
-    outp = io.StringIO()
-    nexson_frag_write_newick(outp,
-                             ntw._edge_by_source,
-                             ntw._node_by_id,
-                             ntw.otus,
-                             label_key=compose_newick_label,
-                             leaf_labels=None,
-                             root_id=ntw.root_node_id,
-                             ingroup_id=None,
-                             bracket_ingroup=False,
-                             with_edge_lengths=False)
-    outp.write('\n')
-    content = outp.getvalue()
-    touched = write_if_needed(content=content, fp=newick_fp)
-    return touched, None, newick_fp
+    with WriteIfNeeded(newick_fp) as outp:
+        ntw.write_newick(outp)
+        outp.write('\n')
+    return outp.changed, None, newick_fp
 
 def force_or_touch_file(fn, touch=True):
     """Touches fn if touch is True. If touch is False, it will create fn
@@ -1152,6 +2792,8 @@ def _write_bumped_taxonomy(src_ott_dir, bump_json_fp, out_dir, CFG=None):
         infp = os.path.join(src_ott_dir, 'taxonomy.tsv')
         outfp = os.path.join(out_dir, 'taxonomy.tsv')
         needs_taxonomy = False
+        if os.path.lexists(outfp):
+            os.unlink(outfp)  # may be a hardlink to the unbumped taxonomy (made by older versions)
         with codecs.open(infp, 'r', encoding='utf-8') as inp:
             with codecs.open(outfp, 'w', encoding='utf-8') as outp:
                 m = write_modified_taxonomy_tsv(inp, outp, fossil_id_to_parent)
@@ -1193,12 +2835,14 @@ def bump_or_link(src_ott_dir,
                  CFG=None):
     if bumping_of_extinct_req(bump_json_fp):
         _write_bumped_taxonomy(src_ott_dir, bump_json_fp, out_dir, CFG=CFG)
+        log_copy_stats('bumped_ott', CFG=CFG)
         return True
     _cp_missing_taxonomy(src_ott_dir, out_dir, cp_taxonomy_tsv=True, CFG=CFG)
     cp_if_needed(os.path.join(src_ott_dir, 'version.txt'),
                  os.path.join(out_dir, _OTT_VERS_FN),
                  _OTT_VERS_FN,
                  CFG=CFG)
+    log_copy_stats('bumped_ott', CFG=CFG)
 
 def cp_or_suppress_by_flag(ott_dir,
                            flags,
@@ -1233,6 +2877,7 @@ def cp_or_suppress_by_flag(ott_dir,
               ]
     for src, dest in cp_list:
         cp_if_needed(src, dest, os.path.split(src)[-1], CFG=CFG)
+    log_copy_stats('bumped_ott cleaned taxonomy', CFG=CFG)
 
 
 def subset_ott(orig_ott_dir, sub_ott_dir, root_id, CFG):
@@ -1248,6 +2893,134 @@ def subset_ott(orig_ott_dir, sub_ott_dir, root_id, CFG):
                          ofp,
                          cp_taxonomy_tsv=False,
                          CFG=CFG)
+    log_copy_stats('subott_dir', CFG=CFG)
+
+RESOURCE_LOG_FN = 'resource_usage.jsonl'
+# ru_inblock and ru_oublock are counted in 512-byte blocks
+_RUSAGE_BLOCK_BYTES = 512
+
+def _rusage_record(kind, name, wall, ru, failed=False):
+    rec = {'kind': kind,
+           'name': name,
+           'wall_s': round(wall, 3),
+           'failed': failed,
+           'time': time.time()}
+    if ru is not None:
+        rec['user_s'] = round(ru.ru_utime, 3)
+        rec['sys_s'] = round(ru.ru_stime, 3)
+        rec['max_rss_kb'] = ru.ru_maxrss
+        rec['read_bytes'] = ru.ru_inblock * _RUSAGE_BLOCK_BYTES
+        rec['written_bytes'] = ru.ru_oublock * _RUSAGE_BLOCK_BYTES
+    return rec
+
+def append_resource_record(rec, CFG):
+    """Appends `rec` as a line of logs/resource_usage.jsonl."""
+    log_dir = os.path.join(CFG.out_dir, 'logs')
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+    # one short write to a file opened for appending, so concurrent jobs do not interleave lines.
+    with open(os.path.join(log_dir, RESOURCE_LOG_FN), 'a') as outp:
+        outp.write(json.dumps(rec, sort_keys=True) + '\n')
+
+def _call_with_rusage(invocation, stdout=None, stderr=None):
+    """Runs `invocation` and returns (returncode, wall seconds, resource usage of the child or None)."""
+    start_time = time.time()
+    proc = subprocess.Popen(invocation, stdout=stdout, stderr=stderr)
+    if not hasattr(os, 'wait4'):
+        rc = proc.wait()
+        return rc, time.time() - start_time, None
+    pid, status, ru = os.wait4(proc.pid, 0)
+    wall = time.time() - start_time
+    if os.WIFSIGNALED(status):
+        rc = -os.WTERMSIG(status)
+    else:
+        rc = os.WEXITSTATUS(status)
+    proc.returncode = rc
+    return rc, wall, ru
+
+class _RusageDelta(object):
+    def __init__(self, before, after):
+        for k in ('ru_utime', 'ru_stime', 'ru_inblock', 'ru_oublock'):
+            setattr(self, k, getattr(after, k) - getattr(before, k))
+        self.ru_maxrss = after.ru_maxrss
+
+class RuleResources(object):
+    """Context manager that logs the wall time, CPU time, peak RSS and block IO
+    of the body of a rule's `run:` block to logs/resource_usage.jsonl.
+
+    The CPU and IO counts include those of the commands that the body runs.
+    Rules with `run:` blocks run in their own process, so the peak RSS is
+    that of the job.
+    """
+    def __init__(self, name, CFG=None):
+        self.name = name
+        self.CFG = CFG
+
+    def _usage(self):
+        if resource is None:
+            return None
+        return [resource.getrusage(resource.RUSAGE_SELF),
+                resource.getrusage(resource.RUSAGE_CHILDREN)]
+
+    def __enter__(self):
+        self._start = time.time()
+        self._before = self._usage()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.CFG is None:
+            return False
+        wall = time.time() - self._start
+        ru = None
+        if self._before is not None:
+            after = self._usage()
+            own = _RusageDelta(self._before[0], after[0])
+            kids = _RusageDelta(self._before[1], after[1])
+            for k in ('ru_utime', 'ru_stime', 'ru_inblock', 'ru_oublock'):
+                setattr(own, k, getattr(own, k) + getattr(kids, k))
+            own.ru_maxrss = max(own.ru_maxrss, kids.ru_maxrss)
+            ru = own
+        try:
+            append_resource_record(_rusage_record('rule', self.name, wall, ru,
+                                                  failed=exc_type is not None),
+                                   self.CFG)
+        except OSError:
+            pass
+        return False
+
+def summarize_resource_usage(fp):
+    """Returns a list of dicts (one per kind and name) totalling the records in `fp`.
+
+    Sorted by decreasing total wall time.
+    """
+    by_name = {}
+    with open(fp, 'r') as inp:
+        for line in inp:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            k = (rec.get('kind', ''), rec.get('name', ''))
+            summ = by_name.get(k)
+            if summ is None:
+                summ = {'kind': k[0], 'name': k[1], 'count': 0, 'wall_s': 0.0,
+                        'cpu_s': 0.0, 'max_rss_kb': 0, 'read_bytes': 0,
+                        'written_bytes': 0, 'failed': 0}
+                by_name[k] = summ
+            summ['count'] += 1
+            summ['wall_s'] += rec.get('wall_s', 0.0)
+            summ['cpu_s'] += rec.get('user_s', 0.0) + rec.get('sys_s', 0.0)
+            summ['max_rss_kb'] = max(summ['max_rss_kb'], rec.get('max_rss_kb', 0))
+            summ['read_bytes'] += rec.get('read_bytes', 0)
+            summ['written_bytes'] += rec.get('written_bytes', 0)
+            if rec.get('failed'):
+                summ['failed'] += 1
+    summary = list(by_name.values())
+    for summ in summary:
+        summ['wall_s'] = round(summ['wall_s'], 3)
+        summ['cpu_s'] = round(summ['cpu_s'], 3)
+    summary.sort(key=lambda x: (-x['wall_s'], x['kind'], x['name']))
+    return summary
 
 def run_unhide_if_worked(invocation,
                          unhide_list=None,
@@ -1262,8 +3035,9 @@ def run_unhide_if_worked(invocation,
         suffix ".hide" appended. The output will be moved to the
         final location, if it differs from the content at that
         location.
-    Returns approximate running time (in seconds) for the invocation to return.
-        (approximate because some python if/else logic may be included)
+    Returns the running time (in seconds) for the invocation to return.
+    If CFG is not None, the wall time, CPU time, peak RSS and block IO of the
+        invocation are appended to logs/resource_usage.jsonl
     """
     if unhide_list is None:
         unhide_list = []
@@ -1271,9 +3045,7 @@ def run_unhide_if_worked(invocation,
     if stdout_capture is None:
         if stderr_capture is not None:
             raise NotImplementedError("stderr_capture != None, but stdout_capture is None")
-        start_time = time.time()
-        rp = subprocess.run(invocation)
-        rp.check_returncode()
+        rc, wall, ru = _call_with_rusage(invocation)
     else:
         h = stdout_capture + ".hide"
         unhide_list.append((h, stdout_capture))
@@ -1282,8 +3054,7 @@ def run_unhide_if_worked(invocation,
             os.makedirs(par)
         with open(h, "w", encoding="utf-8") as outp:
             if stderr_capture is None:
-                start_time = time.time()
-                rc = subprocess.call(invocation, stdout=outp)
+                rc, wall, ru = _call_with_rusage(invocation, stdout=outp)
             else:
                 he = stderr_capture + ".hide"
                 unhide_list.append((he, stderr_capture))
@@ -1291,14 +3062,20 @@ def run_unhide_if_worked(invocation,
                 if par and not os.path.exists(par):
                     os.makedirs(par)
                 with open(he, "w", encoding="utf-8") as errp:
-                    start_time = time.time()
-                    rc = subprocess.call(invocation, stdout=outp, stderr=errp)
-        if rc != 0:
-            raise RuntimeError('Call failed:\n"{}"\n'.format('" "'.join(invocation)))
-    end_time = time.time()
+                    rc, wall, ru = _call_with_rusage(invocation, stdout=outp, stderr=errp)
+    if CFG is not None:
+        name = os.path.split(invocation[0])[-1]
+        try:
+            append_resource_record(_rusage_record('command', name, wall, ru, failed=rc != 0), CFG)
+        except OSError:
+            pass
+    if rc != 0:
+        if stdout_capture is None:
+            raise subprocess.CalledProcessError(rc, invocation)
+        raise RuntimeError('Call failed:\n"{}"\n'.format('" "'.join(invocation)))
     for src, dest in unhide_list:
         mv_if_needed(src=src, dest=dest, CFG=CFG)
-    return end_time - start_time
+    return wall
 
 
 def exemplify_taxa(in_tax_tree_fp,
@@ -1356,13 +3133,216 @@ def clean_contesting_tree_refs(in_fp, out_fp, CFG=None):
             new_blob[taxon] = new_dict
     write_as_json_if_needed(new_blob, out_fp, indent=1, CFG=CFG)
 
+def _subproblem_runtime_fps(ottid, CFG):
+    """Filepaths that may hold the number of seconds a previous solve of `ottid` took."""
+    fn = 'runtime-{}.txt'.format(ottid)
+    fps = [os.path.join(CFG.out_dir, 'subproblems', 'deg-dist', fn)]
+    if CFG.cache_dir:
+        fps.append(os.path.join(CFG.cache_dir, 'solve_runtimes', fn))
+    return fps
+
+def previous_subproblem_runtime(ottid, CFG):
+    """Returns the seconds that the last solve of `ottid` took (in this run dir or cache_dir) or None."""
+    for fp in _subproblem_runtime_fps(ottid, CFG):
+        try:
+            with open(fp, 'r') as inp:
+                return float(inp.read().strip())
+        except (OSError, ValueError):
+            pass
+    return None
+
+def record_subproblem_runtime(ottid, seconds, CFG):
+    """Stores the runtime of the solve of `ottid` in cache_dir for the scheduling of later runs."""
+    if not CFG.cache_dir:
+        return
+    write_if_needed(fp=_subproblem_runtime_fps(ottid, CFG)[-1],
+                    content='{}\n'.format(seconds))
+
+def long_running_subproblem_ids(CFG):
+    """Returns the sorted list of the subproblem IDs that should be solved first.
+
+    Those are the IDs whose previous solve took at least CFG.solve_priority_min_seconds
+        and, for subproblems that have no recorded runtime, those whose
+        subproblems/{ottid}.tre is at least CFG.solve_priority_min_bytes.
+    Only the subproblems and runtimes that exist when the workflow is parsed
+        are known, so the first run in a new directory relies on cache_dir.
+    """
+    runtime_pat = re.compile(r'^runtime-(ott[0-9]+)\.txt$')
+    runtime_dirs = [os.path.split(i)[0] for i in _subproblem_runtime_fps('x', CFG)]
+    timed, ids = set(), set()
+    for d in runtime_dirs:
+        if not os.path.isdir(d):
+            continue
+        for fn in os.listdir(d):
+            m = runtime_pat.match(fn)
+            if m and m.group(1) not in timed:
+                rt = previous_subproblem_runtime(m.group(1), CFG)
+                if rt is not None:
+                    timed.add(m.group(1))
+                    if rt >= CFG.solve_priority_min_seconds:
+                        ids.add(m.group(1))
+    subprob_pat = re.compile(r'^(ott[0-9]+)\.tre$')
+    subprob_dir = os.path.join(CFG.out_dir, 'subproblems')
+    if os.path.isdir(subprob_dir):
+        for fn in os.listdir(subprob_dir):
+            m = subprob_pat.match(fn)
+            if m and m.group(1) not in timed:
+                if os.path.getsize(os.path.join(subprob_dir, fn)) >= CFG.solve_priority_min_bytes:
+                    ids.add(m.group(1))
+    return sorted(ids)
+
+def num_subproblem_trees(subprob_fp):
+    """Number of input trees listed in the "-tree-names.txt" file for `subprob_fp` (or None)."""
+    names_fp = subprob_fp[:-4] + '-tree-names.txt' if subprob_fp.endswith('.tre') else None
+    if names_fp is None or not os.path.exists(names_fp):
+        return None
+    return len(list(stripped_nonempty_lines(names_fp)))
+
+def estimate_solve_mem_mb(subprob_fp, CFG):
+    """Rough memory estimate (MB) for solving `subprob_fp`, used as the mem_mb resource."""
+    try:
+        size_mb = os.path.getsize(subprob_fp) / float(1 << 20)
+    except OSError:
+        size_mb = 0.0
+    return int(100 + CFG.solve_mem_mb_per_input_mb * size_mb)
+
+# bumped when the solve_subproblem outputs change for the same inputs
+_SOLVED_SUBPROBLEM_CACHE_FORMAT = '1'
+_OTC_VERSION = None
+_INCERT_SED_IDS = {}
+_subprob_ott_id_pat = re.compile(r'ott([0-9]+)')
+
+def _otc_version_str():
+    global _OTC_VERSION
+    if _OTC_VERSION is None:
+        git_sha, version = get_otc_version()[:2]
+        _OTC_VERSION = '' if git_sha == 'unknown' else '{} {}'.format(git_sha, version)
+    return _OTC_VERSION
+
+def _read_incert_sed_ids(incert_sed_fp):
+    st = os.stat(incert_sed_fp)
+    k = (os.path.abspath(incert_sed_fp), st.st_size, st.st_mtime_ns)
+    ids = _INCERT_SED_IDS.get(k)
+    if ids is None:
+        ids = frozenset(stripped_nonempty_lines(incert_sed_fp))
+        _INCERT_SED_IDS.clear()
+        _INCERT_SED_IDS[k] = ids
+    return ids
+
+class SolvedSubproblemCache(object):
+    """Store (in cache_dir) of the outputs of solve_subproblem.
+
+    Entries are keyed by the content of the subproblem, the IDs in the incertae
+    sedis file that occur in the subproblem, and the otcetera version, so they
+    can be reused by later runs. Caching is off if the otcetera version is unknown.
+    Each lookup is appended to logs/solve_cache.jsonl.
+    """
+    _FILES = ('solution.tre', 'in-deg-dist.txt', 'out-deg-dist.txt', 'runtime.txt')
+
+    def __init__(self, cache_dir, CFG=None):
+        self.directory = os.path.join(cache_dir, 'subproblem_solutions')
+        self.CFG = CFG
+        self.otc_version = _otc_version_str()
+
+    @property
+    def enabled(self):
+        return bool(self.otc_version)
+
+    def key(self, subprob_fp, incert_sed_fp):
+        with open(subprob_fp, 'rb') as inp:
+            content = inp.read()
+        in_subprob = set(_subprob_ott_id_pat.findall(content.decode('utf-8')))
+        incert = sorted(in_subprob.intersection(_read_incert_sed_ids(incert_sed_fp)))
+        h = hashlib.sha1('\n'.join([__version__,
+                                     _SOLVED_SUBPROBLEM_CACHE_FORMAT,
+                                     self.otc_version,
+                                     ','.join(incert),
+                                     '']).encode('utf-8'))
+        h.update(content)
+        return h.hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def restore(self, key, dest_fps):
+        """Copies the cached files to `dest_fps` (parallel to _FILES, None to skip).
+
+        Returns True on a hit.
+        """
+        entry = self._entry_dir(key)
+        srcs = [os.path.join(entry, fn) for fn in self._FILES]
+        for src, dest in zip(srcs, dest_fps):
+            if dest and not os.path.isfile(src):
+                return False
+        for src, dest in zip(srcs, dest_fps):
+            if dest:
+                cp_if_needed(src, dest)
+        return True
+
+    def store(self, key, src_fps):
+        entry = self._entry_dir(key)
+        if os.path.exists(entry):
+            return
+        tmp = '{}.{}.tmp'.format(entry, os.getpid())
+        os.makedirs(tmp)
+        try:
+            for fn, src in zip(self._FILES, src_fps):
+                if src and os.path.isfile(src):
+                    store_in_cache(src, os.path.join(tmp, fn), CFG=self.CFG)
+            os.rename(tmp, entry)
+        except OSError:
+            # most likely another process stored this entry first
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp)
+
+    def log(self, sp_id, key, hit):
+        if self.CFG is None:
+            return
+        self.CFG.debug('solution cache {} for {}'.format('hit' if hit else 'miss', sp_id))
+        log_dir = os.path.join(self.CFG.out_dir, 'logs')
+        if not os.path.isdir(log_dir):
+            os.makedirs(log_dir)
+        rec = {'id': sp_id, 'key': key, 'hit': hit, 'time': time.time()}
+        with open(os.path.join(log_dir, 'solve_cache.jsonl'), 'a') as outp:
+            outp.write(json.dumps(rec, sort_keys=True) + '\n')
+
+def log_solve_cache_stats(CFG):
+    """Logs the # of solution cache hits and misses (the latest lookup of each subproblem)."""
+    fp = os.path.join(CFG.out_dir, 'logs', 'solve_cache.jsonl')
+    if not os.path.exists(fp):
+        return None
+    latest = {}
+    with open(fp, 'r') as inp:
+        for line in inp:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            latest[rec['id']] = rec['hit']
+    hits = sum(1 for i in latest.values() if i)
+    CFG.info('solution cache: {} hits, {} misses'.format(hits, len(latest) - hits))
+    return hits, len(latest) - hits
+
 def solve_subproblem(incert_sed_fp, subprob_fp, out_fp,
                      in_deg_dist_fp=None,
                      out_deg_dist_fp=None,
                      run_time_fp=None, 
+                     record_runtime=False,
+                     cache_dir=None,
                      CFG=None):
+    """Runs otc-solve-subproblem, or restores its outputs from a SolvedSubproblemCache in `cache_dir`."""
     sp_fn = os.path.split(subprob_fp)[-1]
     sp_id = sp_fn[:-4] if sp_fn.endswith('.tre') else sp_fn
+    out_fps = (out_fp, in_deg_dist_fp, out_deg_dist_fp, run_time_fp)
+    cache = SolvedSubproblemCache(cache_dir, CFG=CFG) if cache_dir else None
+    if cache is not None and cache.enabled:
+        key = cache.key(subprob_fp, incert_sed_fp)
+        hit = cache.restore(key, out_fps)
+        cache.log(sp_id, key, hit)
+        if hit:
+            return
+    else:
+        cache = None
     invocation = ["otc-solve-subproblem",
                   subprob_fp,
                   "-n{}".format(sp_id),
@@ -1378,8 +3358,99 @@ def solve_subproblem(incert_sed_fp, subprob_fp, out_fp,
         invocation.extend(['--output-deg-dist', out_deg_dist_fp + '.hide'])
     rt = run_unhide_if_worked(invocation, unhide, CFG=CFG, stdout_capture=out_fp)
     if run_time_fp:
-        with open(run_time_fp, "w") as rto:
-            rto.write('{}\n'.format(rt))
+        # replaced through a rename (never written in place), because the file
+        #   may be a hardlink into a cache entry (see SolvedSubproblemCache.store)
+        write_if_needed(fp=run_time_fp, content='{}\n'.format(rt))
+    if record_runtime and CFG is not None:
+        ntrees = num_subproblem_trees(subprob_fp)
+        m = 'solved {} ({} bytes, {} trees) in {:.1f} seconds'
+        CFG.debug(m.format(sp_id, os.path.getsize(subprob_fp), ntrees, rt))
+        record_subproblem_runtime(sp_id, rt, CFG)
+    if cache is not None:
+        cache.store(key, out_fps)
+
+def _stable_fraction(s):
+    """Maps `s` to a float in [0, 1) that does not change between runs."""
+    return int(hashlib.sha1(s.encode('utf-8')).hexdigest()[:8], 16) / float(1 << 32)
+
+def plan_solve_batches(subprob_ids, subprob_dir, CFG):
+    """Returns a dict mapping a batch name to the sorted list of subproblem IDs in that batch.
+
+    Subproblems whose {ottid}.tre in `subprob_dir` is smaller than CFG.solve_batch_max_bytes
+        are batched. The batch of an ID is a hash of the ID, so adding or removing a
+        subproblem only changes the batch it is in. The number of batches is the smallest
+        power of 2 that gives batches of at most CFG.solve_batch_size IDs on average
+        (doubling it splits each batch in two). Empty if batching is off.
+    """
+    if CFG.solve_batch_max_bytes <= 0:
+        return {}
+    small = []
+    for ottid in sorted(set(subprob_ids)):
+        fp = os.path.join(subprob_dir, ottid + '.tre')
+        if os.path.getsize(fp) < CFG.solve_batch_max_bytes:
+            small.append(ottid)
+    num_batches = 1
+    while num_batches * CFG.solve_batch_size < len(small):
+        num_batches *= 2
+    batches = {}
+    for ottid in small:
+        name = 'batch{}'.format(int(_stable_fraction(ottid) * num_batches))
+        batches.setdefault(name, []).append(ottid)
+    return batches
+
+def select_reversed_subproblem_ids(subprob_ids, subprob_dir, CFG):
+    """Returns the IDs (in the order of `subprob_ids`) of the subproblems to also solve in reversed order.
+
+    In "sample" mode, those are the subproblems whose {ottid}.tre in `subprob_dir` is at least
+        CFG.reversed_solve_min_bytes, and that fall into a sample of CFG.reversed_solve_fraction
+        of the IDs. The sample is a hash of the ID, so it is the same in every run.
+    """
+    if CFG.reversed_solve_mode == 'skip':
+        return []
+    if CFG.reversed_solve_mode == 'all':
+        return list(subprob_ids)
+    selected = []
+    for ottid in subprob_ids:
+        if _stable_fraction(ottid) >= CFG.reversed_solve_fraction:
+            continue
+        if os.path.getsize(os.path.join(subprob_dir, ottid + '.tre')) < CFG.reversed_solve_min_bytes:
+            continue
+        selected.append(ottid)
+    return selected
+
+def solve_subproblem_batch(incert_sed_fp, subprob_fps, out_dir, out_ids_fp, CFG=None):
+    """Solves each of `subprob_fps` in turn, writing the same files as a `solve` job would.
+
+    `out_dir` is the parent of "subproblems" and "subproblem_solutions". The IDs solved
+    are written to `out_ids_fp`, which is the only output of the solve_batch rule:
+    the solution, degree distribution and runtime files are side effects, which
+    snakemake neither removes before the job nor checks after it.
+    """
+    soln_dir = os.path.join(out_dir, 'subproblem_solutions')
+    dd_dir = os.path.join(out_dir, 'subproblems', 'deg-dist')
+    for d in (soln_dir, dd_dir):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+    solved = []
+    start = time.time()
+    for subprob_fp in subprob_fps:
+        sp_id = os.path.split(subprob_fp)[-1][:-4]
+        solve_subproblem(incert_sed_fp=incert_sed_fp,
+                         subprob_fp=subprob_fp,
+                         out_fp=os.path.join(soln_dir, sp_id + '.tre'),
+                         in_deg_dist_fp=os.path.join(dd_dir, 'deg-dist-{}.txt'.format(sp_id)),
+                         out_deg_dist_fp=os.path.join(soln_dir, 'deg-dist-{}.txt'.format(sp_id)),
+                         run_time_fp=os.path.join(dd_dir, 'runtime-{}.txt'.format(sp_id)),
+                         record_runtime=True,
+                         cache_dir=None if CFG is None else CFG.cache_dir,
+                         CFG=CFG)
+        solved.append(sp_id)
+    if CFG is not None:
+        m = 'solved a batch of {} subproblems in {:.1f} seconds'
+        CFG.info(m.format(len(solved), time.time() - start))
+    write_if_needed(fp=out_ids_fp,
+                    content=''.join(['{}\n'.format(i) for i in solved]),
+                    CFG=CFG)
 
 
 def write_inc_sed_ids(tax_tree,
@@ -1398,9 +3469,90 @@ def write_inc_sed_ids(tax_tree,
                          CFG=CFG,
                          stdout_capture=out_inc_sed_id_fp)
 
+# punctuation, quoted labels and comments of newick. Unquoted labels and
+#   branch lengths are the (skipped) text between these tokens.
+_NEWICK_TOKEN_PAT = re.compile(rb"[(),;]|'(?:[^']|'')*'|\[[^\]]*\]")
+
+def gen_newick_out_degree_dists(tree_fp):
+    """Yields an {out-degree: count} dict for each tree in the newick file `tree_fp`.
+
+    The file is scanned (mmapped) without building the trees, so this is
+    cheap for trees with millions of tips. A tip with an empty label (as in
+    "(,)") counts as a tip.
+    """
+    with open(tree_fp, 'rb') as inp:
+        if os.fstat(inp.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        stack = []  # numbers of children seen for the open internal nodes
+        dd = defaultdict(int)
+        expecting_node = False
+        prev_end = 0
+        for m in _NEWICK_TOKEN_PAT.finditer(mm):
+            t = mm[m.start()]
+            if not stack and not dd and mm[prev_end:m.start()].strip():
+                dd[0] = 1  # the unquoted label of a tree that is one tip
+            prev_end = m.end()
+            if t == 0x28:  # (
+                if stack:
+                    stack[-1] += 1
+                stack.append(0)
+                expecting_node = True
+            elif t == 0x2C or t == 0x29:  # , or )
+                if not stack:
+                    raise ValueError('Unbalanced parentheses in "{}"'.format(tree_fp))
+                if expecting_node:
+                    stack[-1] += 1
+                    dd[0] += 1
+                if t == 0x29:
+                    dd[stack.pop()] += 1
+                    expecting_node = False
+                else:
+                    expecting_node = True
+            elif t == 0x3B:  # ;
+                if stack:
+                    raise ValueError('Unbalanced parentheses in "{}"'.format(tree_fp))
+                if dd:
+                    yield dict(dd)
+                dd = defaultdict(int)
+            elif t == 0x27:  # a quoted label
+                if expecting_node:
+                    stack[-1] += 1
+                    dd[0] += 1
+                    expecting_node = False
+                elif not stack and not dd:
+                    dd[0] = 1  # the label of a tree that is one tip
+        if stack or dd:
+            raise ValueError('Newick in "{}" does not end with a ";"'.format(tree_fp))
+    finally:
+        mm.close()
+
+def tips_and_inf_splits(dd):
+    """Returns [# of tips, # of informative splits] for an {out-degree: count} dict.
+
+    As in the summaries of the subproblems, a node is counted as an informative
+    split if it has more than one child, but fewer children than there are tips.
+    """
+    num_tips = dd.get(0, 0)
+    inf = 0
+    for out_degree, count in dd.items():
+        if 1 < out_degree < num_tips:
+            inf += count
+    return [num_tips, inf]
+
+def format_degree_dist(dd):
+    """Returns the text that otc-degree-distribution writes for an {out-degree: count} dict."""
+    rows = ['{}\t{}\n'.format(k, dd[k]) for k in sorted(dd.keys())]
+    return 'Out-degree\tCount\n' + ''.join(rows)
+
 def calc_degree_dist(on_tree_fp, out_dd_fp, CFG=None):
-    invocation = ["otc-degree-distribution", on_tree_fp]
-    run_unhide_if_worked(invocation, CFG=CFG, stdout_capture=out_dd_fp)
+    """Writes the out-degree distribution of the tree(s) in `on_tree_fp`.
+
+    The output is in the format of otc-degree-distribution.
+    """
+    content = ''.join([format_degree_dist(dd) for dd in gen_newick_out_degree_dists(on_tree_fp)])
+    return write_if_needed(fp=out_dd_fp, content=content, CFG=CFG)
 
 def simplify_tax_names(in_tree, out_tree, out_log, CFG=None):
     invocation = ["otc-munge-names", in_tree]
@@ -1451,23 +3603,354 @@ def stripped_nonempty_lines(fn):
             if ls:
                 yield ls
 
+# of "nodes" entries held in memory (and sorted) at once by stream_annotations
+ANNOTATIONS_SPILL_NODES = 100000
+
+_ANNOT_ENCODERS = {}
+_encode_json_line = json.JSONEncoder(separators=(',', ':')).encode
+
+def _dumps_annot(blob, indent, depth):
+    """JSON for `blob` as it appears `depth` levels deep in a json.dump(indent=indent, sort_keys=True) document."""
+    enc = _ANNOT_ENCODERS.get(indent)
+    if enc is None:
+        enc = json.JSONEncoder(indent=indent, sort_keys=True, separators=(',', ': '), ensure_ascii=True)
+        _ANNOT_ENCODERS[indent] = enc
+    s = enc.encode(blob)
+    if depth:
+        s = s.replace('\n', '\n' + ' ' * (indent * depth))
+    return s
+
+def _spill_sorted_run(items, tmp_dir, runs):
+    """Writes the (node id, JSON text of the entry) pairs of `items`, sorted by id, to a new run file."""
+    items.sort(key=lambda x: x[0])
+    fp = os.path.join(tmp_dir, 'run{}.jsonl'.format(len(runs)))
+    with open(fp, 'w', encoding='utf-8') as outp:
+        for i in items:
+            outp.write(_encode_json_line(i))
+            outp.write('\n')
+    runs.append(fp)
+    del items[:]
+
+def _gen_run_items(fp):
+    with open(fp, 'r', encoding='utf-8') as inp:
+        for line in inp:
+            yield json.loads(line)
+
+def _node_entry(node_key, v, indent):
+    return '{}{}: {}'.format(' ' * (2 * indent), _encode_json_line(node_key), _dumps_annot(v, indent, 2))
+
+def _read_annotations_spilling_nodes(in_fp, indent, patch_ids, patch, tmp_dir, ijson):
+    """Parses `in_fp` as a stream (with the `ijson` module), and returns (the
+    top-level properties other than "nodes", the sorted run files of the "nodes" entries).
+
+    The nodes are stored as the JSON text of their entry in the "nodes" map,
+    so they are only encoded once.
+    `patch` is used to update the value of every node whose id is in `patch_ids`;
+    ids of `patch_ids` that are not nodes are added as nodes with `patch` as the value.
+    """
+    from ijson.common import ObjectBuilder
+    runs, items = [], []
+    unseen = set(patch_ids)
+    # the first pass builds one node at a time
+    with open(in_fp, 'rb') as inp:
+        for node_key, v in ijson.kvitems(inp, 'nodes', use_float=True):
+            if node_key in unseen:
+                if not isinstance(v, dict):
+                    raise ValueError('Node "{}" of "{}" is not an object'.format(node_key, in_fp))
+                unseen.discard(node_key)
+                v.update(patch)
+            items.append((node_key, _node_entry(node_key, v, indent)))
+            if len(items) >= ANNOTATIONS_SPILL_NODES:
+                _spill_sorted_run(items, tmp_dir, runs)
+    for ott_id in unseen:
+        items.append((ott_id, _node_entry(ott_id, patch, indent)))
+    if items:
+        _spill_sorted_run(items, tmp_dir, runs)
+    # the second pass builds everything else
+    builder = ObjectBuilder()
+    with open(in_fp, 'rb') as inp:
+        for prefix, event, value in ijson.parse(inp, use_float=True):
+            if prefix == 'nodes' or prefix.startswith('nodes.'):
+                continue
+            if prefix == '' and event == 'map_key' and value == 'nodes':
+                continue
+            builder.event(event, value)
+    return builder.value, runs
+
+################################################################################
+# Offset index of an annotations.json file
+#
+# Written by stream_annotations (as `annotations_index_path(annotations fp)`)
+#   while the annotations are written, so that the annotations of a node can
+#   be read by a binary search over the node ids and one json.loads of its
+#   bytes in the (mmapped) annotations file. See AnnotationsIndex.
+# It is a sectioned binary file (see _write_sectioned_file). The header holds
+#   the # of nodes, the size, mtime, inode and SHA-1 of the annotations file,
+#   and the [key, offset, length] of its other top-level properties. Sections:
+#     key_off    uint64[n+1] offsets of the UTF-8 node ids in `keys`
+#     val_off    uint64[n]   offset of the node's JSON object in the annotations file
+#     val_len    uint64[n]   length of that JSON object
+#     keys       bytes       the node ids, sorted
+_ANNOT_INDEX_MAGIC = b'PROPANN1'
+_ANNOT_INDEX_SECTIONS = (('key_off', 'Q'), ('val_off', 'Q'), ('val_len', 'Q'), ('keys', 'B'))
+
+def annotations_index_path(annotations_fp):
+    if annotations_fp.endswith('.json'):
+        annotations_fp = annotations_fp[:-len('.json')]
+    return annotations_fp + '.index.bin'
+
+class _AnnotationsIndexBuilder(object):
+    def __init__(self):
+        self.sections = {'key_off': array('Q', [0]), 'val_off': array('Q'),
+                         'val_len': array('Q'), 'keys': bytearray()}
+        self.top = []
+
+    def add_node(self, key, offset, length):
+        self.sections['keys'].extend(key.encode('utf-8'))
+        self.sections['key_off'].append(len(self.sections['keys']))
+        self.sections['val_off'].append(offset)
+        self.sections['val_len'].append(length)
+
+    def write(self, fp, annotations_fp, annotations_size, annotations_sha1, CFG=None):
+        st = os.stat(annotations_fp)
+        if st.st_size != annotations_size:
+            raise RuntimeError('"{}" is not the file that was indexed'.format(annotations_fp))
+        header = {'num_nodes': len(self.sections['val_off']),
+                  'annotations_size': annotations_size,
+                  'annotations_sha1': annotations_sha1,
+                  'annotations_mtime_ns': st.st_mtime_ns,
+                  'annotations_inode': st.st_ino,
+                  'top_level': self.top}
+        return _write_sectioned_file(fp, _ANNOT_INDEX_MAGIC, header, _ANNOT_INDEX_SECTIONS,
+                                     self.sections, CFG=CFG)
+
+def _write_annotations_doc(outp, top, node_entries, indent, index=None):
+    """Writes the annotations document with the top-level properties `top` and
+    the (node id, entry text) pairs of `node_entries` (sorted by id, see _node_entry)
+    as the "nodes". Byte ranges are recorded in `index` (an _AnnotationsIndexBuilder) if it is given.
+    """
+    if 'nodes' in top:
+        raise ValueError('Expecting "nodes" to be an object')
+    keys = sorted(list(top.keys()) + ['nodes'])
+    ind1 = ' ' * indent
+    outp.write('{\n')
+    for n, k in enumerate(keys):
+        if n:
+            outp.write(',\n')
+        outp.write('{}{}: '.format(ind1, _encode_json_line(k)))
+        if k != 'nodes':
+            v = _dumps_annot(top[k], indent, 1)
+            if index is not None:
+                index.top.append([k, outp.tell(), len(v)])
+            outp.write(v)
+            continue
+        first = True
+        for nk, entry in node_entries:
+            outp.write('{\n' if first else ',\n')
+            first = False
+            if index is not None:
+                # the entry is the indented key, ": " and the value
+                vstart = 2 * indent + len(_encode_json_line(nk)) + 2
+                index.add_node(nk, outp.tell() + vstart, len(entry) - vstart)
+            outp.write(entry)
+        outp.write('{}' if first else '\n{}}}'.format(ind1))
+    outp.write('\n}')
+
+def stream_annotations(in_fp, out_fp, indent, patch_ids=(), patch=None, defaults=None,
+                       index_fp=None, CFG=None):
+    """Writes the annotations JSON `in_fp` to `out_fp` as
+    json.dump(..., indent=indent, sort_keys=True) would, after updating the
+    nodes with ids in `patch_ids` with the dict `patch` (creating missing ones),
+    and adding the top-level properties of `defaults` that `in_fp` lacks.
+
+    If the optional ijson package is installed, the "nodes" map is never held
+    in memory: its entries are parsed as a stream, sorted in runs of
+    ANNOTATIONS_SPILL_NODES that are written to temporary files, and merged
+    while writing. Otherwise the whole document is read with read_as_json.
+    If `index_fp` is given, the AnnotationsIndex of `out_fp` is written there.
+    Returns True if `out_fp` changed.
+    """
+    patch = patch or {}
+    index = None if index_fp is None else _AnnotationsIndexBuilder()
+    try:
+        import ijson
+    except ImportError:
+        blob = read_as_json(in_fp)
+        nodes_dict = blob.pop('nodes')
+        for ott_id in patch_ids:
+            nodes_dict.setdefault(ott_id, {}).update(patch)
+        if defaults:
+            for k, v in defaults.items():
+                blob.setdefault(k, v)
+        entries = ((k, _node_entry(k, nodes_dict[k], indent)) for k in sorted(nodes_dict.keys()))
+        with WriteIfNeeded(out_fp, CFG=CFG) as outp:
+            _write_annotations_doc(outp, blob, entries, indent, index=index)
+        if index is not None:
+            index.write(index_fp, out_fp, outp.tell(), outp.hexdigest(), CFG=CFG)
+        return outp.changed
+    par = os.path.split(os.path.abspath(out_fp))[0]
+    if not os.path.exists(par):
+        os.makedirs(par)
+    tmp_dir = tempfile.mkdtemp(prefix='.annot-', dir=par)
+    try:
+        top, runs = _read_annotations_spilling_nodes(in_fp, indent, patch_ids, patch, tmp_dir, ijson)
+        if defaults:
+            for k, v in defaults.items():
+                top.setdefault(k, v)
+        merged = heapq.merge(*[_gen_run_items(i) for i in runs], key=lambda x: x[0])
+        with WriteIfNeeded(out_fp, CFG=CFG) as outp:
+            _write_annotations_doc(outp, top, merged, indent, index=index)
+        if index is not None:
+            index.write(index_fp, out_fp, outp.tell(), outp.hexdigest(), CFG=CFG)
+        return outp.changed
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _annotations_match_index(annotations_fp, header):
+    """True if `annotations_fp` is the file the index with `header` was written for.
+
+    The file must have the recorded size. If its mtime or inode changed (for
+        example, because it was touched), its SHA-1 must also match.
+    """
+    st = os.stat(annotations_fp)
+    if st.st_size != header['annotations_size']:
+        return False
+    if st.st_mtime_ns == header.get('annotations_mtime_ns') and st.st_ino == header.get('annotations_inode'):
+        return True
+    return file_digest(annotations_fp) == header['annotations_sha1']
+
+class AnnotationsIndex(object):
+    """Read-only mapping of node id to annotations, backed by an annotations
+    file and the index that stream_annotations wrote for it.
+
+    Lookups are binary searches over the sorted node ids, and only the
+    node's own JSON is parsed. Iteration is in the order of the ids.
+    """
+    def __init__(self, annotations_fp, index_fp=None):
+        if index_fp is None:
+            index_fp = annotations_index_path(annotations_fp)
+        self.annotations_fp, self.index_fp = annotations_fp, index_fp
+        with open(index_fp, 'rb') as inp:
+            self._imm = mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_READ)
+        mv = memoryview(self._imm)
+        sections = {}
+        try:
+            header, sections = _parse_sectioned_file(mv, _ANNOT_INDEX_MAGIC, index_fp, 'an annotations index')
+            if not _annotations_match_index(annotations_fp, header):
+                raise ValueError('"{}" does not match "{}"'.format(index_fp, annotations_fp))
+        except:
+            for sec in sections.values():
+                sec.release()
+            mv.release()
+            self._imm.close()
+            raise
+        for name, sec in sections.items():
+            setattr(self, '_' + name, sec)
+        self._mv = mv
+        self.num_nodes = header['num_nodes']
+        self.annotations_sha1 = header['annotations_sha1']
+        self._top = {k: (off, length) for k, off, length in header['top_level']}
+        if os.path.getsize(annotations_fp) == 0:
+            raise ValueError('"{}" is empty'.format(annotations_fp))
+        with open(annotations_fp, 'rb') as inp:
+            self._amm = mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._mv is not None:
+            for name, typecode in _ANNOT_INDEX_SECTIONS:
+                getattr(self, '_' + name).release()
+            self._mv.release()
+            self._mv = None
+            self._imm.close()
+            self._amm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self.num_nodes
+
+    def _key_bytes(self, pos):
+        return bytes(self._keys[self._key_off[pos]:self._key_off[pos + 1]])
+
+    def _pos(self, node_id):
+        kb = node_id.encode('utf-8')
+        lo, hi = 0, self.num_nodes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_bytes(mid) < kb:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_nodes and self._key_bytes(lo) == kb:
+            return lo
+        return None
+
+    def _value_at(self, pos):
+        off = self._val_off[pos]
+        return json.loads(self._amm[off:off + self._val_len[pos]].decode('utf-8'))
+
+    def __contains__(self, node_id):
+        return self._pos(node_id) is not None
+
+    def __getitem__(self, node_id):
+        pos = self._pos(node_id)
+        if pos is None:
+            raise KeyError(node_id)
+        return self._value_at(pos)
+
+    def get(self, node_id, default=None):
+        pos = self._pos(node_id)
+        return default if pos is None else self._value_at(pos)
+
+    def keys(self):
+        for pos in range(self.num_nodes):
+            yield self._key_bytes(pos).decode('utf-8')
+
+    __iter__ = keys
+
+    def items(self):
+        for pos in range(self.num_nodes):
+            yield self._key_bytes(pos).decode('utf-8'), self._value_at(pos)
+
+    def top_level_keys(self):
+        return list(self._top.keys())
+
+    def get_top_level(self, key, default=None):
+        """Returns the top-level property `key` (other than "nodes") of the annotations."""
+        x = self._top.get(key)
+        if x is None:
+            return default
+        return json.loads(self._amm[x[0]:x[0] + x[1]].decode('utf-8'))
+
+def open_annotation_nodes(annotations_fp, CFG=None):
+    """Returns the "nodes" of the annotations file: an AnnotationsIndex if the
+    file has an up-to-date index, otherwise the dict from reading the whole file.
+    """
+    index_fp = annotations_index_path(annotations_fp)
+    if os.path.exists(index_fp):
+        try:
+            return AnnotationsIndex(annotations_fp, index_fp)
+        except ValueError as x:
+            if CFG is not None:
+                CFG.warn('Not using the annotations index: {}'.format(x))
+    return read_as_json(annotations_fp)['nodes']
+
 def add_subproblem_info_to_annotations(subpr_id_fp, pre_fp, out_fp, CFG=None):
-    h = out_fp + ".hide"
     subproblems = []
     for s in stripped_nonempty_lines(subpr_id_fp):
         if not s.endswith('.tre'):
             m = 'Expecting every line in "{}" to end in ".tre"'
             raise RuntimeError(m.format(subpr_id_fp))
         subproblems.append(s[:-4])
-    jsonblob = read_as_json(pre_fp)
-    nodes_dict = jsonblob['nodes']
-    for ott_id in subproblems:
-        d = nodes_dict.setdefault(ott_id, {})
-        d['was_constrained'] = True
-        d['was_uncontested'] = True
-    with codecs.open(h, 'w', encoding='utf-8') as out_stream:
-        json.dump(jsonblob, out_stream, indent=2, sort_keys=True, separators=(',', ': '))
-    mv_if_needed(h, out_fp, CFG=CFG)
+    stream_annotations(pre_fp, out_fp, indent=2, patch_ids=subproblems,
+                       patch={'was_constrained': True, 'was_uncontested': True},
+                       CFG=CFG)
 
 def annotate_1_tree(in_tree, in_phylo_fps, in_subpr, out_fp, CFG=None):
     tf = '.annotate_1_tree_list.hide'
@@ -1496,7 +3979,7 @@ def annotate_2_tree(in_1, in_tax_dd, out_fp, CFG=None):
             m = "Expecting first word of second line of {} to be 0"
             raise ValueError(m.format(in_tax_dd))
         num_tips = int(ls[1])
-    annot_2 = gen_config_annot(CFG)
+    annot_2 = config_annot_with_date(CFG)
     annot_2['num_leaves_in_exemplified_taxonomy'] = num_tips
     write_annot_json(blob=annot_2, fp=out_fp)
 
@@ -1557,6 +4040,12 @@ def get_propinquity_sha(CFG):
 
 
 def root_taxon_name(CFG):
+    # the index of the OTT copy in the output dir saves otc-taxonomy-parser loading the taxonomy
+    idx_dir = os.path.join(CFG.out_dir, 'subott_dir')
+    if os.path.exists(ott_index_path(idx_dir)):
+        name = open_ott_index(idx_dir, CFG=CFG).get_name(int(CFG.root_ott_id))
+        if name is not None:
+            return name
     FNULL = open(os.devnull, 'w')
     inv = ["otc-taxonomy-parser", CFG.ott_dir, "-N", str(CFG.root_ott_id)]
     proc = subprocess.Popen(inv, stdout=subprocess.PIPE, stderr=FNULL)
@@ -1578,11 +4067,14 @@ def get_peyotl_version(CFG):
         pass
     return peyotl_version, peyotl_sha
 
-def gen_config_annot(CFG):
-    otc_sha, otc_version, otc_boost_version = get_otc_version()
+def gen_config_annot(CFG, otc_version_info=None):
+    """Returns the provenance annotations of the run, without the "date_completed"
+    (see config_annot_with_date)."""
+    if otc_version_info is None:
+        otc_version_info = get_otc_version()
+    otc_sha, otc_version, otc_boost_version = otc_version_info
     propinquity_sha = get_propinquity_sha(CFG)
     document = {}
-    document["date_completed"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     synth_id = CFG.synth_id
     document["tree_id"] = synth_id
     document["synth_id"] = synth_id
@@ -1613,29 +4105,149 @@ def gen_config_annot(CFG):
     document["num_source_studies"] = len(studies)
     return document
 
+PROVENANCE_FN = 'provenance.json'
+_PROVENANCE_FORMAT = '2'
 
-def merge_annotations(in_1, in_2, out_fp, CFG=None):
-    m = merge_json(in_1, in_2)
-    write_annot_json(blob=m, fp=out_fp)
+def _stat_key(fp):
+    try:
+        st = os.stat(fp)
+    except OSError:
+        return None
+    return [fp, st.st_size, st.st_mtime_ns]
 
-def parse_degree_dist(fn):
-    header_pat = re.compile(r'Out-degree\S+Count')
-    dd = []
-    with open(fn, 'r') as inp:
-        expecting_header = True
+def _provenance_inputs(CFG):
+    """Returns what gen_config_annot depends on, without running any subprocess.
+
+    The otcetera and propinquity versions are represented by the stats of the
+    otc-version-reporter executable and of the git HEAD (and ref) files.
+    """
+    git_dir = os.path.join(CFG.propinquity_dir, '.git')
+    git_files = [os.path.join(git_dir, 'HEAD'), os.path.join(git_dir, 'packed-refs')]
+    try:
+        with open(git_files[0], 'r') as inp:
+            head = inp.read().split()
+        if len(head) == 2 and head[0] == 'ref:':
+            git_files.append(os.path.join(git_dir, head[1]))
+    except OSError:
+        pass
+    otc = shutil.which('otc-version-reporter')
+    crc_fp = 'phylo_snapshot/concrete_rank_collection.json'
+    return {'format': _PROVENANCE_FORMAT,
+            'propinquity_version': __version__,
+            'peyotl_version': peyotl.__version__,
+            'synth_id': CFG.synth_id,
+            'cleaning_flags': CFG.cleaning_flags,
+            'root_ott_id': CFG.root_ott_id,
+            'ott_version': read_ott_version(CFG),
+            'ott_taxonomy': _stat_key(os.path.join(CFG.ott_dir, 'taxonomy.tsv')),
+            'otc': _stat_key(otc) if otc else None,
+            'git': [_stat_key(i) for i in git_files],
+            'concrete_rank_collection': file_digest(crc_fp) if os.path.exists(crc_fp) else None,
+            }
+
+def write_provenance(CFG, out_fp=None):
+    """Writes logs/PROVENANCE_FN (the gen_config_annot document, the otcetera
+    version and the inputs), unless the existing file was generated from the
+    same inputs.
+
+    Returns the content of the file.
+    """
+    if out_fp is None:
+        out_fp = os.path.join(CFG.out_dir, 'logs', PROVENANCE_FN)
+    inputs = _provenance_inputs(CFG)
+    if os.path.exists(out_fp):
+        try:
+            blob = read_as_json(out_fp)
+        except Exception:
+            blob = {}
+        if blob.get('inputs') == inputs:
+            CFG.debug('Reusing the provenance in {}'.format(out_fp))
+            return blob
+    CFG.debug('Generating the provenance in {}'.format(out_fp))
+    otc_version_info = list(get_otc_version())
+    blob = {'inputs': inputs,
+            'otc_version': otc_version_info,
+            'config_annot': gen_config_annot(CFG, otc_version_info=otc_version_info)}
+    with WriteIfNeeded(out_fp, CFG=CFG) as outp:
+        write_as_json(blob, outp, indent=1)
+    return blob
+
+def load_provenance(CFG, fp=None):
+    """Returns the content of logs/PROVENANCE_FN (written by the provenance rule).
+
+    The file is only read (and kept on CFG). If it was generated from inputs
+    other than the current ones (e.g. a different otcetera executable or
+    propinquity git HEAD, which snakemake does not track), a warning is logged.
+    """
+    if not hasattr(CFG, "provenance"):
+        if fp is None:
+            fp = os.path.join(CFG.out_dir, 'logs', PROVENANCE_FN)
+        if not os.path.exists(fp):
+            raise RuntimeError('"{}" does not exist. Run the provenance rule first.'.format(fp))
+        blob = read_as_json(fp)
+        if blob.get('inputs') != _provenance_inputs(CFG):
+            m = '"{}" is out of date. Rerun the provenance rule (snakemake --forcerun provenance).'
+            CFG.warn(m.format(fp))
+        CFG.provenance = blob
+    return CFG.provenance
+
+def load_config_annot(CFG):
+    if not hasattr(CFG, "config_annot"):
+        CFG.config_annot = load_provenance(CFG)['config_annot']
+    return CFG.config_annot
+
+def config_annot_with_date(CFG):
+    """Returns a copy of the provenance annotations with the current time as "date_completed"."""
+    document = dict(load_config_annot(CFG))
+    document["date_completed"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return document
+
+
+def merge_annotations(in_1, in_2, out_fp, index_fp=None, CFG=None):
+    """Writes the annotations of `in_1` with the (small) top-level properties
+    of `in_2` that `in_1` lacks (and the index of the output if `index_fp` is given).
+    See stream_annotations.
+    """
+    stream_annotations(in_1, out_fp, indent=1, defaults=read_as_json(in_2),
+                       index_fp=index_fp, CFG=CFG)
+
+def gen_degree_dist_blocks(fn):
+    """Yields (tree name or None, [[out-degree, count], ...]) for each block of
+    an otc-degree-distribution style file.
+
+    Handles the concatenated files of the subproblem solutions, in which a
+    "<name>.tre" line precedes each "Out-degree\tCount" header, and the
+    multiple headers of the input degree distributions written by otc-solve-subproblem.
+    """
+    name, rows, in_block = None, [], False
+    with open(fn, 'r', encoding='utf-8') as inp:
         for n, line in enumerate(inp):
             ls = line.strip()
             if not ls:
                 continue
-            if expecting_header:
-                if header_pat.match(ls):
-                    raise ValueError('expecting a header at line {}, but found "{}"'.format(1 + n, ls))
-                expecting_header = False
+            if ls.startswith('Out-degree'):
+                if in_block:
+                    yield name, rows
+                    name = None
+                rows, in_block = [], True
+            elif ls.endswith('.tre'):
+                if in_block:
+                    yield name, rows
+                name, rows, in_block = ls, [], False
             else:
+                if not in_block:
+                    raise ValueError('expecting a header at line {} of "{}", but found "{}"'.format(1 + n, fn, ls))
                 row = ls.split()
-                assert len(row) == 2
-                dd.append([int(i) for i in row])
-    return dd
+                if len(row) != 2:
+                    raise ValueError('expecting 2 columns at line {} of "{}", but found "{}"'.format(1 + n, fn, ls))
+                rows.append([int(i) for i in row])
+    if in_block:
+        yield name, rows
+
+def parse_degree_dist(fn):
+    for name, rows in gen_degree_dist_blocks(fn):
+        return rows
+    return []
 
 def parse_otc_taxonomy_parser_lost_taxa(fn):
     l = stripped_nonempty_lines(fn)
@@ -1650,67 +4262,143 @@ def parse_otc_taxonomy_parser_lost_taxa(fn):
         ois.add(i)
     return ois
 
-def run_assessments(CFG):
-    summary = {}
-    num_errors = 0
+class _LazySection(object):
+    """Attribute that is read (by the method named `reader`) on first access.
+
+    The owner's instances need a `_section_lock` and a `_section_locks` dict.
+    Each section is read by one thread, while other sections can be read by others.
+    """
+    def __init__(self, reader):
+        self.reader = reader
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        with obj._section_lock:
+            lock = obj._section_locks.setdefault(self.name, threading.Lock())
+        with lock:
+            if self.name not in obj.__dict__:
+                obj.__dict__[self.name] = getattr(obj, self.reader)()
+            return obj.__dict__[self.name]
+
+def _read_ott_ids_pruned_for(cleaned_ott_json_fp, keys):
+    """Returns the set of the ids listed under `keys` of the "pruned" map of the cleaned_ott.json.
+
+    With ijson, the file is streamed and only those ids are built.
+    """
+    try:
+        import ijson
+    except ImportError:
+        pruned = read_as_json(cleaned_ott_json_fp).get('pruned', {})
+        ids = set()
+        for key in keys:
+            ids.update(pruned.get(key, []))
+        return ids
+    map_keys = frozenset('pruned.' + k for k in keys)
+    item_keys = frozenset(i + '.item' for i in map_keys)
+    ids = set()
+    with open(cleaned_ott_json_fp, 'rb') as inp:
+        for prefix, event, value in ijson.parse(inp):
+            if prefix in item_keys:
+                if event in ('number', 'string'):
+                    ids.add(value)
+            elif prefix in map_keys:
+                if event == 'map_key':
+                    ids.add(value)
+            elif prefix == 'pruned' and event == 'end_map':
+                break
+    return ids
+
+class AssessmentInputs(object):
+    """The outputs read by the assessments. Each is read (by one thread) when a check first uses it."""
+    broken_taxa = _LazySection('read_broken_taxa')
+    lost_taxa = _LazySection('read_lost_taxa')
+    htpruned_ids = _LazySection('read_htpruned_ids')
+    nodes_annotations = _LazySection('read_nodes_annotations')
+
     assessments_dir = 'assessments'
-    cleaned_taxonomy = os.path.join('cleaned_ott', 'cleaned_ott.tre')
-    cleaned_taxonomy_json = os.path.join('cleaned_ott', 'cleaned_ott.json')
-    final_tree = os.path.join('labelled_supertree', 'labelled_supertree.tre')
+    lt_file = os.path.join(assessments_dir, 'lost_taxa.txt')
+    lt_name = 'otc-taxonomy-parser lost-taxon'
+    bt_file = os.path.join('labelled_supertree', 'broken_taxa.json')
+    bt_name = 'otc-unprune-solution-and-name-unnamed-nodes broken_taxa.json'
+
+    def __init__(self, CFG):
+        self._CFG = CFG
+        self._section_lock = threading.Lock()
+        self._section_locks = {}
+
+    def read_broken_taxa(self):
+        """Returns the non-monophyletic taxa, and the map of id in tree -> aliases."""
+        bt_blob = read_as_json(self.bt_file)
+        bt_dict = bt_blob['non_monophyletic_taxa']
+        if not bt_dict:
+            bt_dict = {}
+        aliased_in_tree = bt_blob.get('taxa_matching_multiple_ott_ids')
+        if not aliased_in_tree:
+            aliased_in_tree = {}
+        return bt_dict, aliased_in_tree
+
+    def read_lost_taxa(self):
+        return parse_otc_taxonomy_parser_lost_taxa(self.lt_file)
+
+    def read_htpruned_ids(self):
+        # pruned because they became empty
+        return _read_ott_ids_pruned_for(os.path.join('cleaned_ott', 'cleaned_ott.json'),
+                                        ['higher-taxon-tip', 'empty-after-higher-taxon-tip-prune'])
+
+    def read_nodes_annotations(self):
+        return open_annotation_nodes(os.path.join('annotated_supertree', 'annotations.json'),
+                                     CFG=self._CFG)
+
+# name -> function(inputs, CFG) that returns a dict of the entries it adds to the summary
+ASSESSMENTS = {}
+
+def register_assessment(name):
+    """Decorator that adds a check to ASSESSMENTS (and thus to the checks of run_assessments)."""
+    def _register(func):
+        if name in ASSESSMENTS:
+            raise ValueError('An assessment named "{}" is already registered'.format(name))
+        ASSESSMENTS[name] = func
+        return func
+    return _register
+
+@register_assessment('num_tips')
+def assess_num_tips(inputs, CFG):
     # Check that we have the same # of leaves in the cleaned_ott and the final tree
-    #
-    tax_dd_file = os.path.join(assessments_dir, 'taxonomy_degree_distribution.txt')
-    supertree_dd_file = os.path.join(assessments_dir, 'supertree_degree_distribution.txt')
-    tdd = parse_degree_dist(tax_dd_file)
-    sdd = parse_degree_dist(supertree_dd_file)
+    tdd = parse_degree_dist(os.path.join(inputs.assessments_dir, 'taxonomy_degree_distribution.txt'))
+    sdd = parse_degree_dist(os.path.join(inputs.assessments_dir, 'supertree_degree_distribution.txt'))
     if tdd[0] != sdd[0]:
         CFG.error('The number of leaves differed between the taxonomy and supertree')
         nt = {'result':'ERROR', 'data':[tdd[0][1], sdd[0][1]]}
     else:
         nt = {'result':'OK', 'data': tdd[0][1]}
     nt['description'] = 'Check that the cleaned version of the taxonomy and the supertree have the same number of leaves'
-    summary['num_tips'] = nt
-    annot_file = os.path.join('annotated_supertree', 'annotations.json')
-    annotations = read_as_json(annot_file)
-    nodes_annotations = annotations['nodes']
+    return {'num_tips': nt}
+
+@register_assessment('lost_taxa')
+def assess_lost_taxa(inputs, CFG):
     # Check that otc-taxonomy-parser and otc-unprune-solution-and-name-unnamed-nodes
     #   agree on the number of taxa that were lost
-    #
-
-    lt_file = os.path.join(assessments_dir, 'lost_taxa.txt')
-    lt_name = 'otc-taxonomy-parser lost-taxon'
-    lt_pair  = [lt_file, lt_name]
-    lt_set = parse_otc_taxonomy_parser_lost_taxa(lt_file)
-    bt_file = os.path.join('labelled_supertree', 'broken_taxa.json')
-    bt_name = 'otc-unprune-solution-and-name-unnamed-nodes broken_taxa.json'
-    bt_pair  = [bt_file, bt_name]
-    bt_blob = read_as_json(bt_file)
-    bt_dict = bt_blob['non_monophyletic_taxa']
-    if not bt_dict:
-        bt_dict = {}
-
-    aliased_in_tree = bt_blob.get('taxa_matching_multiple_ott_ids')
-    if not aliased_in_tree:
-        aliased_in_tree = {}
+    lt_name, bt_name = inputs.lt_name, inputs.bt_name
+    lt_pair = [inputs.lt_file, lt_name]
+    bt_pair = [inputs.bt_file, bt_name]
+    lt_set = inputs.lost_taxa
+    bt_dict, aliased_in_tree = inputs.broken_taxa
+    htpruned_ids = inputs.htpruned_ids
     aliased_in_broken = {}
     for key_in_tree, v in aliased_in_tree.items():
         for in_broken in v:
             aliased_in_broken[str(in_broken)] = key_in_tree
-    cleaned_ott_json_pruned = read_as_json(cleaned_taxonomy_json).get('pruned', {})
-    # pruned because they became empty
-    httip_key = 'higher-taxon-tip'
-    int_key = 'empty-after-higher-taxon-tip-prune'
-    htpruned_ids = set()
-    for key in [httip_key, int_key]:
-        pl = set(cleaned_ott_json_pruned.get(key, []))
-        htpruned_ids.update(pl)
-
     lte = {}
     for ott_id in lt_set:
         ott_id_str = 'ott{}'.format(ott_id)
         if (ott_id_str not in bt_dict) \
            and (ott_id not in htpruned_ids) \
-           and (ott_id_str not in aliased_in_broken.keys()):
+           and (ott_id_str not in aliased_in_broken):
             CFG.error('{} was in {} but not {}'.format(repr(ott_id_str), lt_name, bt_name))
             lte[ott_id_str] = {'listed': lt_pair, 'absent': bt_pair}
     if bool(lte) or len(lt_set) != len(bt_dict):
@@ -1723,11 +4411,17 @@ def run_assessments(CFG):
         ltb = {'result': 'ERROR', 'data': [len(lt_set), lte]}
     else:
         ltb = {'result': 'OK', 'data': [len(lt_set)]}
-    # Check that 'supported_by' is not empty for any node in the tree
-    #
+    ltb['description'] = "Check that otcetera's otc-taxonomy-parser and otc-unprune-solution-and-name-unnamed-nodes tools agree about the number of taxa that are not present in the solution"
+    return {'lost_taxa': ltb}
+
+@register_assessment('tree_nodes')
+def assess_tree_nodes(inputs, CFG):
+    # Check that no "broken" taxon is in the tree, and that 'supported_by'
+    #   is not empty for any node in the tree
+    bt_dict = inputs.broken_taxa[0]
     unsup = {}
     broken_taxa_inc = []
-    for node_id, supp in nodes_annotations.items():
+    for node_id, supp in inputs.nodes_annotations.items():
         if node_id.startswith('ott'):
             if node_id in bt_dict:
                 CFG.error('Taxon {} found in tree but also in the list of "broken_taxa"'.format(node_id))
@@ -1736,54 +4430,82 @@ def run_assessments(CFG):
            and (('terminal' not in supp) or (not supp['terminal'])):
             CFG.error('Unsupported node: {}'.format(node_id))
             unsup[node_id] = supp
-    if broken_taxa_inc:
-        btb = {'result': 'ERROR', 'data': broken_taxa_inc}
-    else:
-        btb = {'result': 'OK', 'data': broken_taxa_inc}
-        if unsup:
-            ub = {'result': 'ERROR', 'data':unsup}
-        else:
-            ub = {'result': 'OK', 'data':unsup}
-    
-    ltb['description'] = "Check that otcetera's otc-taxonomy-parser and otc-unprune-solution-and-name-unnamed-nodes tools agree about the number of taxa that are not present in the solution"
+    btb = {'result': 'ERROR' if broken_taxa_inc else 'OK', 'data': broken_taxa_inc}
+    ub = {'result': 'ERROR' if unsup else 'OK', 'data': unsup}
     btb['description'] = 'Check that none of the taxa listed as "lost" are in the annotations file'
     ub['description'] = 'Check that none of the nodes listed in the annotations file are completely unsupported'
-    summary['lost_taxa'] = ltb
-    summary['lost_taxa_included_in_tree'] = btb
-    summary['unsupported_nodes'] = ub
+    return {'lost_taxa_included_in_tree': btb, 'unsupported_nodes': ub}
+
+@register_assessment('monophyly')
+def assess_monophyly(inputs, CFG):
     # Monophyly tests are env sensitive
-    if 'MONOPHYLY_TEST_CSV_FILE' in os.environ:
-        mp = []
-        n_failures, n_passes, n_skipped = 0, 0, 0
-        fn = os.environ['MONOPHYLY_TEST_CSV_FILE']
-        with open(fn) as inp:
-            for row in csv.reader(inp, delimiter=','):
-                ott_id = 'ott{}'.format(row[1])
-                if ott_id in nodes_annotations:
-                    n_passes += 1
-                elif ott_id in bt_dict:
-                    n_failures += 1
-                    CFG.error('Taxon {} from monophyly is not monophyletic in the tree'.format(ott_id))
-                    mp.append(ott_id)
-                else:
-                    skip_msg = 'Monophyly test for {} treated as a skipped test because the taxon is not in the lost taxa or in the tree. (it could be the case that the synthesis was run on a subset of the full taxonomy)\n'
-                    CFG.warning(skip_msg.format(ott_id))
-                    n_skipped += 1
-        if 'MONOPHYLY_TEST_SOURCE_NAME' in os.environ:
-            src = os.environ['MONOPHYLY_TEST_SOURCE_NAME']
-        else:
-            src = fn
-        if mp:
-            mtb = {'result': 'ERROR', 'data': [n_passes, n_skipped, n_failures, mp]}
-        else:
-            mtb = {'result': 'OK', 'data': [n_passes, n_skipped, n_failures, mp]}
-        mtb['description'] = 'Check that the taxa from the monophyly tests listed in {} are monophyletic in the tree.'.format(src)
-        summary['monophyly'] = mtb
-    else:
+    if 'MONOPHYLY_TEST_CSV_FILE' not in os.environ:
         CFG.error('MONOPHYLY_TEST_CSV_FILE is not in the env, so no monophyly tests are being run\n')
+        return {}
+    mp = []
+    n_failures, n_passes, n_skipped = 0, 0, 0
+    fn = os.environ['MONOPHYLY_TEST_CSV_FILE']
+    nodes_annotations = inputs.nodes_annotations
+    bt_dict = inputs.broken_taxa[0]
+    with open(fn) as inp:
+        for row in csv.reader(inp, delimiter=','):
+            ott_id = 'ott{}'.format(row[1])
+            if ott_id in nodes_annotations:
+                n_passes += 1
+            elif ott_id in bt_dict:
+                n_failures += 1
+                CFG.error('Taxon {} from monophyly is not monophyletic in the tree'.format(ott_id))
+                mp.append(ott_id)
+            else:
+                skip_msg = 'Monophyly test for {} treated as a skipped test because the taxon is not in the lost taxa or in the tree. (it could be the case that the synthesis was run on a subset of the full taxonomy)\n'
+                CFG.warning(skip_msg.format(ott_id))
+                n_skipped += 1
+    src = os.environ.get('MONOPHYLY_TEST_SOURCE_NAME', fn)
+    if mp:
+        mtb = {'result': 'ERROR', 'data': [n_passes, n_skipped, n_failures, mp]}
+    else:
+        mtb = {'result': 'OK', 'data': [n_passes, n_skipped, n_failures, mp]}
+    mtb['description'] = 'Check that the taxa from the monophyly tests listed in {} are monophyletic in the tree.'.format(src)
+    return {'monophyly': mtb}
+
+def _timed_assessment(name, func, inputs, CFG):
+    start = time.perf_counter()
+    entries = func(inputs, CFG)
+    elapsed = time.perf_counter() - start
+    CFG.debug('assessment "{}" took {:.3f} seconds'.format(name, elapsed))
+    for v in entries.values():
+        v['seconds'] = round(elapsed, 3)
+    return entries
+
+def run_assessments(CFG, num_workers=None, names=None):
+    """Runs the checks of ASSESSMENTS (or those named in `names`) and writes assessments/summary.json.
+
+    The checks run in `num_workers` threads (default: CFG.num_assessment_workers) and share the
+    inputs, which are each read once. Each entry of the summary has the "seconds" its check took.
+    """
+    if names is None:
+        names = list(ASSESSMENTS.keys())
+    for name in names:
+        if name not in ASSESSMENTS:
+            raise ValueError('Unknown assessment "{}". Expecting one of: {}'.format(name, ', '.join(ASSESSMENTS)))
+    if num_workers is None:
+        num_workers = getattr(CFG, 'num_assessment_workers', 1)
+    inputs = AssessmentInputs(CFG)
+    if num_workers < 2 or len(names) < 2:
+        results = [_timed_assessment(n, ASSESSMENTS[n], inputs, CFG) for n in names]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = [executor.submit(_timed_assessment, n, ASSESSMENTS[n], inputs, CFG) for n in names]
+            results = [f.result() for f in futures]
+    summary = {}
+    for name, entries in zip(names, results):
+        for key, v in entries.items():
+            if key in summary:
+                raise RuntimeError('Summary entry "{}" of assessment "{}" was already written'.format(key, name))
+            summary[key] = v
     # serialize the summary
     #
-    write_as_json(summary, os.path.join(assessments_dir, 'summary.json'), indent=2)
+    write_as_json(summary, os.path.join(AssessmentInputs.assessments_dir, 'summary.json'), indent=2)
 
 def combine_ott_cleaning_logs(in_1, in_pruned, out_fp, CFG=None):
     blob = read_as_json(in_1)
@@ -1849,6 +4571,7 @@ TEMPLATE_FNS=['annotated_supertree_index.pt',
               'labelled_supertree_index.pt',
               'phylo_input_index.pt',
               'phylo_snapshot_index.pt',
+              'resource_usage.pt',
               'reversed_subproblems_index.pt',
               'reversed_subproblem_solutions_index.pt',
               'subott_dir_index.pt',
@@ -1858,17 +4581,28 @@ TEMPLATE_FNS=['annotated_supertree_index.pt',
 _TEMPLATES = ['static/templates/{}'.format(i) for i in TEMPLATE_FNS]
 
 
-def document_outputs(summary_fp, CFG=None):
+# the pages that are outputs of the html rule, so they are rendered even if `pages` are listed
+DOC_RULE_OUTPUT_PAGES = ('index', 'subproblems/index')
+
+def document_outputs(summary_fp, CFG=None, pages=None):
+    """Writes the docs. `pages` is an optional list of the pages (e.g. "assessments/index") to regenerate.
+
+    The DOC_RULE_OUTPUT_PAGES are always rendered, because snakemake removes them before the html rule runs.
+    """
     if CFG is not None:
-        CFG.config_annot = gen_config_annot(CFG)
-    for i in _STATIC_MD:
-        assert i.startswith('static/')
-        sans_stat = i[len('static/'):]
-        content = pkgutil.get_data('propinquity', i).decode('utf-8')
-        # print(content)
-        write_if_needed(fp=sans_stat, content=content, CFG=CFG)
+        load_config_annot(CFG)
+    if pages is not None:
+        pages = list(pages) + [i for i in DOC_RULE_OUTPUT_PAGES if i not in pages]
+    else:
+        for i in _STATIC_MD:
+            assert i.startswith('static/')
+            sans_stat = i[len('static/'):]
+            content = pkgutil.get_data('propinquity', i).decode('utf-8')
+            # print(content)
+            write_if_needed(fp=sans_stat, content=content, CFG=CFG)
     dg = DocGen(CFG)
-    dg.render()
+    num_workers = 1 if CFG is None else CFG.num_docgen_workers
+    dg.render(pages=pages, num_workers=num_workers)
 
 def get_template_text(fn):
     rb = pkgutil.get_data('propinquity', 'static/templates/{}'.format(fn))
@@ -1904,12 +4638,10 @@ def get_runtime_configuration(CFG):
             config.ott_major_minor_version = m.group(1)
         else:
             config.ott_major_minor_version = 'NOT built using OTT'
-        if not hasattr(CFG, "config_annot"):
-            CFG.config_annot = gen_config_annot(CFG)
-        config.config_annot = CFG.config_annot
+        config.config_annot = config_annot_with_date(CFG)
         return config
     config = parse_config_as_extensible(CFG)
-    x = get_otc_version()
+    x = load_provenance(CFG)['otc_version']
     config.otc_sha, config.otc_version, config.otc_boost_version = x
     x = get_peyotl_version(CFG)
     config.peyotl_version, config.peyotl_sha = x
@@ -1944,33 +4676,9 @@ def parse_subproblem_solutions_degree_dist(fn):
     return x
 
 def gen_degree_dist(fn):
-    header_pat = re.compile(r'Out-degree\S+Count')
-    with open(fn, 'r') as inp:
-        lines = stripped_nonempty_lines(fn)
-        rfn = None
-        expecting_header = False
-        dd = []
-        for n, line in enumerate(inp):
-            ls = line.strip()
-            if not ls:
-                continue
-            if expecting_header:
-                if header_pat.match(ls):
-                    raise ValueError('expecting a header at line {}, but found "{}"'.format(1 + n, ls))
-                expecting_header = False
-            else:
-                if ls.endswith('.tre'):
-                    if rfn:
-                        yield rfn, dd
-                    dd = []
-                    rfn = ls
-                    expecting_header = True
-                else:
-                    row = ls.split()
-                    assert len(row) == 2
-                    dd.append([int(i) for i in row])
-        if rfn:
-            yield rfn, dd
+    for name, rows in gen_degree_dist_blocks(fn):
+        if name:
+            yield name, rows
 
 def render_top_index(container, template, html_out, json_out):
     write_as_json({'config' : container.config.__dict__}, json_out)
@@ -2019,6 +4727,7 @@ def render_subproblems_index(container, template, html_out, json_out):
 
 def render_reversed_subproblems_index(container, template, html_out, json_out):
     html_out.write(template(subproblems=container.subproblems,
+                            reversed_check=container.reversed_check,
                             doc_gen=container))
 
 def render_subproblem_solutions_index(container, template, html_out, json_out):
@@ -2029,7 +4738,8 @@ def render_subproblem_solutions_index(container, template, html_out, json_out):
 def render_reversed_subproblem_solutions_index(container, template, html_out, json_out):
     # note that we just use the already-parsed subproblem_solutions object here
     html_out.write(template(subproblems=container.subproblems,
-                            subproblem_solutions=container.subproblem_solutions))
+                            subproblem_solutions=container.subproblem_solutions,
+                            reversed_check=container.reversed_check))
 
 
 def render_grafted_solution_index(container, template, html_out, json_out):
@@ -2043,6 +4753,9 @@ def render_annotated_supertree_index(container, template, html_out, json_out):
     html_out.write(template())
 def render_assessments_index(container, template, html_out, json_out):
     html_out.write(template(assessments=container.assessments))
+def render_resource_usage(container, template, html_out, json_out):
+    write_as_json({'resource_usage': container.resource_usage}, json_out)
+    html_out.write(template(resource_usage=container.resource_usage))
 # def render_broken_taxa_report(container, template, html_out, json_out):
 #     html_out.write(template(broken_taxa=container.broken_taxa))
 
@@ -2095,21 +4808,16 @@ def node_label2obj(nl):
 # add OTT metadata to the monophyletic taxa blob
 def add_taxonomy_metadata(non_monophyletic_taxa, ott_dir):
     broken_taxa = non_monophyletic_taxa['non_monophyletic_taxa']
-    taxonomy = OTT(ott_dir=ott_dir)
-    id2names = taxonomy.ott_id_to_names
-    id2ranks = taxonomy.ott_id_to_ranks
+    taxonomy = open_ott_index(ott_dir)
 
     for oid in broken_taxa:
         pattern = re.compile(r'ott')
         int_id = int(re.sub(pattern,'',oid))
         name = "no name"
         rank = "no rank"
-        if int_id in id2names:
-            name = id2names[int_id]
-            if (isinstance(name,tuple)):
-                name = name[0]
-            if int_id in id2ranks:
-                rank = id2ranks[int_id]
+        if int_id in taxonomy:
+            name = taxonomy.get_name(int_id)
+            rank = taxonomy.get_rank(int_id, rank)
         # print(oid,name,rank)
         broken_taxa[oid]['name'] = name
         broken_taxa[oid]['rank'] = rank
@@ -2123,26 +4831,57 @@ def demand_fp(fp):
 _ott_num_extractor = re.compile(r'^ott([0-9]+)[^0-9].*')
 _sid_tid_extractor = re.compile(r'^tree_([^@]+)@([^.]+)$')
 
+# (render function, template, output path without the .html/.json suffix) for each page
+DOC_PAGES = ((render_top_index, 'top_index.pt', 'index'),
+             (render_no_vars_index, 'subott_dir_index.pt', 'subott_dir/index'),
+             (render_phylo_input_index, 'phylo_input_index.pt', 'phylo_input/index'),
+             (render_phylo_snapshot_index, 'phylo_snapshot_index.pt', 'phylo_snapshot/index'),
+             (render_cleaned_phylo_index, 'cleaned_phylo_index.pt', 'cleaned_phylo/index'),
+             (render_cleaned_ott_index, 'cleaned_ott_index.pt', 'cleaned_ott/index'),
+             (render_no_vars_index, 'bumped_ott_index.pt', 'bumped_ott/index'),
+             (render_exemplified_phylo_index, 'exemplified_phylo_index.pt', 'exemplified_phylo/index'),
+             (render_subproblems_index, 'subproblems_index.pt', 'subproblems/index'),
+             (render_reversed_subproblems_index, 'reversed_subproblems_index.pt', 'reversed_subproblems/index'),
+             (render_subproblem_solutions_index, 'subproblem_solutions_index.pt', 'subproblem_solutions/index'),
+             (render_reversed_subproblem_solutions_index, 'reversed_subproblem_solutions_index.pt', 'reversed_subproblem_solutions/index'),
+             (render_grafted_solution_index, 'grafted_solution_index.pt', 'grafted_solution/index'),
+             (render_labelled_supertree_index, 'labelled_supertree_index.pt', 'labelled_supertree/index'),
+             (render_annotated_supertree_index, 'annotated_supertree_index.pt', 'annotated_supertree/index'),
+             (render_assessments_index, 'assessments_index.pt', 'assessments/index'),
+             (render_resource_usage, 'resource_usage.pt', 'logs/resource_usage'),
+            )
+
 class DocGen(object):
+    """Reads the outputs of a run and renders the html docs.
+
+    The sections (phylo_input, subproblems, ...) are only read when a page
+    first uses them, so rendering a few pages only reads what they need.
+    """
+    phylo_input = _LazySection('read_phylo_input')
+    phylo_snapshot = _LazySection('read_phylo_snapshot')
+    cleaned_ott = _LazySection('read_cleaned_ott')
+    exemplified_phylo = _LazySection('read_exemplified_phylo')
+    subproblem_solutions = _LazySection('read_subproblem_solutions')
+    subproblems = _LazySection('read_subproblems')
+    reversed_check = _LazySection('read_reversed_check')
+    labelled_supertree = _LazySection('read_labelled_supertree')
+    assessments = _LazySection('read_assessments')
+    resource_usage = _LazySection('read_resource_usage')
+
     def __init__(self, CFG):
         self.top_output_dir = os.path.abspath(os.curdir)
         self._int_ott_dir = os.path.join(self.top_output_dir, 'subott_dir')
         self._ott = None
+        self._CFG = CFG
+        self._section_lock = threading.Lock()
+        self._section_locks = {}
         self.config = get_runtime_configuration(CFG)
-        self.phylo_input = self.read_phylo_input()
-        self.phylo_snapshot = self.read_phylo_snapshot()
-        self.cleaned_ott = self.read_cleaned_ott()
-        self.exemplified_phylo = self.read_exemplified_phylo()
-        self.subproblem_solutions = self.read_subproblem_solutions()
-        self.subproblems = self.read_subproblems()
-        self.labelled_supertree = self.read_labelled_supertree()
-        self.assessments = self.read_assessments()
         #self.broken_taxa = self.read_broken_taxa()
 
     @property
     def ott(self):
         if self._ott is None:
-            self._ott = OTT(ott_dir=self._int_ott_dir)
+            self._ott = open_ott_index(self._int_ott_dir)
         return self._ott
     
     def ott_id_number_str(self, ott_id):
@@ -2202,7 +4941,7 @@ class DocGen(object):
         if blob.non_monophyletic_taxa['non_monophyletic_taxa'] is None:
             blob.non_monophyletic_taxa['non_monophyletic_taxa'] = {}
         blob.non_monophyletic_taxa = add_taxonomy_metadata(blob.non_monophyletic_taxa,
-                                                           ott_dir=self.config.ott_root)
+                                                           ott_dir=self._int_ott_dir)
         return blob
     
     def read_subproblem_solutions(self):
@@ -2215,6 +4954,19 @@ class DocGen(object):
         sdd = os.path.join(d, 'solution-degree-distributions.txt')
         return self._get_soln_blob(sdd)
 
+    def read_resource_usage(self):
+        fp = os.path.join(self.top_output_dir, 'logs', RESOURCE_LOG_FN)
+        if not os.path.exists(fp):
+            return []
+        return summarize_resource_usage(fp)
+
+    def read_reversed_check(self):
+        fp = os.path.join(self.top_output_dir, 'reversed_subproblem_solutions', 'solution-ids.txt')
+        blob = Extensible()
+        blob.mode = self._CFG.reversed_solve_mode
+        blob.tree_files = stripped_nonempty_lines(fp) if os.path.exists(fp) else []
+        return blob
+
     def _get_soln_blob(self, sdd):
         demand_fp(os.path.exists(sdd))
         blob = Extensible()
@@ -2340,40 +5092,40 @@ class DocGen(object):
         return blob
     
     def _cham_out(self, fn):
-        fp = os.path.join(self.top_output_dir, fn)
-        fo = codecs.open(fp, 'w', encoding='utf-8')
-        return fo
+        # pages are only rewritten if their content changed
+        return WriteIfNeeded(os.path.join(self.top_output_dir, fn))
+
+    def _render_page(self, func, template, prefix):
+        with self._cham_out(prefix + '.html') as html_o:
+            with self._cham_out(prefix + '.json') as json_o:
+                func(self, template, html_o, json_o)
 
-    def render(self):
+    def render(self, pages=None, num_workers=1):
+        """Renders the DOC_PAGES (or only those whose prefix is in `pages`).
+
+        If `num_workers` > 1, pages are rendered by a pool of threads. The
+        templates are loaded (and compiled) before that.
+        """
+        todo = list(DOC_PAGES)
+        if pages is not None:
+            pages = set(pages)
+            unknown = pages.difference([i[2] for i in DOC_PAGES])
+            if unknown:
+                raise ValueError('Unknown doc page(s): {}'.format(', '.join(sorted(unknown))))
+            todo = [i for i in todo if i[2] in pages]
         templates = PageTemplateLoader("logs/templates")
-        src_dest_list = ((render_top_index, 'top_index.pt', 'index'),
-                         (render_no_vars_index, 'subott_dir_index.pt', 'subott_dir/index'),
-                         (render_phylo_input_index, 'phylo_input_index.pt', 'phylo_input/index'),
-                         (render_phylo_snapshot_index, 'phylo_snapshot_index.pt', 'phylo_snapshot/index'),
-                         (render_cleaned_phylo_index, 'cleaned_phylo_index.pt', 'cleaned_phylo/index'),
-                         (render_cleaned_ott_index, 'cleaned_ott_index.pt', 'cleaned_ott/index'),
-                         (render_no_vars_index, 'bumped_ott_index.pt', 'bumped_ott/index'),
-                         (render_exemplified_phylo_index, 'exemplified_phylo_index.pt', 'exemplified_phylo/index'),
-                         (render_subproblems_index, 'subproblems_index.pt', 'subproblems/index'),
-                         (render_reversed_subproblems_index, 'reversed_subproblems_index.pt', 'reversed_subproblems/index'),
-                         (render_subproblem_solutions_index, 'subproblem_solutions_index.pt', 'subproblem_solutions/index'),
-                         (render_reversed_subproblem_solutions_index, 'reversed_subproblem_solutions_index.pt', 'reversed_subproblem_solutions/index'),
-                         (render_grafted_solution_index, 'grafted_solution_index.pt', 'grafted_solution/index'),
-                         (render_labelled_supertree_index, 'labelled_supertree_index.pt', 'labelled_supertree/index'),
-                         (render_annotated_supertree_index, 'annotated_supertree_index.pt', 'annotated_supertree/index'),
-                         (render_assessments_index, 'assessments_index.pt', 'assessments/index'),
-                        )
-        for func, tn, prefix in src_dest_list:
-            html_path = prefix + '.html'
-            json_path = prefix + '.json'
-            t = templates[tn]
-            html_o = self._cham_out(html_path)
-            json_o = self._cham_out(json_path)
-            try:
-                func(self, t, html_o, json_o)
-            finally:
-                html_o.close()
-                json_o.close()
+        todo = [(func, templates[tn], prefix) for func, tn, prefix in todo]
+        # compile in this thread, rather than racing to do it in the workers
+        for t in [templates['head.pt']] + [i[1] for i in todo]:
+            t.cook_check()
+        if num_workers > 1 and len(todo) > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+                futures = [executor.submit(self._render_page, *i) for i in todo]
+                for f in futures:
+                    f.result()
+        else:
+            for i in todo:
+                self._render_page(*i)
 
 
 def suppress_non_listed_ids_or_unnamed(in_tree_fp,
@@ -2419,8 +5171,8 @@ def suppress_non_listed_ids_or_unnamed(in_tree_fp,
         if node.edge:
             node.edge.collapse()
 
-    content = tree.as_string(schema="newick")
-    write_if_needed(fp=out_tree_fp, content=content, CFG=CFG)
+    with WriteIfNeeded(out_tree_fp, CFG=CFG) as outp:
+        tree.write(file=outp, schema="newick")
 
 
 def indented_taxon_count_to_json_for_ott(inp_fp, out_fp, CFG=None):
@@ -2450,44 +5202,68 @@ def create_indented_tip_count(tree_fp, indented_txt_fp, CFG=None):
 
 
 def count_tips_and_inf_splits(deg_dist_fp, CFG=None):
-    all_pairs = []
-    cur_pair = None
-    with open(deg_dist_fp, 'r', encoding='utf-8') as inp:
-        for line in inp:
-            if not line.strip():
-                continue
-            if line.startswith('Out-degree'):
-                if cur_pair:
-                    all_pairs.append(cur_pair)
-                cur_pair = [0, 0]
-                continue
-            out_degree, count = [int(i) for i in line.strip().split()]
-            if out_degree == 0:
-                cur_pair[0] = count
-            elif out_degree > 1:
-                assert cur_pair[0] > 0
-                if out_degree < cur_pair[0]:
-                    cur_pair[1] = cur_pair[1] + count
-    if cur_pair:
-        all_pairs.append(cur_pair)
-    return all_pairs
+    return [tips_and_inf_splits(dict(rows)) for name, rows in gen_degree_dist_blocks(deg_dist_fp)]
 
-def generate_subprob_size_summary(subpr_index_json_fp,
-                                  num_tips_per_ott_fp,
-                                  deg_dist_dir,
-                                  out_fp,
-                                  CFG=None):
+################################################################################
+# Columnar summary of the subproblem sizes
+#
+# `build_subprob_size_store` reads subproblems/index.json, the synth tip counts
+#   and the input degree distributions of each subproblem once, and writes
+#   SUBPROB_SIZE_STORE_FN. The subproblem_size_summary.json and .tsv files are
+#   written from a SubprobSizeStore, which also answers "top N" queries.
+# Layout (native byte order, every section 8-byte aligned) as in the OTT index:
+#   magic, uint32 length of the JSON header (which holds the subproblem ids and
+#   the input tree ids), JSON header, then the sections:
+#     num_leaves       int64[n]    # of leaves in the subproblem
+#     num_synth_leaves int64[n]    # of tips of the subproblem's taxon in the supertree
+#     num_splits       int64[n]    sum of the informative splits of the inputs
+#     num_inf_inputs   int32[n]    # of inputs (including the taxonomy) with an informative split
+#     input_off        uint64[n+1] offsets of the subproblem's inputs in the input_* sections
+#     input_tree       int32[m]    index into the header's "tree_ids"
+#     input_tips       int64[m]    # of tips of the input in the subproblem
+#     input_splits     int64[m]    # of informative splits of the input
+# Subproblems are in the order of "sorted_by_num_phylo_inputs" of index.json.
+
+SUBPROB_SIZE_STORE_FN = 'subproblem_size_summary.bin'
+_SUBPROB_SIZE_MAGIC = b'PROPSSZ1'
+_SUBPROB_SIZE_SECTIONS = (('num_leaves', 'q'), ('num_synth_leaves', 'q'),
+                          ('num_splits', 'q'), ('num_inf_inputs', 'i'),
+                          ('input_off', 'Q'), ('input_tree', 'i'),
+                          ('input_tips', 'q'), ('input_splits', 'q'))
+SUBPROB_SIZE_TSV_HEADER = ("ID",
+                           "num_scaff_leaves",
+                           "num_synth_leaves",
+                           "num_splits",
+                           "num_informative_input_trees",
+                           "num_noninformative_overlapping_input_trees",
+                           "inf_tree_ids",
+                           "noninf_tree_ids")
+
+def build_subprob_size_store(subpr_index_json_fp,
+                             num_tips_per_ott_fp,
+                             deg_dist_dir,
+                             out_fp,
+                             CFG=None):
+    """Writes the SubprobSizeStore file `out_fp` in one pass over the inputs.
+
+    Returns True if the file changed.
+    """
     index_blob = read_as_json(subpr_index_json_fp)
     nsynth_tip_blob = read_as_json(num_tips_per_ott_fp)
     tree_list = []
     tree_to_index = {}
-    sub_obj = {}
+    sub_ids = []
+    seen = set()
+    sections = {name: array(typecode) for name, typecode in _SUBPROB_SIZE_SECTIONS}
+    sections['input_off'].append(0)
+    taxonomy_inds = []
     for blob in index_blob["subproblems"]["sorted_by_num_phylo_inputs"]:
         subprob_tree_file, inp_tree_list, num_leaves = blob
         assert subprob_tree_file.startswith("ott")
         assert subprob_tree_file.endswith(".tre")
         subprob_id = subprob_tree_file[:-4]
-        assert subprob_id not in sub_obj
+        assert subprob_id not in seen
+        seen.add(subprob_id)
         tree_ind_list = []
         taxonomy_found = False
         for tree_id in inp_tree_list:
@@ -2502,60 +5278,141 @@ def generate_subprob_size_summary(subpr_index_json_fp,
                 tree_list.append(tree_id)
             tree_ind_list.append(inp_tree_ind)
         assert taxonomy_found
-        fn = "deg-dist-{}.txt".format(subprob_id)
-        dd_fp = os.path.join(deg_dist_dir, fn)
+        dd_fp = os.path.join(deg_dist_dir, "deg-dist-{}.txt".format(subprob_id))
         tips_and_inf_spl = count_tips_and_inf_splits(dd_fp)
-        curr = {'num_leaves': num_leaves,
-                'num_synth_leaves': nsynth_tip_blob[subprob_id],
-                'tree_indices': tree_ind_list,
-                'tree_tips_and_inf_splits': tips_and_inf_spl
-               }
-        sub_obj[subprob_id] = curr
-
+        # the taxonomy is the last input
+        assert len(tree_ind_list) + 1 == len(tips_and_inf_spl)
+        taxonomy_inds.append(len(sections['input_tree']) + len(tree_ind_list))
+        tree_ind_list.append(-1)
+        num_splits, num_inf = 0, 0
+        for tree_index, (num_tips, num_inf_splits) in zip(tree_ind_list, tips_and_inf_spl):
+            sections['input_tree'].append(tree_index)
+            sections['input_tips'].append(num_tips)
+            sections['input_splits'].append(num_inf_splits)
+            if num_inf_splits > 0:
+                num_splits += num_inf_splits
+                num_inf += 1
+        sub_ids.append(subprob_id)
+        sections['num_leaves'].append(num_leaves)
+        sections['num_synth_leaves'].append(nsynth_tip_blob[subprob_id])
+        sections['num_splits'].append(num_splits)
+        sections['num_inf_inputs'].append(num_inf)
+        sections['input_off'].append(len(sections['input_tree']))
+    # the taxonomy comes after the phylogenetic inputs in the list of tree ids
     taxonomy_index = len(tree_list)
     tree_list.append('TAXONOMY')
-    compressed_obj = {}
-    for key, value in sub_obj.items():
-        nl = value['num_leaves']
-        nsl = value['num_synth_leaves']
-        til = value['tree_indices']
-        ttais = value['tree_tips_and_inf_splits']
-        til.append(taxonomy_index)
-        assert len(til) == len(ttais)
-        concat = []
-        for tree_index, nt_inf_sp_pair in itertools.zip_longest(til, ttais):
-            num_tips, num_splits = nt_inf_sp_pair
-            concat.append([num_tips, num_splits, tree_index])
-        compressed_obj[key]  = [nl, nsl, concat]
-
-    blob = {"subproblems": compressed_obj,
-           "tree_ids": tree_list}
-    write_as_json_if_needed(blob=blob, fp=out_fp, CFG=CFG)
-
-def format_subprob_size_json_as_tsv(inp_fp, out_fp, CFG=None):
-    summary_blob = read_as_json(inp_fp)
-    subprobs = summary_blob["subproblems"]
-    tree_ids = summary_blob["tree_ids"]
-    lines = ['\t'.join(["ID",
-                     "num_scaff_leaves",
-                     "num_synth_leaves",
-                     "num_splits",
-                     "num_informative_input_trees",
-                     "num_noninformative_overlapping_input_trees",
-                     "inf_tree_ids",
-                     "noninf_tree_ids"])]
-    for ott_id, summary_blob in subprobs.items():
-        num_scaff_leaves, num_synth_leaves, by_input = summary_blob
-        inf_by_inp, non_inf = [], []
-        num_splits = 0
-        for el in by_input:
-            tid = tree_ids[el[2]]
-            if el[1] > 0:
-                num_splits += el[1]
-                inf_by_inp.append(tid)
-            else:
-                non_inf.append(tid)    
-        data = [ott_id, num_scaff_leaves, num_synth_leaves, num_splits, len(inf_by_inp), len(non_inf), ','.join(inf_by_inp), ','.join(non_inf)]
-        lines.append('\t'.join([str(i) for i in data]))
-    content = '{}\n'.format('\n'.join(lines))
-    return write_if_needed(out_fp, content, name=None, CFG=CFG)
\ No newline at end of file
+    for i in taxonomy_inds:
+        sections['input_tree'][i] = taxonomy_index
+    header = {'subproblem_ids': sub_ids,
+              'tree_ids': tree_list}
+    return _write_sectioned_file(out_fp, _SUBPROB_SIZE_MAGIC, header, _SUBPROB_SIZE_SECTIONS,
+                                 sections, CFG=CFG)
+
+
+class SubprobSizeStore(object):
+    """Read-only view of a file written by `build_subprob_size_store`.
+
+    Per-subproblem columns (num_leaves, num_synth_leaves, num_splits,
+    num_inf_inputs, input_off) are sequences in the order of `subproblem_ids`.
+    """
+    TOP_KEYS = ('splits', 'leaves', 'synth_leaves', 'input_trees', 'inf_input_trees')
+
+    def __init__(self, fp):
+        self.fp = fp
+        with open(fp, 'rb') as inp:
+            content = inp.read()
+        # the columns are views into `content`
+        header, sections = _parse_sectioned_file(memoryview(content), _SUBPROB_SIZE_MAGIC, fp,
+                                                 'a subproblem size summary')
+        self.subproblem_ids = header['subproblem_ids']
+        self.tree_ids = header['tree_ids']
+        for name, sec in sections.items():
+            setattr(self, name, sec)
+        self._row_by_id = None
+
+    def __len__(self):
+        return len(self.subproblem_ids)
+
+    def row(self, subprob_id):
+        if self._row_by_id is None:
+            self._row_by_id = {i: n for n, i in enumerate(self.subproblem_ids)}
+        return self._row_by_id[subprob_id]
+
+    def inputs(self, row):
+        """Returns [num_tips, num_inf_splits, tree_index] for each input of the subproblem in `row`."""
+        return [[self.input_tips[i], self.input_splits[i], self.input_tree[i]]
+                for i in range(self.input_off[row], self.input_off[row + 1])]
+
+    def num_input_trees(self, row):
+        """# of phylogenetic inputs (not counting the taxonomy) of the subproblem in `row`."""
+        return self.input_off[row + 1] - self.input_off[row] - 1
+
+    def top(self, n, by='splits'):
+        """Returns the [(subproblem id, value), ...] of the `n` largest subproblems.
+
+        `by` is one of TOP_KEYS.
+        """
+        if by == 'splits':
+            col = self.num_splits
+        elif by == 'leaves':
+            col = self.num_leaves
+        elif by == 'synth_leaves':
+            col = self.num_synth_leaves
+        elif by == 'inf_input_trees':
+            col = self.num_inf_inputs
+        elif by == 'input_trees':
+            col = [self.num_input_trees(i) for i in range(len(self))]
+        else:
+            raise ValueError('Expecting "by" to be one of: {}'.format(', '.join(self.TOP_KEYS)))
+        rows = heapq.nlargest(n, range(len(self)), key=col.__getitem__)
+        return [(self.subproblem_ids[i], col[i]) for i in rows]
+
+    def as_json_blob(self):
+        """Returns the content of subproblem_size_summary.json."""
+        compressed_obj = {}
+        for row, sub_id in enumerate(self.subproblem_ids):
+            compressed_obj[sub_id] = [self.num_leaves[row], self.num_synth_leaves[row], self.inputs(row)]
+        return {"subproblems": compressed_obj,
+                "tree_ids": self.tree_ids}
+
+    def write_json(self, out_fp, CFG=None):
+        return write_as_json_if_needed(blob=self.as_json_blob(), fp=out_fp, CFG=CFG)
+
+    def write_tsv(self, out_fp, CFG=None):
+        tree_ids = self.tree_ids
+        with WriteIfNeeded(out_fp, CFG=CFG) as outp:
+            outp.write('\t'.join(SUBPROB_SIZE_TSV_HEADER) + '\n')
+            # rows sorted by id
+            for row in sorted(range(len(self)), key=self.subproblem_ids.__getitem__):
+                sub_id = self.subproblem_ids[row]
+                inf_by_inp, non_inf = [], []
+                for i in range(self.input_off[row], self.input_off[row + 1]):
+                    tid = tree_ids[self.input_tree[i]]
+                    if self.input_splits[i] > 0:
+                        inf_by_inp.append(tid)
+                    else:
+                        non_inf.append(tid)
+                data = [sub_id, self.num_leaves[row], self.num_synth_leaves[row], self.num_splits[row],
+                        len(inf_by_inp), len(non_inf), ','.join(inf_by_inp), ','.join(non_inf)]
+                outp.write('\t'.join([str(i) for i in data]) + '\n')
+        return outp.changed
+
+
+def generate_subprob_size_summary(subpr_index_json_fp,
+                                  num_tips_per_ott_fp,
+                                  deg_dist_dir,
+                                  out_fp,
+                                  store_fp=None,
+                                  tsv_fp=None,
+                                  CFG=None):
+    """Builds the SubprobSizeStore (next to `out_fp` by default), and writes
+    its JSON view to `out_fp` and (if `tsv_fp` is given) its TSV view.
+    """
+    if store_fp is None:
+        store_fp = os.path.join(os.path.split(out_fp)[0], SUBPROB_SIZE_STORE_FN)
+    build_subprob_size_store(subpr_index_json_fp, num_tips_per_ott_fp, deg_dist_dir, store_fp, CFG=CFG)
+    store = SubprobSizeStore(store_fp)
+    store.write_json(out_fp, CFG=CFG)
+    if tsv_fp is not None:
+        store.write_tsv(tsv_fp, CFG=CFG)
+    return store
@@ -63,6 +63,7 @@ setup(
                       "chameleon>=3.8.1",
                       "DendroPy>=4.4.0",
                      ],
+    extras_require={"ijson": ["ijson>=3.1"]},
     packages=PACKAGES,
     package_data={'propinquity': ['static/*',
                                   'static/*/*.html',
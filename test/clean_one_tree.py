@@ -5,6 +5,7 @@ import sys
 import os
 from propinquity import (clean_one_phylo_input,
                          is_int_type,
+                         open_ott_index,
                          OTT,
                          read_as_json,
                          validate_config,
@@ -43,8 +44,8 @@ def main(args):
     else:
         os.mkdir(output_dir)
     assert os.path.isfile(nexson_fp)
-    CFG.debug(f"Reading OTT at {CFG.ott_dir}")
-    ott = OTT(ott_dir=CFG.ott_dir)
+    CFG.debug(f"Reading OTT index at {CFG.ott_dir}")
+    ott = open_ott_index(CFG.ott_dir, CFG=CFG)
     cleaning_flags = CFG.cleaning_flags
     if cleaning_flags is None:
         cleaning_flags = OTT.TREEMACHINE_SUPPRESS_FLAGS
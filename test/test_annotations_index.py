@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Round-trip tests of stream_annotations and the AnnotationsIndex of its output."""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import propinquity
+from propinquity import (AnnotationsIndex,
+                         annotations_index_path,
+                         merge_annotations,
+                         open_annotation_nodes,
+                         stream_annotations,
+                         )
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+_NODES = {'ott2': {'supported_by': {'ot_1@tree1': 'node2'}, 'x': 1.5},
+          'ott10': {'conflicts_with': {'pg_1@t2': ['n1', 'n2é']}},
+          'mrcaott1ott3': {},
+          'ott0': {'terminal': {'ot_1@tree1': 'node9'}},
+          'é': {'nested': {'a': [1, {'b': None}], 'c': True}},
+          }
+for _n in range(40):
+    _NODES['ott{}'.format(1000 + _n)] = {'resolves': {'pg_9@tree9': 'node{}'.format(_n)}}
+
+
+class _AnnotationsIndexTests(object):
+    """Tests run both with and without ijson (see the subclasses)."""
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.in_fp = os.path.join(self.tmp_dir, 'in.json')
+        self.out_fp = os.path.join(self.tmp_dir, 'annotations.json')
+        self.index_fp = annotations_index_path(self.out_fp)
+        self.doc = {'nodes': _NODES, 'num_tips': 45, 'source_id_map': {'ot_1@tree1': {'git_sha': 'x'}},
+                    'empty': {}}
+        with open(self.in_fp, 'w', encoding='utf-8') as outp:
+            json.dump(self.doc, outp)
+        # spill sorted runs of a few nodes to exercise the merge
+        self.spill = mock.patch.object(propinquity, 'ANNOTATIONS_SPILL_NODES', 7)
+        self.spill.start()
+
+    def tearDown(self):
+        self.spill.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def _stream(self, **kwargs):
+        return stream_annotations(self.in_fp, self.out_fp, 1, index_fp=self.index_fp, **kwargs)
+
+    def _read_out(self):
+        with open(self.out_fp, 'r', encoding='utf-8') as inp:
+            return inp.read()
+
+    def test_output_matches_json_dumps(self):
+        patch = {'was_constrained': True}
+        self.assertTrue(self._stream(patch_ids=['ott2', 'ott77'], patch=patch,
+                                     defaults={'num_tips': 1, 'synth_id': 'opentree1'}))
+        expected = json.loads(json.dumps(self.doc))
+        for node_id in ('ott2', 'ott77'):
+            expected['nodes'].setdefault(node_id, {}).update(patch)
+        expected['synth_id'] = 'opentree1'
+        self.assertEqual(self._read_out(), json.dumps(expected, indent=1, sort_keys=True))
+        self.assertFalse(self._stream(patch_ids=['ott2', 'ott77'], patch=patch,
+                                      defaults={'num_tips': 1, 'synth_id': 'opentree1'}))
+
+    def test_round_trip(self):
+        self._stream()
+        with AnnotationsIndex(self.out_fp) as idx:
+            self.assertEqual(len(idx), len(_NODES))
+            self.assertEqual(list(idx.keys()), sorted(_NODES.keys()))
+            self.assertEqual(list(idx.items()), sorted(_NODES.items()))
+            for node_id, value in _NODES.items():
+                self.assertIn(node_id, idx)
+                self.assertEqual(idx[node_id], value)
+            self.assertNotIn('ott3', idx)
+            self.assertIsNone(idx.get('ott3'))
+            with self.assertRaises(KeyError):
+                idx['ott3']
+            self.assertEqual(sorted(idx.top_level_keys()), ['empty', 'num_tips', 'source_id_map'])
+            for k in idx.top_level_keys():
+                self.assertEqual(idx.get_top_level(k), self.doc[k])
+            self.assertEqual(idx.get_top_level('nodes', 'x'), 'x')
+
+    def test_merge_annotations(self):
+        other_fp = os.path.join(self.tmp_dir, 'other.json')
+        with open(other_fp, 'w', encoding='utf-8') as outp:
+            json.dump({'num_tips': 1, 'date_completed': 'today'}, outp)
+        merge_annotations(self.in_fp, other_fp, self.out_fp, index_fp=self.index_fp)
+        nodes = open_annotation_nodes(self.out_fp)
+        self.assertIsInstance(nodes, AnnotationsIndex)
+        self.assertEqual(nodes.get_top_level('date_completed'), 'today')
+        self.assertEqual(nodes.get_top_level('num_tips'), 45)
+        nodes.close()
+
+    def test_touched_annotations(self):
+        self._stream()
+        st = os.stat(self.out_fp)
+        os.utime(self.out_fp, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        with AnnotationsIndex(self.out_fp) as idx:
+            self.assertEqual(idx['ott2'], _NODES['ott2'])
+
+    def test_stale_index(self):
+        self._stream()
+        content = self._read_out()
+        # a change that keeps the size of the file
+        with open(self.out_fp, 'w', encoding='utf-8') as outp:
+            outp.write(content.replace('node2', 'node3'))
+        with self.assertRaises(ValueError):
+            AnnotationsIndex(self.out_fp)
+        nodes = open_annotation_nodes(self.out_fp)
+        self.assertIsInstance(nodes, dict)
+        self.assertEqual(nodes['ott2']['supported_by'], {'ot_1@tree1': 'node3'})
+        with open(self.out_fp, 'a', encoding='utf-8') as outp:
+            outp.write(' ')
+        with self.assertRaises(ValueError):
+            AnnotationsIndex(self.out_fp)
+
+    def test_not_an_index(self):
+        self._stream()
+        with self.assertRaises(ValueError):
+            AnnotationsIndex(self.out_fp, index_fp=self.in_fp)
+
+
+@unittest.skipIf(ijson is None, 'ijson is not installed')
+class TestAnnotationsIndexStreamed(_AnnotationsIndexTests, unittest.TestCase):
+    pass
+
+
+class TestAnnotationsIndexWithoutIjson(_AnnotationsIndexTests, unittest.TestCase):
+    def setUp(self):
+        _AnnotationsIndexTests.setUp(self)
+        self.no_ijson = mock.patch.dict(sys.modules, {'ijson': None})
+        self.no_ijson.start()
+
+    def tearDown(self):
+        self.no_ijson.stop()
+        _AnnotationsIndexTests.tearDown(self)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Tests of bin/compare_synthesis_outputs.py with names looked up in an OTTIndex."""
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from propinquity import OTTIndex, ott_index_path, write_ott_index
+
+_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'bin', 'compare_synthesis_outputs.py')
+
+
+def _load_script():
+    spec = importlib.util.spec_from_file_location('compare_synthesis_outputs', _SCRIPT)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+try:
+    cso = _load_script()
+except ImportError:
+    cso = None  # e.g. requests is not installed
+
+# uid, parent_uid, name, rank
+_TAXA = [(1, None, 'life', 'no rank'),
+         (2, 1, 'Eukaryota', 'domain'),
+         (30, 2, 'Mammalia', 'class'),
+         (31, 30, 'Primates', 'order'),
+         (32, 30, 'Rodentia', 'order'),
+         ]
+
+
+def _ott_row(*fields):
+    return '\t|\t'.join(['' if i is None else str(i) for i in fields]) + '\t|\t\n'
+
+
+@unittest.skipIf(cso is None, 'the requirements of compare_synthesis_outputs.py are not installed')
+class TestCompareWithOTTIndex(unittest.TestCase):
+    def setUp(self):
+        self.ott_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.ott_dir, 'taxonomy.tsv'), 'w', encoding='utf-8') as outp:
+            outp.write(_ott_row('uid', 'parent_uid', 'name', 'rank', 'sourceinfo', 'uniqname', 'flags'))
+            for uid, par, name, rank in _TAXA:
+                outp.write(_ott_row(uid, par, name, rank, '', '', ''))
+        write_ott_index(self.ott_dir)
+        self.idx = OTTIndex(ott_index_path(self.ott_dir))
+
+    def tearDown(self):
+        self.idx.close()
+        shutil.rmtree(self.ott_dir)
+
+    def test_indexed_names(self):
+        id2names = cso.IndexedNames(self.idx)
+        self.assertEqual(id2names[31], 'Primates')
+        self.assertEqual(id2names.get(31), 'Primates')
+        self.assertEqual(id2names.get(99, 'no name'), 'no name')
+        with self.assertRaises(KeyError):
+            id2names[99]
+
+    def test_write_conf_by_rank(self):
+        def conflict(conflicts_with):
+            return {'conflicts_with': set(conflicts_with), 'aligns_to': set(), 'resolves': set()}
+        conflict_at_rank1 = {'class': conflict([]), 'order': conflict([32])}
+        tree_conflict_at_rank2 = {'pg_1@tree1': {'class': conflict([30]),
+                                                 'order': conflict([31, 32])}}
+        out = io.StringIO()
+        cso.write_conf_by_rank(out, conflict_at_rank1, tree_conflict_at_rank2, 'pg_1@tree1',
+                               cso.IndexedNames(self.idx))
+        lines = out.getvalue().split('\n')
+        self.assertIn("{'Mammalia'}", lines[0])
+        self.assertIn("{'Primates'}", lines[1])
+        self.assertNotIn('Rodentia', out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Tests of gen_newick_out_degree_dists, the newick scanner that replaced otc-degree-distribution."""
+from collections import Counter
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from propinquity import (calc_degree_dist,
+                         format_degree_dist,
+                         gen_newick_out_degree_dists,
+                         tips_and_inf_splits,
+                         )
+
+try:
+    import dendropy
+except ImportError:
+    dendropy = None
+
+
+def _random_newick(rng, num_tips, num_comments):
+    """Returns a newick string with quoted labels (some with '' and punctuation),
+    comments, branch lengths and internal labels."""
+    def label():
+        r = rng.random()
+        if r < 0.25:
+            return "'{} ''x'' (a,b);[c]'".format(rng.randint(0, 99))
+        if r < 0.5:
+            return "'t {}'".format(rng.randint(0, 99))
+        return 't{}'.format(rng.randint(0, 99))
+
+    def decorate(s):
+        if rng.random() < 0.3:
+            s += ':{:.3f}'.format(rng.random())
+        if num_comments and rng.random() < 0.3:
+            s += "[&x=(1,2);'y']"
+        return s
+
+    nodes = [decorate(label()) for _ in range(num_tips)]
+    while len(nodes) > 1:
+        k = min(len(nodes), rng.choice([1, 2, 2, 2, 3, 4]))
+        rng.shuffle(nodes)
+        children, nodes = nodes[:k], nodes[k:]
+        internal = '(' + ','.join(children) + ')'
+        if rng.random() < 0.3:
+            internal += label()
+        nodes.append(decorate(internal))
+    return nodes[0] + ';'
+
+
+class TestNewickOutDegreeDists(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _dds(self, newick):
+        fp = os.path.join(self.tmp_dir, 'tree.tre')
+        with open(fp, 'w', encoding='utf-8') as outp:
+            outp.write(newick)
+        return list(gen_newick_out_degree_dists(fp))
+
+    def test_simple(self):
+        self.assertEqual(self._dds('((a,b),c,(d,e,f));\n'), [{0: 6, 2: 1, 3: 2}])
+
+    def test_quoted_labels(self):
+        self.assertEqual(self._dds("('a ''b'' c','x,(y)''',z);"), [{0: 3, 3: 1}])
+        self.assertEqual(self._dds("('a;b',('c)',''''))'in ''ternal':1.5;"), [{0: 3, 2: 2}])
+
+    def test_comments(self):
+        self.assertEqual(self._dds("[&R] (a[&x=(1,2)],b[;],'c'[c]):1[,)];"), [{0: 3, 3: 1}])
+
+    def test_empty_and_unlabelled_tips(self):
+        self.assertEqual(self._dds('(,);'), [{0: 2, 2: 1}])
+        self.assertEqual(self._dds('((,),:1.0,);'), [{0: 4, 2: 1, 3: 1}])
+
+    def test_single_tip_trees(self):
+        self.assertEqual(self._dds('a;'), [{0: 1}])
+        self.assertEqual(self._dds("'a b';"), [{0: 1}])
+        self.assertEqual(self._dds("[c] 'a b'[c]:1;"), [{0: 1}])
+        self.assertEqual(self._dds('[only a comment];'), [])
+
+    def test_multiple_trees(self):
+        newick = "(a,(b,c));\n'x';\n[c](d,e,f)g;\ny:2;\n"
+        self.assertEqual(self._dds(newick), [{0: 3, 2: 2}, {0: 1}, {0: 3, 3: 1}, {0: 1}])
+
+    def test_empty_file(self):
+        self.assertEqual(self._dds(''), [])
+        self.assertEqual(self._dds('\n'), [])
+
+    def test_malformed(self):
+        for newick in ('((a,b);', '(a,b));', '(a,b)'):
+            with self.assertRaises(ValueError):
+                self._dds(newick)
+
+    def test_tips_and_inf_splits(self):
+        self.assertEqual(tips_and_inf_splits({0: 4, 2: 1, 4: 1}), [4, 1])
+        self.assertEqual(tips_and_inf_splits({0: 1}), [1, 0])
+
+    def test_degree_dist_files(self):
+        fp = os.path.join(self.tmp_dir, 'trees.tre')
+        with open(fp, 'w', encoding='utf-8') as outp:
+            outp.write("((a,b),c);\n'd';\n")
+        dd_fp = os.path.join(self.tmp_dir, 'deg-dist.txt')
+        calc_degree_dist(fp, dd_fp)
+        with open(dd_fp, 'r', encoding='utf-8') as inp:
+            content = inp.read()
+        self.assertEqual(content, format_degree_dist({0: 3, 2: 2}) + format_degree_dist({0: 1}))
+
+    @unittest.skipIf(dendropy is None, 'DendroPy is not installed')
+    def test_matches_dendropy(self):
+        rng = random.Random(0)
+        trees = [_random_newick(rng, rng.randint(1, 60) if n % 5 else 1, n % 2) for n in range(200)]
+        expected = []
+        for tree in dendropy.TreeList.get(data='\n'.join(trees), schema='newick',
+                                          suppress_leaf_node_taxa=True):
+            expected.append(dict(Counter(len(nd.child_nodes()) for nd in tree)))
+        self.assertEqual(len(expected), len(trees))
+        self.assertEqual(self._dds('\n'.join(trees)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Round-trip tests of the compact OTT index (write_ott_index, OTTIndex and open_ott_index)."""
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import propinquity
+from propinquity import (OTT_INDEX_FN,
+                         OTTIndex,
+                         open_ott_index,
+                         ott_index_matches_sources,
+                         ott_index_path,
+                         write_ott_index,
+                         )
+
+# uid, parent_uid, name, rank, flags
+_TAXA = [(1, None, 'life', 'no rank', ''),
+         (2, 1, 'Eukaryota', 'domain', ''),
+         (30, 2, 'Mammalia', 'class', ''),
+         (31, 30, 'Homo sapiens', 'species', ''),
+         (32, 30, "Pan 'troglodytes' é", 'species', 'hidden,sibling_higher'),
+         (4, 2, 'incertae sedis', 'no rank', 'incertae_sedis'),
+         (5, 4, 'Taxon five', 'genus', 'extinct'),
+         ]
+_FORWARDS = [(100, 31), (101, 100), (102, 5)]
+
+
+def _ott_row(*fields):
+    return '\t|\t'.join(['' if i is None else str(i) for i in fields]) + '\t|\t\n'
+
+
+def _write_ott_dir(ott_dir, taxa=_TAXA):
+    with open(os.path.join(ott_dir, 'taxonomy.tsv'), 'w', encoding='utf-8') as outp:
+        outp.write(_ott_row('uid', 'parent_uid', 'name', 'rank', 'sourceinfo', 'uniqname', 'flags'))
+        for uid, par, name, rank, flags in taxa:
+            outp.write(_ott_row(uid, par, name, rank, '', '', flags))
+    with open(os.path.join(ott_dir, 'forwards.tsv'), 'w', encoding='utf-8') as outp:
+        outp.write('id\treplacement\n')
+        for old_id, new_id in _FORWARDS:
+            outp.write('{}\t{}\n'.format(old_id, new_id))
+    with open(os.path.join(ott_dir, 'version.txt'), 'w', encoding='utf-8') as outp:
+        outp.write('3.3draft1\n')
+
+
+class _Logger(object):
+    def __init__(self):
+        self.warnings = []
+
+    def debug(self, msg):
+        pass
+
+    info = debug
+
+    def warn(self, msg):
+        self.warnings.append(msg)
+
+
+class TestOTTIndex(unittest.TestCase):
+    def setUp(self):
+        self.ott_dir = tempfile.mkdtemp()
+        _write_ott_dir(self.ott_dir)
+        self.opened = []
+
+    def tearDown(self):
+        for idx in self.opened:
+            idx.close()
+        propinquity._OTT_INDEX_BY_DIR.pop(os.path.abspath(self.ott_dir), None)
+        shutil.rmtree(self.ott_dir)
+
+    def _open(self, fp):
+        idx = OTTIndex(fp)
+        self.opened.append(idx)
+        return idx
+
+    def _open_ott_index(self, CFG=None):
+        propinquity._OTT_INDEX_BY_DIR.pop(os.path.abspath(self.ott_dir), None)
+        idx = open_ott_index(self.ott_dir, CFG=CFG)
+        self.opened.append(idx)
+        return idx
+
+    def test_round_trip(self):
+        self.assertTrue(write_ott_index(self.ott_dir))
+        idx = self._open(ott_index_path(self.ott_dir))
+        self.assertEqual(len(idx), len(_TAXA))
+        self.assertEqual(idx.version, '3.3draft1')
+        for uid, par, name, rank, flags in _TAXA:
+            self.assertIn(uid, idx)
+            self.assertEqual(idx.get_name(uid), name)
+            self.assertEqual(idx.get_rank(uid), rank)
+            self.assertEqual(idx.get_parent(uid), par)
+            self.assertEqual(idx.get_flags(uid), set(i for i in flags.split(',') if i))
+        self.assertNotIn(3, idx)
+        self.assertIsNone(idx.get_name(3))
+        self.assertEqual(idx.get_name(3, 'x'), 'x')
+        self.assertEqual(idx.forward(100), 31)
+        self.assertEqual(idx.forward(101), 31)
+        self.assertEqual(idx.forward(102), 5)
+        self.assertIsNone(idx.forward(31))
+        fu = idx.convert_flag_string_set_to_union(['extinct', 'hidden', 'not_a_flag'])
+        self.assertTrue(idx.has_flag_in(5, fu))
+        self.assertTrue(idx.has_flag_in(32, fu))
+        self.assertFalse(idx.has_flag_in(4, fu))
+        self.assertTrue(idx.is_ancestor(1, 31))
+        self.assertTrue(idx.is_ancestor(2, 5))
+        self.assertFalse(idx.is_ancestor(30, 5))
+        self.assertFalse(idx.is_ancestor(31, 31))
+        order = idx.ids_children_first()
+        self.assertEqual(sorted(order), sorted(i[0] for i in _TAXA))
+        for uid, par, name, rank, flags in _TAXA:
+            if par is not None:
+                self.assertLess(order.index(uid), order.index(par))
+        unpickled = pickle.loads(pickle.dumps(idx))
+        self.opened.append(unpickled)
+        self.assertEqual(unpickled.get_name(32), idx.get_name(32))
+
+    def test_write_induced_newick(self):
+        write_ott_index(self.ott_dir)
+        idx = self._open(ott_index_path(self.ott_dir))
+
+        def induced(ott_ids):
+            out = io.StringIO()
+            idx.write_induced_newick(out, ott_ids)
+            return out.getvalue()
+        # MRCAs are added, other ancestors (4) are not, and children are sorted by Id
+        self.assertEqual(induced([32, 5, 31]), '(ott5,(ott31,ott32)ott30)ott2;\n')
+        # an Id that is an ancestor of another Id is an internal node, even with one child
+        self.assertEqual(induced([31, 30]), '(ott31)ott30;\n')
+        self.assertEqual(induced([5, 31, 2, 31]), '(ott5,ott31)ott2;\n')
+        self.assertEqual(induced([32, 1]), '(ott32)ott1;\n')
+        self.assertEqual(induced([31]), 'ott31;\n')
+        self.assertEqual(induced([]), '')
+
+    def test_rewrite_is_not_a_change(self):
+        fp = ott_index_path(self.ott_dir)
+        self.assertTrue(write_ott_index(self.ott_dir))
+        mtime = os.stat(fp).st_mtime_ns
+        self.assertFalse(write_ott_index(self.ott_dir))
+        self.assertEqual(os.stat(fp).st_mtime_ns, mtime)
+
+    def test_not_an_index(self):
+        fp = os.path.join(self.ott_dir, 'taxonomy.tsv')
+        with self.assertRaises(ValueError):
+            OTTIndex(fp)
+
+    def test_sources(self):
+        write_ott_index(self.ott_dir)
+        idx = self._open(ott_index_path(self.ott_dir))
+        self.assertEqual(set(idx.sources.keys()), set(['taxonomy.tsv', 'forwards.tsv']))
+        self.assertTrue(ott_index_matches_sources(idx, self.ott_dir))
+        # touching a source does not make the index stale...
+        tax_fp = os.path.join(self.ott_dir, 'taxonomy.tsv')
+        st = os.stat(tax_fp)
+        os.utime(tax_fp, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertTrue(ott_index_matches_sources(idx, self.ott_dir))
+        # ... but changing its content (even at the same size) does
+        with open(tax_fp, 'r', encoding='utf-8') as inp:
+            content = inp.read()
+        with open(tax_fp, 'w', encoding='utf-8') as outp:
+            outp.write(content.replace('Taxon five', 'Taxon vijf'))
+        self.assertEqual(os.path.getsize(tax_fp), st.st_size)
+        self.assertFalse(ott_index_matches_sources(idx, self.ott_dir))
+        os.remove(os.path.join(self.ott_dir, 'forwards.tsv'))
+        self.assertFalse(ott_index_matches_sources(idx, self.ott_dir))
+
+    def test_open_ott_index(self):
+        write_ott_index(self.ott_dir)
+        fp = ott_index_path(self.ott_dir)
+        log = _Logger()
+        idx = self._open_ott_index(CFG=log)
+        self.assertEqual(idx.fp, fp)
+        self.assertEqual(log.warnings, [])
+        self.assertIs(open_ott_index(self.ott_dir), idx)
+
+    def test_open_stale_ott_index(self):
+        write_ott_index(self.ott_dir)
+        fp = ott_index_path(self.ott_dir)
+        with open(fp, 'rb') as inp:
+            index_content = inp.read()
+        taxa = list(_TAXA) + [(6, 4, 'Taxon six', 'genus', '')]
+        _write_ott_dir(self.ott_dir, taxa)
+        log = _Logger()
+        idx = self._open_ott_index(CFG=log)
+        self.assertNotEqual(idx.fp, fp)
+        self.assertIn('was not built from the taxonomy files', log.warnings[0])
+        self.assertEqual(idx.get_name(6), 'Taxon six')
+        # the stale index in the taxonomy directory is left alone
+        with open(fp, 'rb') as inp:
+            self.assertEqual(inp.read(), index_content)
+
+    def test_open_missing_ott_index(self):
+        log = _Logger()
+        idx = self._open_ott_index(CFG=log)
+        self.assertIn('does not exist', log.warnings[0])
+        self.assertEqual(idx.get_name(31), 'Homo sapiens')
+        self.assertFalse(os.path.exists(ott_index_path(self.ott_dir)))
+        self.assertEqual(os.path.split(idx.fp)[-1], OTT_INDEX_FN)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Round-trip tests of the columnar subproblem size summary (SubprobSizeStore)."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from propinquity import (SUBPROB_SIZE_STORE_FN,
+                         SUBPROB_SIZE_TSV_HEADER,
+                         SubprobSizeStore,
+                         build_subprob_size_store,
+                         format_degree_dist,
+                         generate_subprob_size_summary,
+                         )
+
+# subproblem id -> (# of leaves, # of synth leaves,
+#                   [(input tree id, out-degree dist. of the input in the subproblem), ...])
+# The taxonomy is the last input of each subproblem.
+_SUBPROBLEMS = {'ott1': (5, 7, [('pg_1@tree1', {0: 4, 2: 1, 3: 1}),
+                                ('pg_2@tree2', {0: 2, 2: 1}),
+                                ('TAXONOMY', {0: 5, 2: 1, 3: 1})]),
+                'ott20': (3, 2, [('pg_2@tree2', {0: 3, 3: 1}),
+                                 ('TAXONOMY', {0: 3, 2: 1, 3: 1})]),
+                'ott300': (2, 2, [('TAXONOMY', {0: 2, 2: 1})]),
+                }
+_EXPECTED_BLOB = {'subproblems': {'ott1': [5, 7, [[4, 2, 0], [2, 0, 1], [5, 2, 2]]],
+                                  'ott20': [3, 2, [[3, 0, 1], [3, 1, 2]]],
+                                  'ott300': [2, 2, [[2, 0, 2]]]},
+                  'tree_ids': ['pg_1@tree1', 'pg_2@tree2', 'TAXONOMY']}
+
+
+class TestSubprobSizeStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index_fp = os.path.join(self.tmp_dir, 'index.json')
+        self.tips_fp = os.path.join(self.tmp_dir, 'num_tips_per_ott.json')
+        self.dd_dir = os.path.join(self.tmp_dir, 'deg-dist')
+        os.mkdir(self.dd_dir)
+        by_num_inputs = []
+        for sub_id in sorted(_SUBPROBLEMS, key=lambda i: -len(_SUBPROBLEMS[i][2])):
+            num_leaves, num_synth, inputs = _SUBPROBLEMS[sub_id]
+            by_num_inputs.append([sub_id + '.tre', [i[0] for i in inputs], num_leaves])
+            dd_fp = os.path.join(self.dd_dir, 'deg-dist-{}.txt'.format(sub_id))
+            with open(dd_fp, 'w', encoding='utf-8') as outp:
+                outp.write(''.join([format_degree_dist(i[1]) for i in inputs]))
+        with open(self.index_fp, 'w', encoding='utf-8') as outp:
+            json.dump({'subproblems': {'sorted_by_num_phylo_inputs': by_num_inputs}}, outp)
+        with open(self.tips_fp, 'w', encoding='utf-8') as outp:
+            json.dump({k: v[1] for k, v in _SUBPROBLEMS.items()}, outp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        store_fp = os.path.join(self.tmp_dir, SUBPROB_SIZE_STORE_FN)
+        self.assertTrue(build_subprob_size_store(self.index_fp, self.tips_fp, self.dd_dir, store_fp))
+        store = SubprobSizeStore(store_fp)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.subproblem_ids, ['ott1', 'ott20', 'ott300'])
+        self.assertEqual(store.as_json_blob(), _EXPECTED_BLOB)
+        row = store.row('ott1')
+        self.assertEqual(store.num_splits[row], 4)
+        self.assertEqual(store.num_inf_inputs[row], 2)
+        self.assertEqual(store.num_input_trees(row), 2)
+        self.assertEqual(store.num_input_trees(store.row('ott300')), 0)
+        self.assertEqual(store.top(2, by='splits'), [('ott1', 4), ('ott20', 1)])
+        self.assertEqual(store.top(1, by='synth_leaves'), [('ott1', 7)])
+        self.assertEqual(store.top(1, by='input_trees'), [('ott1', 2)])
+        with self.assertRaises(ValueError):
+            store.top(1, by='tips')
+        self.assertFalse(build_subprob_size_store(self.index_fp, self.tips_fp, self.dd_dir, store_fp))
+
+    def test_json_and_tsv_views(self):
+        json_fp = os.path.join(self.tmp_dir, 'subproblem_size_summary.json')
+        tsv_fp = os.path.join(self.tmp_dir, 'subproblem_size_summary.tsv')
+        store = generate_subprob_size_summary(self.index_fp, self.tips_fp, self.dd_dir, json_fp,
+                                              tsv_fp=tsv_fp)
+        self.assertEqual(store.fp, os.path.join(self.tmp_dir, SUBPROB_SIZE_STORE_FN))
+        with open(json_fp, 'r', encoding='utf-8') as inp:
+            self.assertEqual(json.load(inp), _EXPECTED_BLOB)
+        with open(tsv_fp, 'r', encoding='utf-8') as inp:
+            lines = inp.read().split('\n')
+        # rows sorted by subproblem id
+        self.assertEqual(lines, ['\t'.join(SUBPROB_SIZE_TSV_HEADER),
+                                 'ott1\t5\t7\t4\t2\t1\tpg_1@tree1,TAXONOMY\tpg_2@tree2',
+                                 'ott20\t3\t2\t1\t1\t1\tTAXONOMY\tpg_2@tree2',
+                                 'ott300\t2\t2\t0\t0\t1\t\tTAXONOMY',
+                                 ''])
+
+    def test_not_a_store(self):
+        with self.assertRaises(ValueError):
+            SubprobSizeStore(self.index_fp)
+
+
+if __name__ == '__main__':
+    unittest.main()
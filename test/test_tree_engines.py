@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Checks that the tree engines (NexsonTreeWrapper and CompactNexsonTree) clean
+NexSON trees into the same newicks and deletion logs."""
+import copy
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from propinquity import (TREE_ENGINES,
+                         EmptyTreeError,
+                         OTTIndex,
+                         ott_index_path,
+                         write_ott_index,
+                         )
+
+# uid, parent_uid, name, flags
+_TAXA = [(1, None, 'life', ''),
+         (2, 1, 'Eukaryota', ''),
+         (30, 2, 'Mammalia', ''),
+         (31, 30, 'Homo sapiens', ''),
+         (32, 30, 'Pan troglodytes', 'hidden'),
+         (33, 30, 'Gorilla gorilla', ''),
+         (34, 30, 'Pongo abelii', ''),
+         (35, 30, 'Hylobates lar', ''),
+         (36, 30, 'Macaca mulatta', ''),
+         (40, 2, 'Aves', ''),
+         (41, 40, 'Gallus gallus', ''),
+         (42, 40, 'Columba livia', 'extinct'),
+         ]
+_FORWARDS = [(100, 31), (101, 41)]
+_TO_PRUNE_FLAGS = ['hidden', 'extinct']
+
+
+def _ott_row(*fields):
+    return '\t|\t'.join(['' if i is None else str(i) for i in fields]) + '\t|\t\n'
+
+
+def _write_ott_dir(ott_dir):
+    with open(os.path.join(ott_dir, 'taxonomy.tsv'), 'w', encoding='utf-8') as outp:
+        outp.write(_ott_row('uid', 'parent_uid', 'name', 'rank', 'sourceinfo', 'uniqname', 'flags'))
+        for uid, par, name, flags in _TAXA:
+            outp.write(_ott_row(uid, par, name, 'no rank', '', '', flags))
+    with open(os.path.join(ott_dir, 'forwards.tsv'), 'w', encoding='utf-8') as outp:
+        outp.write('id\treplacement\n')
+        for old_id, new_id in _FORWARDS:
+            outp.write('{}\t{}\n'.format(old_id, new_id))
+    with open(os.path.join(ott_dir, 'version.txt'), 'w', encoding='utf-8') as outp:
+        outp.write('3.3draft1\n')
+
+
+def _nexson(edges, leaf_ott_ids, root_id, ingroup_id=None):
+    """`edges` is a list of (source, target) node IDs in edgeBySourceId order.
+    `leaf_ott_ids` maps leaf node IDs to an OTT Id (or None for an unmapped OTU)."""
+    otu_by_id, node_by_id, edge_by_source = {}, {root_id: {}}, {}
+    for n, (source, target) in enumerate(edges):
+        edge_by_source.setdefault(source, {})['e{}'.format(n)] = {'@source': source, '@target': target}
+        node_by_id[target] = {}
+    for node_id, ott_id in leaf_ott_ids.items():
+        otu_id = 'otu_' + node_id
+        otu = {'^ot:originalLabel': node_id}
+        if ott_id is not None:
+            otu['^ot:ottId'] = ott_id
+            otu['^ot:ottTaxonName'] = 'taxon {}'.format(ott_id)
+        otu_by_id[otu_id] = otu
+        node_by_id[node_id]['@otu'] = otu_id
+    tree = {'edgeBySourceId': edge_by_source,
+            'nodeById': node_by_id,
+            '^ot:rootNodeId': root_id,
+            }
+    if ingroup_id is not None:
+        tree['^ot:inGroupClade'] = ingroup_id
+    return {'nexml': {'@nexml2json': '1.2.1',
+                      'otusById': {'otus1': {'otuById': otu_by_id}},
+                      'treesById': {'trees1': {'@otus': 'otus1',
+                                               'treeById': {'tree1': tree}}},
+                      }}
+
+
+def _random_nexson(rng, num_leaves):
+    ott_ids = [i[0] for i in _TAXA] + [i[0] for i in _FORWARDS] + [999, None]
+    nodes = ['node0']
+    edges = []
+    for n in range(1, 2 * num_leaves):
+        child = 'node{}'.format(n)
+        edges.append((rng.choice(nodes), child))
+        nodes.append(child)
+    sources = set(i[0] for i in edges)
+    leaf_ott_ids = {i: rng.choice(ott_ids) for i in nodes if i not in sources}
+    ingroup = rng.choice([None, rng.choice(list(sources))])
+    return _nexson(edges, leaf_ott_ids, 'node0', ingroup)
+
+
+class TestTreeEngines(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ott_dir = tempfile.mkdtemp()
+        _write_ott_dir(cls.ott_dir)
+        write_ott_index(cls.ott_dir)
+        cls.ott = OTTIndex(ott_index_path(cls.ott_dir))
+        cls.to_prune_fsi_set = cls.ott.convert_flag_string_set_to_union(_TO_PRUNE_FLAGS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.ott.close()
+        shutil.rmtree(cls.ott_dir)
+
+    def _clean(self, engine, nexson):
+        log_obj = {}
+        tree = TREE_ENGINES[engine](copy.deepcopy(nexson), 'tree1', log_obj=log_obj)
+        try:
+            tree.prune_tree_for_supertree(ott=self.ott,
+                                          to_prune_fsi_set=self.to_prune_fsi_set,
+                                          root_ott_id=1)
+        except EmptyTreeError:
+            log_obj['EMPTY_TREE'] = True
+        newick = None
+        if not tree.is_empty:
+            outp = io.StringIO()
+            tree.write_newick(outp)
+            newick = outp.getvalue()
+        log = {}
+        for k, v in log_obj.items():
+            if isinstance(v, dict):
+                v = (set(v['nodes']), set(v['edges']))
+            log[k] = v
+        return newick, log
+
+    def _assert_engines_agree(self, nexson):
+        newick, log = self._clean('nexson', nexson)
+        c_newick, c_log = self._clean('compact', nexson)
+        self.assertEqual(c_newick, newick)
+        self.assertEqual(c_log, log)
+        return newick, log
+
+    def test_same_newick_and_logs(self):
+        edges = [('r', 'out'), ('r', 'n1'),
+                 ('n1', 'a'), ('n1', 'n2'), ('n1', 'b'), ('n1', 'c'),
+                 ('n1', 'n3'), ('n1', 'k'), ('n1', 'f'),
+                 ('n2', 'd'), ('n2', 'g'),
+                 ('n3', 'h'), ('n3', 'i'), ('n3', 'j'),
+                 ]
+        leaf_ott_ids = {'out': 41, 'a': 31, 'b': 32, 'c': None, 'd': 33, 'g': 999,
+                        'h': 34, 'i': 35, 'j': 30, 'k': 100, 'f': 36}
+        newick, log = self._assert_engines_agree(_nexson(edges, leaf_ott_ids, 'r', 'n1'))
+        # n2 is suppressed, so d moves to the end of n1's children
+        self.assertLess(newick.index('_f_'), newick.index('_d_'))
+        for key in ('outgroup', 'unmapped_otu', 'unrecognized_ott_id', 'flagged',
+                    'became_trivial', 'mapped_to_taxon_containing_other_mapped_tips',
+                    'replaced_by_arbitrary_node'):
+            self.assertIn(key, log)
+
+    def test_deg_one_root(self):
+        edges = [('r', 'x'), ('r', 'n5'), ('n5', 'y'), ('n5', 'z'), ('n5', 'w')]
+        leaf_ott_ids = {'x': None, 'y': 31, 'z': 41, 'w': 33}
+        newick, log = self._assert_engines_agree(_nexson(edges, leaf_ott_ids, 'r'))
+        self.assertEqual(log['revised_ingroup_node'], 'n5')
+
+    def test_random_trees(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            self._assert_engines_agree(_random_nexson(rng, rng.randint(2, 30)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
 from propinquity import (clean_contesting_tree_refs,
                          decompose_into_subproblems,
+                         log_solve_cache_stats,
+                         plan_solve_batches,
+                         select_reversed_subproblem_ids,
+                         RuleResources,
                          validate_config,
                          write_if_needed)
 from snakemake.logging import logger
@@ -17,14 +21,15 @@ checkpoint decompose:
             contesting = "subproblems/raw_contesting_trees.json", \
             subprob_link = "subproblems/subproblem-ids.txt"
     run:
-        decompose_into_subproblems(tax_tree_fp=input.taxonomy,
-                                   phylo_list_fp=input.phylo_list_fp,
-                                   out_dir=os.path.split(output.subprob_id)[0],
-                                   out_subprob_id_fp=output.subprob_id,
-                                   out_contesting=output.contesting,
-                                   CFG=CFG)
-        if not os.path.exists(output.subprob_link):
-            os.symlink("./" + os.path.split(output.subprob_id)[-1], output.subprob_link)
+        with RuleResources(rule, CFG):
+            decompose_into_subproblems(tax_tree_fp=input.taxonomy,
+                                       phylo_list_fp=input.phylo_list_fp,
+                                       out_dir=os.path.split(output.subprob_id)[0],
+                                       out_subprob_id_fp=output.subprob_id,
+                                       out_contesting=output.contesting,
+                                       CFG=CFG)
+            if not os.path.exists(output.subprob_link):
+                os.symlink("./" + os.path.split(output.subprob_id)[-1], output.subprob_link)
 
 checkpoint cleancontest:
     input: config = "config", \
@@ -33,9 +38,10 @@ checkpoint cleancontest:
     output: contesting = "subproblems/contesting_trees.json", \
             contest_link = "subproblems/contesting-trees.json"
     run:
-        clean_contesting_tree_refs(input.raw, output.contesting, CFG=CFG)
-        if not os.path.exists(output.contest_link):
-            os.symlink("./" + os.path.split(output.contesting)[-1], output.contest_link)
+        with RuleResources(rule, CFG):
+            clean_contesting_tree_refs(input.raw, output.contesting, CFG=CFG)
+            if not os.path.exists(output.contest_link):
+                os.symlink("./" + os.path.split(output.contesting)[-1], output.contest_link)
 
 def _agg_trees_impl(wildcards, soln_dir):
     solve_out = os.path.split(checkpoints.decompose.get(**wildcards).output[0])[0]
@@ -46,23 +52,49 @@ def _agg_trees_impl(wildcards, soln_dir):
 def aggregate_trees(wildcards):
     return _agg_trees_impl(wildcards, "subproblem_solutions")
 
+def reversed_check_ids(wildcards):
+    """IDs of the subproblems that are also solved in reversed order (see reversed_solve_mode)."""
+    solve_out = os.path.split(checkpoints.decompose.get().output[0])[0]
+    gw = glob_wildcards(os.path.join(solve_out, '{ottid}.tre'))
+    return select_reversed_subproblem_ids(gw.ottid, solve_out, CFG)
+
 def aggregate_rev_trees(wildcards):
-    return _agg_trees_impl(wildcards, "reversed_subproblem_solutions")
+    return expand("reversed_subproblem_solutions/{ottid}.tre", ottid=reversed_check_ids(wildcards))
+
+def solve_batches(wildcards):
+    solve_out = os.path.split(checkpoints.decompose.get().output[0])[0]
+    gw = glob_wildcards(os.path.join(solve_out, '{ottid}.tre'))
+    return plan_solve_batches(gw.ottid, solve_out, CFG)
+
+def aggregate_solve_targets(wildcards):
+    """The solutions of the unbatched subproblems and the ID lists of the batches."""
+    batches = solve_batches(wildcards)
+    batched = set()
+    for ids in batches.values():
+        batched.update(ids)
+    trees = [i for i in aggregate_trees(wildcards)
+             if os.path.split(i)[-1][:-4] not in batched]
+    return trees + ["subproblem_solutions/batches/{}.txt".format(i) for i in batches]
 
 
 rule solved_ids:
-    input: aggregate_trees
+    input: aggregate_solve_targets
     output: "subproblem_solutions/solution-ids.txt"
     run:
-        content = '\n'.join([os.path.split(i)[-1] for i in input])
-        write_if_needed(fp=output[0], content=content, CFG=CFG)
+        with RuleResources(rule, CFG):
+            content = '\n'.join([os.path.split(i)[-1] for i in aggregate_trees(wildcards)])
+            write_if_needed(fp=output[0], content=content, CFG=CFG)
+            if CFG.cache_dir:
+                log_solve_cache_stats(CFG)
 
 rule rev_solved_ids:
-    input: aggregate_rev_trees
+    input: config = "config", \
+           trees = aggregate_rev_trees
     output: "reversed_subproblem_solutions/solution-ids.txt"
     run:
-        content = '\n'.join([os.path.split(i)[-1] for i in input])
-        write_if_needed(fp=output[0], content=content, CFG=CFG)
+        with RuleResources(rule, CFG):
+            content = '\n'.join([os.path.split(i)[-1] for i in input.trees])
+            write_if_needed(fp=output[0], content=content, CFG=CFG)
 
 def aggregate_sdd_common(wildcards, solved_dir, dd_dir=None):
     if dd_dir is None:
@@ -75,7 +107,9 @@ def aggregate_sdd(wildcards):
 
 def aggregate_rsdd(wildcards):
     solve_out = os.path.split(checkpoints.reverse_subproblems_flag.get(**wildcards).output[0])[0]
-    return aggregate_sdd_common(wildcards, directory("reversed_subproblem_solutions"))
+    # only the checked subproblems, not the solutions left from a run with another reversed_solve_mode
+    return expand("reversed_subproblem_solutions/deg-dist-{ottid}.txt",
+                  ottid=reversed_check_ids(wildcards))
 
 def aggregate_probdd(wildcards):
     return aggregate_sdd_common(wildcards, directory("subproblems"), "subproblems/deg-dist")
@@ -85,7 +119,9 @@ checkpoint reverse_subproblems_flag:
            otcconfig = "otc-config", \
            subprob_id = "subproblems/dumped_subproblem_ids.txt"
     output: "reversed_subproblems/flag.txt"
-    run: write_if_needed(content="", fp=output[0])
+    run:
+        with RuleResources(rule, CFG):
+            write_if_needed(content="", fp=output[0])
 
 rule reverse_subproblems:
     input: config = "config", \
@@ -95,11 +131,12 @@ rule reverse_subproblems:
            flag = "reversed_subproblems/flag.txt"
     output: subprob="reversed_subproblems/{ottid}.tre"
     run:
-        # gen_reversed.py gist
-        nl = list(stripped_nonempty_lines(input.subprob))
-        if nl:
-            if len(nl) > 1:
-                nl, last = nl[:-1], nl[-1]
-                nl.reverse()
-                nl.append(last)
-        write_if_needed(fp=output.subprob, content="\n".join(nl))
+        with RuleResources(rule, CFG):
+            # gen_reversed.py gist
+            nl = list(stripped_nonempty_lines(input.subprob))
+            if nl:
+                if len(nl) > 1:
+                    nl, last = nl[:-1], nl[-1]
+                    nl.reverse()
+                    nl.append(last)
+            write_if_needed(fp=output.subprob, content="\n".join(nl))
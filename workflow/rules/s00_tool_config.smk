@@ -1,5 +1,6 @@
 from propinquity import (gen_config_content,
                          gen_otc_config_content,
+                         RuleResources,
                          validate_config,
                          write_if_needed)
 from snakemake.logging import logger
@@ -15,14 +16,16 @@ rule config:
     output: "config"
     log: "logs/config"
     run:
-        write_if_needed(fp=output[0], content=gen_config_content(CFG), CFG=CFG)
+        with RuleResources(rule, CFG):
+            write_if_needed(fp=output[0], content=gen_config_content(CFG), CFG=CFG)
 
 rule otc_config:
     """Uses snakemake config to creat a config file for otcetera tools"""
     output: "otc-config"
     log: "logs/config"
     run:
-        write_if_needed(fp=output[0], content=gen_otc_config_content(CFG), CFG=CFG)
+        with RuleResources(rule, CFG):
+            write_if_needed(fp=output[0], content=gen_otc_config_content(CFG), CFG=CFG)
 
 rule clean_config:
     """Clean up the config and otc-config that are created automatically"""
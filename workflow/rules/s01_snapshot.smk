@@ -1,7 +1,9 @@
 from propinquity import (export_studies_from_collection,
                          export_trees_list_and_shas,
+                         last_pulled_shas_fp,
                          pull_git_subdirs,
                          reaggregate_synth_collections,
+                         RuleResources,
                          validate_config,
                          write_if_needed)
 from snakemake.logging import logger
@@ -22,11 +24,16 @@ rule phylesystem_pull:
     log: "logs/phylesystem_pull"
     output: "phylo_snapshot/ps_shard_shas.txt"
     run:
-        ps_shards_dir = os.path.join(CFG.phylesystem_dir, "shards")
-        shas = pull_git_subdirs(ps_shards_dir, prefix='phylesystem-')
-        write_if_needed(fp=output[0],
-                        content="\n".join(shas),
-                        name="phylesystem shards", CFG=CFG)
+        with RuleResources(rule, CFG):
+            ps_shards_dir = os.path.join(CFG.phylesystem_dir, "shards")
+            shas = pull_git_subdirs(ps_shards_dir,
+                                    prefix='phylesystem-',
+                                    num_workers=CFG.num_pull_workers,
+                                    last_pulled_fp=last_pulled_shas_fp(CFG, ps_shards_dir, 'phylesystem-'),
+                                    CFG=CFG)
+            write_if_needed(fp=output[0],
+                            content="\n".join(shas),
+                            name="phylesystem shards", CFG=CFG)
 
 rule collections_pull:
     """Pulls all collections shards from their origin and writes HEAD shas in output"""
@@ -34,11 +41,16 @@ rule collections_pull:
     log: "logs/collections_pull"
     output: "phylo_snapshot/collections_shard_shas.txt"
     run:
-        coll_shards_dir = os.path.join(CFG.collections_dir, "shards")
-        shas = pull_git_subdirs(coll_shards_dir, prefix='collections-')
-        write_if_needed(fp=output[0],
-                        content="\n".join(shas),
-                        name="collections shards", CFG=CFG)
+        with RuleResources(rule, CFG):
+            coll_shards_dir = os.path.join(CFG.collections_dir, "shards")
+            shas = pull_git_subdirs(coll_shards_dir,
+                                    prefix='collections-',
+                                    num_workers=CFG.num_pull_workers,
+                                    last_pulled_fp=last_pulled_shas_fp(CFG, coll_shards_dir, 'collections-'),
+                                    CFG=CFG)
+            write_if_needed(fp=output[0],
+                            content="\n".join(shas),
+                            name="collections shards", CFG=CFG)
 
 # End sync with GitHub
 ################################################################################
@@ -56,7 +68,8 @@ rule copy_collections:
            json_fp=expand(_coll_json_pattern, syncoll=CFG.collections.split(','))
     output: "phylo_input/rank_collection.json"
     run:
-        reaggregate_synth_collections(input.json_fp, output[0], CFG=CFG)
+        with RuleResources(rule, CFG):
+            reaggregate_synth_collections(input.json_fp, output[0], CFG=CFG)
 
 rule snapshot_trees_and_collection_items:
     """Concatenate all input collections in order into one "concrete" copy.
@@ -65,14 +78,16 @@ rule snapshot_trees_and_collection_items:
            rank_coll="phylo_input/rank_collection.json"
     output: conc_coll="phylo_snapshot/concrete_rank_collection.json"
     run:
-        ps_shards_dir = os.path.join(CFG.phylesystem_dir, "shards")
-        snap_dir = os.path.join(CFG.out_dir, "phylo_snapshot")
-        export_studies_from_collection(ranked_coll_fp=input.rank_coll,
-                                       phylesystem_par=ps_shards_dir,
-                                       script_managed_trees=CFG.script_managed_trees_dir,
-                                       out_par=snap_dir,
-                                       concrete_coll_out_fp=output.conc_coll,
-                                       CFG=CFG)
+        with RuleResources(rule, CFG):
+            ps_shards_dir = os.path.join(CFG.phylesystem_dir, "shards")
+            snap_dir = os.path.join(CFG.out_dir, "phylo_snapshot")
+            export_studies_from_collection(ranked_coll_fp=input.rank_coll,
+                                           phylesystem_par=ps_shards_dir,
+                                           script_managed_trees=CFG.script_managed_trees_dir,
+                                           out_par=snap_dir,
+                                           concrete_coll_out_fp=output.conc_coll,
+                                           snapshot_mode=CFG.snapshot_mode,
+                                           CFG=CFG)
 
 rule concrete_tree_list:
     """Extracts the study_tree pairs from the concrete collection.
@@ -84,10 +99,11 @@ rule concrete_tree_list:
     output: pairs="phylo_input/study_tree_pairs.txt", \
             blob_shas="phylo_input/blob_shas.txt"
     run:
-        export_trees_list_and_shas(concrete_coll_json_fp=input[0],
-                                   out_fp=output.pairs,
-                                   obj_blob_shas_fp=output.blob_shas,
-                                   CFG=CFG)
+        with RuleResources(rule, CFG):
+            export_trees_list_and_shas(concrete_coll_json_fp=input[0],
+                                       out_fp=output.pairs,
+                                       obj_blob_shas_fp=output.blob_shas,
+                                       CFG=CFG)
 
 rule run_md5:
     """writes and md5sum based off of config (minus the "synth_id ="" line)
@@ -1,8 +1,11 @@
 from propinquity import (OTT_FILENAMES,
+                         OTT_INDEX_FN,
                          suppress_by_flag,
+                         RuleResources,
                          validate_config,
                          subset_ott,
-                         write_if_needed)
+                         write_if_needed,
+                         write_ott_index)
 from snakemake.logging import logger
 
 CFG = validate_config(config, logger)
@@ -17,34 +20,40 @@ rule all:
 rule subset_ott:
     input: "config"
     output: expand("subott_dir/{filename}", filename=OTT_FILENAMES), \
+            ott_index="subott_dir/" + OTT_INDEX_FN, \
             subott_dir=directory("subott_dir")
     run:
-        subset_ott(CFG.ott_dir, output.subott_dir, CFG.root_ott_id, CFG)
+        with RuleResources(rule, CFG):
+            subset_ott(CFG.ott_dir, output.subott_dir, CFG.root_ott_id, CFG)
+            write_ott_index(output.subott_dir, output.ott_index, CFG=CFG)
 
 rule write_ott_root:
     """Serialize root_ott_id to "cleaned_ott/root_ott_id.txt", if changed."""
     input: "config"
     output: "cleaned_ott/root_ott_id.txt"
     run:
-        if not write_if_needed(fp=output[0], content=CFG.root_ott_id, CFG=CFG):
-            logger.info("root id has not changed.")
+        with RuleResources(rule, CFG):
+            if not write_if_needed(fp=output[0], content=CFG.root_ott_id, CFG=CFG):
+                logger.info("root id has not changed.")
 
 rule write_ott_cleaning_flags:
     """Serialize cleaning_flags to "cleaned_ott/cleaning_flags.txt", if changed."""
     input: "config"
     output: "cleaned_ott/cleaning_flags.txt"
     run:
-        if not write_if_needed(fp=output[0], content=CFG.cleaning_flags, CFG=CFG):
-            logger.info("cleaning_flags have not changed.")
+        with RuleResources(rule, CFG):
+            if not write_if_needed(fp=output[0], content=CFG.cleaning_flags, CFG=CFG):
+                logger.info("cleaning_flags have not changed.")
 
 rule write_ott_version:
     """Copy "$subott_dir/version.txt" to "cleaned_ott/ott_version.txt", if changed."""
     input: "subott_dir/version.txt"
     output: "cleaned_ott/ott_version.txt"
     run:
-        ott_version = open(input[0], "r").read().strip() + "\n"
-        if not write_if_needed(fp=output[0], content=ott_version, CFG=CFG):
-            logger.info("ott version has not changed.")
+        with RuleResources(rule, CFG):
+            ott_version = open(input[0], "r").read().strip() + "\n"
+            if not write_if_needed(fp=output[0], content=ott_version, CFG=CFG):
+                logger.info("ott version has not changed.")
 
 rule clean_ott_based_on_flags:
     """Writes a pruned version of OTT based on cleaning flags."""
@@ -58,12 +67,13 @@ rule clean_ott_based_on_flags:
             prune_log="cleaned_ott/cleaned_ott_pruned_nonflagged.json", \
             flagged="cleaned_ott/flagged_in_cleaned.json"
     run:
-        suppress_by_flag(ott_dir="subott_dir",
-                         flags=CFG.cleaning_flags,
-                         root=CFG.root_ott_id,
-                         out_nonredundanttree_fp=output.nonredundant_tree,
-                         out_with_deg2_tree_fp=output.with_deg_2_tree,
-                         log_fp=output.log,
-                         prune_log=output.prune_log,
-                         flagged_fp=output.flagged)
+        with RuleResources(rule, CFG):
+            suppress_by_flag(ott_dir="subott_dir",
+                             flags=CFG.cleaning_flags,
+                             root=CFG.root_ott_id,
+                             out_nonredundanttree_fp=output.nonredundant_tree,
+                             out_with_deg2_tree_fp=output.with_deg_2_tree,
+                             log_fp=output.log,
+                             prune_log=output.prune_log,
+                             flagged_fp=output.flagged)
 
@@ -1,6 +1,12 @@
 from propinquity import (clean_phylo_input,
+                         clean_phylo_input_for_tag,
                          force_or_touch_file,
-                         validate_config)
+                         gather_cleaned_phylo_stamps,
+                         OTT_INDEX_FN,
+                         read_blob_shas_by_tag,
+                         RuleResources,
+                         validate_config,
+                         write_if_needed)
 from snakemake.logging import logger
 import os
 
@@ -15,13 +21,14 @@ _st_pairs_fp = os.path.join(CFG.out_dir, "phylo_input", "study_tree_pairs.txt")
 def write_full_path_for_inputs(x, y, z):
     pass
 
-def set_tag_to_study_tree_pair(wildcards, snapshot=True):
+def set_tag_to_study_tree_pair(wildcards, snapshot=True, template=None):
     sp = os.path.join(CFG.out_dir, "phylo_input", "study_tree_pairs.txt")
     if os.path.exists(sp):
-        if snapshot:
-            template = "phylo_snapshot/tree_{tag}.json"
-        else:
-            template = "cleaned_phylo/tree_{tag}.tre"
+        if template is None:
+            if snapshot:
+                template = "phylo_snapshot/tree_{tag}.json"
+            else:
+                template = "cleaned_phylo/tree_{tag}.tre"
         paths = []
         with open(sp, "r") as inp:
             for line in inp:
@@ -36,24 +43,82 @@ def set_tag_to_study_tree_pair(wildcards, snapshot=True):
 def set_tag_to_cleaned_study_tree_pair(wildcards):
     return set_tag_to_study_tree_pair(wildcards, snapshot=False)
 
-rule clean_phylo_tre:
-    """Clean phylogenetic inputs from snapshot to cleaned_phylo"""
-    input: config="config", \
-           ott_pruned="cleaned_ott/cleaned_ott_pruned_nonflagged.json", \
-           stp="phylo_input/study_tree_pairs.txt"
-    output: signal="cleaned_phylo/phylo_inputs_cleaned.txt", \
-            nonempty_out_fp="exemplified_phylo/args.txt"
-    run:
-        od = os.path.join(CFG.out_dir, "cleaned_phylo")
-        trees = set_tag_to_study_tree_pair(None)
-        c = clean_phylo_input(ott_dir=directory("subott_dir"),
-                              study_tree_pairs=input.stp,
-                              tree_filepaths=trees,
-                              output_dir=od,
-                              cleaning_flags=CFG.cleaning_flags,
-                              pruned_from_ott_json_fp=input.ott_pruned,
-                              root_ott_id=CFG.root_ott_id,
-                              script_managed_dir=CFG.script_managed_trees_dir,
-                              nonempty_out_fp=output.nonempty_out_fp,
-                              CFG=CFG)
-        force_or_touch_file(output.signal, c)
+def set_tag_to_cleaned_stamp(wildcards):
+    return set_tag_to_study_tree_pair(wildcards, template="cleaned_phylo/per_tree/{tag}.txt")
+
+_sha_by_tag = {}
+
+def blob_sha_for_tag(wildcards):
+    """The study's git object SHA for the tag. A params value rather than an
+    input, so that a change to another study does not rerun this tree's job.
+    """
+    shas_fp = os.path.join(CFG.out_dir, "phylo_input", "blob_shas.txt")
+    if not _sha_by_tag and os.path.exists(shas_fp):
+        _sha_by_tag.update(read_blob_shas_by_tag(_st_pairs_fp, shas_fp))
+    return _sha_by_tag.get(wildcards.tag, "")
+
+if CFG.phylo_cleaning_mode == "per_tree":
+    rule clean_one_phylo_tre:
+        """Clean one phylogenetic input from snapshot to cleaned_phylo"""
+        input: config="config", \
+               ott_pruned="cleaned_ott/cleaned_ott_pruned_nonflagged.json", \
+               ott_index="subott_dir/" + OTT_INDEX_FN, \
+               nexson="phylo_snapshot/tree_{tag}.json"
+        output: stamp="cleaned_phylo/per_tree/{tag}.txt"
+        params: blob_sha=blob_sha_for_tag
+        wildcard_constraints: tag="[^/]+"
+        run:
+            with RuleResources(rule, CFG):
+                clean_phylo_input_for_tag(ott_dir="subott_dir",
+                                          nexson_fp=input.nexson,
+                                          output_dir=os.path.join(CFG.out_dir, "cleaned_phylo"),
+                                          cleaning_flags=CFG.cleaning_flags,
+                                          pruned_from_ott_json_fp=input.ott_pruned,
+                                          root_ott_id=CFG.root_ott_id,
+                                          script_managed_dir=CFG.script_managed_trees_dir,
+                                          stamp_fp=output.stamp,
+                                          blob_sha=params.blob_sha or None,
+                                          cache_dir=CFG.cache_dir,
+                                          CFG=CFG)
+
+    rule clean_phylo_tre:
+        """Gathers the per-tree cleaning results into the list of nonempty trees"""
+        input: set_tag_to_cleaned_stamp
+        output: signal="cleaned_phylo/phylo_inputs_cleaned.txt", \
+                nonempty_out_fp="exemplified_phylo/args.txt"
+        run:
+            with RuleResources(rule, CFG):
+                nonempty = gather_cleaned_phylo_stamps(input)
+                write_if_needed(fp=output.nonempty_out_fp,
+                                content='{}\n'.format('\n'.join(nonempty)),
+                                CFG=CFG)
+                force_or_touch_file(output.signal, True)
+else:
+    rule clean_phylo_tre:
+        """Clean phylogenetic inputs from snapshot to cleaned_phylo"""
+        input: config="config", \
+               ott_pruned="cleaned_ott/cleaned_ott_pruned_nonflagged.json", \
+               ott_index="subott_dir/" + OTT_INDEX_FN, \
+               stp="phylo_input/study_tree_pairs.txt", \
+               blob_shas="phylo_input/blob_shas.txt"
+        output: signal="cleaned_phylo/phylo_inputs_cleaned.txt", \
+                nonempty_out_fp="exemplified_phylo/args.txt"
+        threads: CFG.num_cleaning_workers
+        run:
+            with RuleResources(rule, CFG):
+                od = os.path.join(CFG.out_dir, "cleaned_phylo")
+                trees = set_tag_to_study_tree_pair(None)
+                c = clean_phylo_input(ott_dir=directory("subott_dir"),
+                                      study_tree_pairs=input.stp,
+                                      tree_filepaths=trees,
+                                      output_dir=od,
+                                      cleaning_flags=CFG.cleaning_flags,
+                                      pruned_from_ott_json_fp=input.ott_pruned,
+                                      root_ott_id=CFG.root_ott_id,
+                                      script_managed_dir=CFG.script_managed_trees_dir,
+                                      nonempty_out_fp=output.nonempty_out_fp,
+                                      num_workers=threads,
+                                      blob_shas_fp=input.blob_shas,
+                                      cache_dir=CFG.cache_dir,
+                                      CFG=CFG)
+                force_or_touch_file(output.signal, c)
@@ -2,7 +2,10 @@ from propinquity import (bump_or_link,
                          cp_or_suppress_by_flag, 
                          detect_extinct_taxa_to_bump,
                          OTT_FILENAMES,
-                         validate_config)
+                         OTT_INDEX_FN,
+                         RuleResources,
+                         validate_config,
+                         write_ott_index)
 from snakemake.logging import logger
 import os
 
@@ -21,11 +24,12 @@ rule create_extinct_bump_file:
            ott_flag_json = "cleaned_ott/flagged_in_cleaned.json"
     output: "cleaned_ott/move_extinct_higher_log.json"
     run:
-        detect_extinct_taxa_to_bump(ott_tree=input.ott_tree,
-                                    phylo_input_fp=input.phylo,
-                                    ott_flagged=input.ott_flag_json,
-                                    out=output[0],
-                                    CFG=CFG)
+        with RuleResources(rule, CFG):
+            detect_extinct_taxa_to_bump(ott_tree=input.ott_tree,
+                                        phylo_input_fp=input.phylo,
+                                        ott_flagged=input.ott_flag_json,
+                                        out=output[0],
+                                        CFG=CFG)
 
 rule create_cleaned_bump_taxonomy:
     input: config = "config", \
@@ -40,12 +44,15 @@ rule create_cleaned_bump_taxonomy:
             synonyms = "bumped_ott/synonyms.tsv", \
             forwards = "bumped_ott/forwards.tsv", \
             version = "bumped_ott/version.txt", \
-            ott_version = "bumped_ott/ott_version.txt"
+            ott_version = "bumped_ott/ott_version.txt", \
+            ott_index = "bumped_ott/" + OTT_INDEX_FN
     run:
-        bump_or_link(src_ott_dir="subott_dir",
-                     bump_json_fp=input.bump,
-                     out_dir=os.path.split(output.taxonomy)[0],
-                     CFG=CFG)
+        with RuleResources(rule, CFG):
+            bump_or_link(src_ott_dir="subott_dir",
+                         bump_json_fp=input.bump,
+                         out_dir=os.path.split(output.taxonomy)[0],
+                         CFG=CFG)
+            write_ott_index(os.path.split(output.taxonomy)[0], output.ott_index, CFG=CFG)
 
 rule clean_bumped_ott_based_on_flags:
     """Writes a pruned version of the bumped verstion OTT based on cleaning flags."""
@@ -65,24 +72,27 @@ rule clean_bumped_ott_based_on_flags:
             prune_log="bumped_ott/cleaned_ott_pruned_nonflagged.json", \
             flagged="bumped_ott/flagged_in_cleaned.json"
     run:
-        bump_ott_dir = os.path.split(output.flagged)[0]
-        cp_or_suppress_by_flag(ott_dir=bump_ott_dir,
-                               flags=CFG.cleaning_flags,
-                               root=CFG.root_ott_id,
-                               bump_json_fp=input.bump,
-                               in_nonredundanttree_fp=input.nonredundant_tree,
-                               in_with_deg2_tree_fp=input.with_deg_2_tree,
-                               in_log_fp=input.log,
-                               in_prune_log=input.prune_log,
-                               in_flagged_fp=input.flagged,
-                               out_nonredundanttree_fp=output.nonredundant_tree,
-                               out_with_deg2_tree_fp=output.with_deg_2_tree,
-                               out_log_fp=output.log,
-                               out_prune_log=output.prune_log,
-                               out_flagged_fp=output.flagged,
-                               CFG=CFG)
+        with RuleResources(rule, CFG):
+            bump_ott_dir = os.path.split(output.flagged)[0]
+            cp_or_suppress_by_flag(ott_dir=bump_ott_dir,
+                                   flags=CFG.cleaning_flags,
+                                   root=CFG.root_ott_id,
+                                   bump_json_fp=input.bump,
+                                   in_nonredundanttree_fp=input.nonredundant_tree,
+                                   in_with_deg2_tree_fp=input.with_deg_2_tree,
+                                   in_log_fp=input.log,
+                                   in_prune_log=input.prune_log,
+                                   in_flagged_fp=input.flagged,
+                                   out_nonredundanttree_fp=output.nonredundant_tree,
+                                   out_with_deg2_tree_fp=output.with_deg_2_tree,
+                                   out_log_fp=output.log,
+                                   out_prune_log=output.prune_log,
+                                   out_flagged_fp=output.flagged,
+                                   CFG=CFG)
 
 rule link_bumped_clean_ott_tree:
     input: "bumped_ott/cleaned_not_updated_ott.tre"
     output: "bumped_ott/cleaned_ott.tre"
-    run: os.symlink(os.path.split(input[0])[1], output[0])
+    run:
+        with RuleResources(rule, CFG):
+            os.symlink(os.path.split(input[0])[1], output[0])
@@ -1,4 +1,4 @@
-from propinquity import (exemplify_taxa, validate_config, write_inc_sed_ids)
+from propinquity import (exemplify_taxa, RuleResources, validate_config, write_inc_sed_ids)
 from snakemake.logging import logger
 import os
 
@@ -17,11 +17,12 @@ rule exemplify:
             exlog = "exemplified_phylo/exemplified_log.json",
             taxonomy = "exemplified_phylo/taxonomy.tre"
     run:
-        exemplify_taxa(in_tax_tree_fp=input.taxo,
-                       in_phylo_fp=input.phylo_fp,
-                       out_nonempty_tree_fp=output.nonempty,
-                       out_log_fp=output.exlog,
-                       CFG=CFG)
+        with RuleResources(rule, CFG):
+            exemplify_taxa(in_tax_tree_fp=input.taxo,
+                           in_phylo_fp=input.phylo_fp,
+                           out_nonempty_tree_fp=output.nonempty,
+                           out_log_fp=output.exlog,
+                           CFG=CFG)
 
 rule write_inc_sed:
     input: config = "config", \
@@ -34,10 +35,11 @@ rule write_inc_sed:
            ott_version = "bumped_ott/ott_version.txt"
     output: "exemplified_phylo/incertae_sedis.txt"
     run:
-        mod_ott_dir = os.path.split(input.taxonomy)[0]
-        write_inc_sed_ids(tax_tree=input.tax_tree,
-                          ott_dir=mod_ott_dir,
-                          config_fp=input.config,
-                          out_inc_sed_id_fp=output[0],
-                          CFG=CFG)
+        with RuleResources(rule, CFG):
+            mod_ott_dir = os.path.split(input.taxonomy)[0]
+            write_inc_sed_ids(tax_tree=input.tax_tree,
+                              ott_dir=mod_ott_dir,
+                              config_fp=input.config,
+                              out_inc_sed_id_fp=output[0],
+                              CFG=CFG)
 
@@ -1,11 +1,16 @@
-from propinquity import (run_unhide_if_worked, 
+from propinquity import (estimate_solve_mem_mb,
+                         long_running_subproblem_ids,
+                         run_unhide_if_worked, 
                          solve_subproblem,
+                         solve_subproblem_batch,
                          suppress_non_listed_ids_or_unnamed,
                          stripped_nonempty_lines,
+                         RuleResources,
                          validate_config,
                          write_if_needed)
 from snakemake.logging import logger
 import os
+import re
 
 CFG = validate_config(config, logger)
 
@@ -18,16 +23,17 @@ rule expand_path_to_nonempty_phylo:
            phylo_list_fp = "exemplified_phylo/nonempty_trees.txt"
     output: "subproblems/scratch/args.txt"
     run:
-        ph_li_fp = input.phylo_list_fp
-        fn = [i.strip() for i in open(ph_li_fp, "r") if i.strip()]
-        ap = os.path.abspath(os.path.split(ph_li_fp)[0])
-        fp = [os.path.join(ap, i) for i in fn]
-        fp.append('') # for the newline at the end of the file
-        fpc = '\n'.join(fp)
-        write_if_needed(fp=output[0],
-                        content=fpc,
-                        name="nonempty tree fullpaths",
-                        CFG=CFG)
+        with RuleResources(rule, CFG):
+            ph_li_fp = input.phylo_list_fp
+            fn = [i.strip() for i in open(ph_li_fp, "r") if i.strip()]
+            ap = os.path.abspath(os.path.split(ph_li_fp)[0])
+            fp = [os.path.join(ap, i) for i in fn]
+            fp.append('') # for the newline at the end of the file
+            fpc = '\n'.join(fp)
+            write_if_needed(fp=output[0],
+                            content=fpc,
+                            name="nonempty tree fullpaths",
+                            CFG=CFG)
 
 include: "common.smk"
 
@@ -39,21 +45,22 @@ rule create_subproblem_scaffold:
             tmp = temp("subproblem_solutions/poly_prob.tre"),
             sans_suff = "subproblem_solutions/ids_without_dot_tre.txt"
     run:
-        prob_ids = []
-        with open(input.sub, "r") as inp:
-            for line in inp:
-                ls = line.strip()
-                if ls:
-                    if not ls.endswith('.tre'):
-                        m = "Expecting every line in {} to end in .tre, but found {}"
-                        raise RuntimeError(m.format(input.sub, ls))
-                    prob_ids.append(ls[:-4])
-        with open(output.tmp, "w", encoding='utf-8') as o:
-            o.write('({});\n'.format(', '.join(prob_ids)))
-        content = '{}\n'.format('\n'.join(prob_ids))
-        write_if_needed(fp=output.sans_suff, content=content, CFG=CFG)
-        inv = ['otc-induced-subtree', input.tax, output.tmp]
-        run_unhide_if_worked(inv, CFG=CFG, stdout_capture=output.scaff)
+        with RuleResources(rule, CFG):
+            prob_ids = []
+            with open(input.sub, "r") as inp:
+                for line in inp:
+                    ls = line.strip()
+                    if ls:
+                        if not ls.endswith('.tre'):
+                            m = "Expecting every line in {} to end in .tre, but found {}"
+                            raise RuntimeError(m.format(input.sub, ls))
+                        prob_ids.append(ls[:-4])
+            with open(output.tmp, "w", encoding='utf-8') as o:
+                o.write('({});\n'.format(', '.join(prob_ids)))
+            content = '{}\n'.format('\n'.join(prob_ids))
+            write_if_needed(fp=output.sans_suff, content=content, CFG=CFG)
+            inv = ['otc-induced-subtree', input.tax, output.tmp]
+            run_unhide_if_worked(inv, CFG=CFG, stdout_capture=output.scaff)
 
 rule simplify_scaffold:
     input: config = "config", \
@@ -61,10 +68,50 @@ rule simplify_scaffold:
            id_list = "subproblem_solutions/ids_without_dot_tre.txt"
     output: scaff = "subproblem_solutions/subproblems-scaffold-only.tre"
     run:
-        suppress_non_listed_ids_or_unnamed(in_tree_fp=input.tree,
-                                           id_fp=input.id_list,
-                                           out_tree_fp=output.scaff,
-                                           CFG=CFG)
+        with RuleResources(rule, CFG):
+            suppress_non_listed_ids_or_unnamed(in_tree_fp=input.tree,
+                                               id_fp=input.id_list,
+                                               out_tree_fp=output.scaff,
+                                               CFG=CFG)
+
+def _solve(input, output):
+    solve_subproblem(incert_sed_fp=input.incert,
+                     subprob_fp=input.subprob,
+                     out_fp=output.soln,
+                     in_deg_dist_fp=output.in_deg_dist,
+                     out_deg_dist_fp=output.out_deg_dist,
+                     run_time_fp=output.run_time,
+                     record_runtime=True,
+                     cache_dir=CFG.cache_dir,
+                     CFG=CFG)
+
+def _solve_mem_mb(wildcards, input):
+    return estimate_solve_mem_mb(input.subprob, CFG)
+
+# Snakemake priorities are per rule, so the subproblems that were slow last
+#   time (or are big) are matched by solve_long, which has a higher priority.
+#   Within a priority, snakemake already favors jobs with larger inputs.
+_LONG_SOLVE_IDS = long_running_subproblem_ids(CFG)
+if _LONG_SOLVE_IDS:
+    ruleorder: solve_long > solve
+
+    rule solve_long:
+        """solve for the subproblems expected to take longest, so that they start first"""
+        input: config = "config", \
+               otcconfig = "otc-config", \
+               subprob_id = "subproblems/dumped_subproblem_ids.txt", \
+               incert = "exemplified_phylo/incertae_sedis.txt", \
+               subprob = "subproblems/{ottid}.tre"
+        output: soln = "subproblem_solutions/{ottid}.tre", \
+                out_deg_dist = "subproblem_solutions/deg-dist-{ottid}.txt", \
+                in_deg_dist = "subproblems/deg-dist/deg-dist-{ottid}.txt", \
+                run_time = "subproblems/deg-dist/runtime-{ottid}.txt"
+        wildcard_constraints: ottid="|".join([re.escape(i) for i in _LONG_SOLVE_IDS])
+        priority: 10
+        resources: mem_mb=_solve_mem_mb
+        run:
+            with RuleResources(rule, CFG):
+                _solve(input, output)
 
 rule solve:
     input: config = "config", \
@@ -76,14 +123,38 @@ rule solve:
             out_deg_dist = "subproblem_solutions/deg-dist-{ottid}.txt", \
             in_deg_dist = "subproblems/deg-dist/deg-dist-{ottid}.txt", \
             run_time = "subproblems/deg-dist/runtime-{ottid}.txt"
+    resources: mem_mb=_solve_mem_mb
+    run:
+        with RuleResources(rule, CFG):
+            _solve(input, output)
+
+def _solve_batch_subprobs(wildcards):
+    return ["subproblems/{}.tre".format(i) for i in solve_batches(wildcards)[wildcards.batch]]
+
+def _solve_batch_mem_mb(wildcards, input):
+    # the subproblems are solved one at a time
+    return max([estimate_solve_mem_mb(i, CFG) for i in input.subprobs] or [0])
+
+# The solutions, degree distributions and runtimes of the batched subproblems
+#   are side effects of solve_batch (the IDs are not known until the decompose
+#   checkpoint has run); only the list of the IDs solved is an output.
+rule solve_batch:
+    """solve a batch of small subproblems in one job (see solve_batch_max_bytes)"""
+    input: config = "config", \
+           otcconfig = "otc-config", \
+           subprob_id = "subproblems/dumped_subproblem_ids.txt", \
+           incert = "exemplified_phylo/incertae_sedis.txt", \
+           subprobs = _solve_batch_subprobs
+    output: "subproblem_solutions/batches/{batch}.txt"
+    wildcard_constraints: batch="batch[0-9]+"
+    resources: mem_mb=_solve_batch_mem_mb
     run:
-        solve_subproblem(incert_sed_fp=input.incert,
-                         subprob_fp=input.subprob,
-                         out_fp=output.soln,
-                         in_deg_dist_fp=output.in_deg_dist,
-                         out_deg_dist_fp=output.out_deg_dist,
-                         run_time_fp=output.run_time,
-                         CFG=CFG)
+        with RuleResources(rule, CFG):
+            solve_subproblem_batch(incert_sed_fp=input.incert,
+                                   subprob_fps=input.subprobs,
+                                   out_dir=CFG.out_dir,
+                                   out_ids_fp=output[0],
+                                   CFG=CFG)
 
 
 rule solve_rev:
@@ -95,10 +166,13 @@ rule solve_rev:
     output: soln = "reversed_subproblem_solutions/{ottid}.tre", \
             deg_dist = "reversed_subproblem_solutions/deg-dist-{ottid}.txt", \
             run_time = "reversed_subproblem_solutions/deg-dist/runtime-{ottid}.txt"
+    priority: CFG.reversed_solve_priority
     run:
-        solve_subproblem(incert_sed_fp=input.incert,
-                         subprob_fp=input.subprob,
-                         out_fp=output.soln,
-                         out_deg_dist_fp=output.deg_dist,
-                         run_time_fp=output.run_time,
-                         CFG=CFG)
\ No newline at end of file
+        with RuleResources(rule, CFG):
+            solve_subproblem(incert_sed_fp=input.incert,
+                             subprob_fp=input.subprob,
+                             out_fp=output.soln,
+                             out_deg_dist_fp=output.deg_dist,
+                             run_time_fp=output.run_time,
+                             cache_dir=CFG.cache_dir,
+                             CFG=CFG)
\ No newline at end of file
@@ -1,5 +1,7 @@
-from propinquity import (validate_config,
-                         write_if_needed)
+from propinquity import (RuleResources,
+                         validate_config,
+                         write_if_needed,
+                         WriteIfNeeded)
 from snakemake.logging import logger
 import os
 
@@ -15,32 +17,39 @@ rule force_all_subr_dd:
     input: aggregate_probdd
     output: "subproblems/.all_deg_dist_calculated.txt"
     run:
-        c = "{}\n".format('\n'.join([str(i) for i in input]))
-        write_if_needed(fp=output[0], content=c, CFG=CFG)
+        with RuleResources(rule, CFG):
+            c = "{}\n".format('\n'.join([str(i) for i in input]))
+            write_if_needed(fp=output[0], content=c, CFG=CFG)
 
 def concatenate_deg_dist(filepaths, out_fp):
     filepaths = list(filepaths)
     filepaths.sort()
-    lines = []
     ott_id_from_fp = re.compile(r".*deg-dist-ott([-0-9A-Za-z]+)\.txt")
-    for fp in filepaths:
-        with open(fp, "r") as inp:
-            m = ott_id_from_fp.match(fp)
-            if not m:
-                continue
-            ott_id = m.group(1)
-            lines.append("ott{}.tre".format(ott_id))
-            lines.extend([i[:-1] for i in inp.readlines() if i])
-    content = '\n'.join(lines)
-    write_if_needed(fp=out_fp, content=content, CFG=CFG)
+    sep = ''
+    with WriteIfNeeded(out_fp, CFG=CFG) as outp:
+        for fp in filepaths:
+            with open(fp, "r") as inp:
+                m = ott_id_from_fp.match(fp)
+                if not m:
+                    continue
+                ott_id = m.group(1)
+                outp.write("{}ott{}.tre".format(sep, ott_id))
+                sep = '\n'
+                for line in inp:
+                    outp.write(sep + line[:-1])
 
 rule concat_soln_deg_dist:
     input: aggregate_sdd
     output: "subproblem_solutions/solution-degree-distributions.txt"
-    run: concatenate_deg_dist(input, output[0])
+    run:
+        with RuleResources(rule, CFG):
+            concatenate_deg_dist(input, output[0])
 
 
 rule concat_rev_soln_deg_dist:
-    input: aggregate_rsdd
+    input: config = "config", \
+           dd = aggregate_rsdd
     output: "reversed_subproblem_solutions/solution-degree-distributions.txt"
-    run: concatenate_deg_dist(input, output[0])
+    run:
+        with RuleResources(rule, CFG):
+            concatenate_deg_dist(input.dd, output[0])